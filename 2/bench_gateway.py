@@ -0,0 +1,120 @@
+# bench_gateway.py — serial gateway throughput benchmark
+#
+# Starts --ports pty fake sensors (fake_serial_devices.py) writing --rate
+# lines/sec each, runs serial_gateway.Gateway against them with the
+# in-process broker stand-in, and reports lines offered/parsed/delivered per
+# second, lines lost at the device (pty buffer full), and the latency from
+# a line's arrival to its message being acknowledged.
+#
+# --legacy runs the old bridge loop instead (blocking readline on the first
+# port, then time.sleep(1)) for comparison.
+#
+#   python bench_gateway.py --ports 16 --rate 100 --tanks 4 --duration 10
+#   python bench_gateway.py --ports 1 --rate 100 --legacy
+
+import argparse
+import asyncio
+import json
+import tempfile
+import threading
+import time
+
+from bridge_fakes import FakeMqttClient
+from fake_serial_devices import DeviceFarm
+from serial_gateway import Gateway, parse_line, parse_port
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Benchmark the asyncio serial gateway with pty devices")
+    p.add_argument("--ports", type=int, default=8)
+    p.add_argument("--rate", type=float, default=50.0, help="lines/sec per port")
+    p.add_argument("--tanks", type=int, default=2)
+    p.add_argument("--duration", type=float, default=10.0)
+    p.add_argument("--batch", type=int, default=500, help="samples per MQTT message")
+    p.add_argument("--msgs-per-sec", type=float, default=50.0, help="per-tank publish rate limit")
+    p.add_argument("--checksum", action="store_true", help="NMEA-style $...*hh framing")
+    p.add_argument("--legacy", action="store_true", help="old blocking readline + sleep(1) loop")
+    return p.parse_args()
+
+
+def percentile(sorted_vals, q):
+    if not sorted_vals:
+        return None
+    return sorted_vals[min(len(sorted_vals) - 1, int(round(q / 100.0 * (len(sorted_vals) - 1))))]
+
+
+def run_legacy(farm, duration):
+    # what 2/sensor_simulate.py did before the spool: one port, readline, sleep(1)
+    read = 0
+    with open(farm.devices[0].path, "rb", buffering=0) as ser:
+        t_end = time.monotonic() + duration
+        buf = b""
+        while time.monotonic() < t_end:
+            while b"\n" not in buf:
+                buf += ser.read(64)
+            line, buf = buf.split(b"\n", 1)
+            if parse_line(line):
+                read += 1
+            time.sleep(1)
+    return read
+
+
+def run_gateway(args, farm):
+    client = FakeMqttClient(ack_delay=0.01)
+    gateway = Gateway([parse_port(spec) for spec in farm.port_args(args.tanks)],
+                      client, spool_dir=tempfile.mkdtemp(prefix="bench_gw_"), flush_sec=0.2,
+                      batch=args.batch, rate=args.msgs_per_sec)
+    client.loop_start()
+    loop = asyncio.new_event_loop()
+    def end():
+        farm.stop()
+        loop.call_soon_threadsafe(gateway.stop)
+    threading.Timer(args.duration, end).start()
+    loop.run_until_complete(gateway.run(stats_sec=0))
+    loop.close()
+    # let the forwarders drain what was read
+    t_end = time.monotonic() + 10
+    while time.monotonic() < t_end and any(len(b.spool) for b in gateway.tanks.values()):
+        time.sleep(0.05)
+    stats = gateway.stats()
+    gateway.close()
+    latencies, delivered = [], 0
+    for payload, acked_at in zip(list(client.delivered), list(client.delivered_at)):
+        for r in json.loads(payload)["readings"]:
+            delivered += len(r["samples"])
+            latencies.extend(acked_at - s[0] for s in r["samples"])
+    latencies.sort()
+    return stats, delivered, len(client.delivered), latencies
+
+
+def main():
+    args = parse_args()
+    farm = DeviceFarm(args.ports, args.rate, args.checksum)
+    print(f"Benchmark: {args.ports} pty ports x {args.rate:.0f} lines/s ({args.ports * args.rate:.0f} offered/s), "
+          f"{args.tanks} tanks, {args.duration:.0f}s{' [legacy loop]' if args.legacy else ''}")
+    t0 = time.monotonic()
+    farm.start()
+    if args.legacy:
+        read = run_legacy(farm, args.duration)
+        farm.stop()
+        elapsed = time.monotonic() - t0
+        written = sum(d.written for d in farm.devices)
+        print(f"read             : {read} lines ({read / elapsed:.1f}/s) of {written} written")
+        print(f"lost at device   : {sum(d.dropped for d in farm.devices)} (pty buffer full)")
+        farm.close()
+        return
+    stats, delivered, messages, lat = run_gateway(args, farm)
+    elapsed = args.duration
+    written = sum(d.written for d in farm.devices)
+    ms = lambda v: "n/a" if v is None else f"{v * 1000:.0f}"
+    print(f"written          : {written} lines ({written / elapsed:.0f}/s)")
+    print(f"parsed           : {stats['lines']} lines ({stats['lines'] / elapsed:.0f}/s), {stats['bad_lines']} bad")
+    print(f"delivered        : {delivered} samples in {messages} messages "
+          f"(avg {delivered / max(messages, 1):.0f} samples/msg)")
+    print(f"lost at device   : {sum(d.dropped for d in farm.devices)} (pty buffer full)")
+    print(f"latency ms       : p50={ms(percentile(lat, 50))} p95={ms(percentile(lat, 95))} p99={ms(percentile(lat, 99))}")
+    farm.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# bridge_fakes.py
+#
+# Stand-ins for running sensor_simulate.py without hardware or a broker:
+#
+#   FakeSerial      - a serial port yielding "O2 CO LEL H2S" lines from a
+#                     random walk, at rate_hz
+#   FakeMqttClient  - the slice of paho's Client the bridge uses; PUBACKs
+#                     arrive after ack_delay, and set_online(False) simulates
+#                     a link outage (in-flight messages are lost, not acked)
+#
+#   python sensor_simulate.py --fake-serial --fake-broker --outage-every 20 --outage-for 10
+
+import random
+import threading
+import time
+import types
+
+
+class FakeSerial:
+    def __init__(self, rate_hz=1.0):
+        self.interval = 1.0 / rate_hz
+        self.o2, self.co, self.lel, self.h2s = 20.9, 8.0, 2.0, 2.0
+
+    def readline(self):
+        time.sleep(self.interval)
+        return self.line()
+
+    def line(self):
+        """The next reading as a serial line, without waiting."""
+        self.o2 = min(21.0, max(14.0, self.o2 + (random.random() - 0.5) * 0.2))
+        self.co = min(200.0, max(0.0, self.co + (random.random() - 0.5) * 4.0))
+        self.lel = min(100.0, max(0.0, self.lel + (random.random() - 0.5) * 0.7))
+        self.h2s = min(100.0, max(0.0, self.h2s + (random.random() - 0.5) * 0.7))
+        return f"{self.o2:.2f} {self.co:.2f} {self.lel:.2f} {self.h2s:.2f}\n".encode()
+
+    def close(self):
+        pass
+
+
+class FakeMqttClient:
+    def __init__(self, ack_delay=0.05):
+        self.ack_delay = ack_delay
+        self.on_connect = self.on_disconnect = self.on_publish = None
+        self.online = False
+        self.delivered = []        # payloads the "broker" acknowledged
+        self.delivered_at = []     # time.time() of each
+        self._mid = 0
+        self._lock = threading.Lock()
+        self._epoch = 0            # bumped per outage: acks from before it are lost
+
+    def connect_async(self, host, port=1883, keepalive=60):
+        pass
+
+    def loop_start(self):
+        self.set_online(True)
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        self.set_online(False)
+
+    def set_online(self, online):
+        with self._lock:
+            if online == self.online:
+                return
+            self.online = online
+            self._epoch += 1
+        if online and self.on_connect:
+            self.on_connect(self, None, {}, 0)
+        elif not online and self.on_disconnect:
+            self.on_disconnect(self, None, 1)
+
+    def publish(self, topic, payload, qos=0):
+        with self._lock:
+            self._mid += 1
+            mid, epoch, online = self._mid, self._epoch, self.online
+        if online:
+            threading.Timer(self.ack_delay, self._ack, (mid, epoch, payload)).start()
+        return types.SimpleNamespace(rc=0 if online else 4, mid=mid)
+
+    def _ack(self, mid, epoch, payload):
+        with self._lock:
+            if epoch != self._epoch:
+                return
+            self.delivered.append(payload)
+            self.delivered_at.append(time.time())
+        if self.on_publish:
+            self.on_publish(self, None, mid)
+
+    def outages(self, every, duration):
+        """Take the link down for `duration` seconds every `every` seconds (daemon thread)."""
+        def run():
+            while True:
+                time.sleep(every)
+                print(">>> SIMULATING LINK OUTAGE")
+                self.set_online(False)
+                time.sleep(duration)
+                print(">>> LINK RESTORED")
+                self.set_online(True)
+        threading.Thread(target=run, name="fake-outages", daemon=True).start()
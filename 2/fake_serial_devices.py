@@ -0,0 +1,112 @@
+# fake_serial_devices.py
+#
+# Pseudo-terminal sensors for running and benchmarking serial_gateway.py on a
+# plain Linux box: each device is a pty whose slave end looks like a serial
+# port (/dev/pts/N) and whose master end gets FakeSerial lines at rate_hz.
+# Writes are non-blocking; a line the pty buffer has no room for (the reader
+# fell behind) is counted as dropped, like an overrun UART.
+#
+#   python fake_serial_devices.py --ports 8 --rate 50 --tanks 2
+#   python serial_gateway.py --fake-broker <the --port arguments it prints>
+
+import argparse
+import os
+import threading
+import time
+import tty
+
+from bridge_fakes import FakeSerial
+
+
+class FakeDevice:
+    def __init__(self, checksum=False):
+        self.master, self._slave = os.openpty()
+        tty.setraw(self._slave)               # no echo or newline translation
+        os.set_blocking(self.master, False)
+        self.path = os.ttyname(self._slave)   # kept open so the pty survives reader reconnects
+        self.checksum = checksum
+        self.source = FakeSerial()
+        self.written = 0
+        self.dropped = 0
+
+    def write_line(self):
+        line = self.source.line()
+        if self.checksum:
+            body = line.strip()
+            cs = 0
+            for ch in body:
+                cs ^= ch
+            line = b"$" + body + b"*%02X\n" % cs
+        try:
+            n = os.write(self.master, line)
+        except BlockingIOError:
+            self.dropped += 1
+            return
+        if n < len(line):                      # partial write: the reader sees a corrupt line
+            self.dropped += 1
+        else:
+            self.written += 1
+
+    def close(self):
+        os.close(self.master)
+        os.close(self._slave)
+
+
+class DeviceFarm:
+    """count devices, each writing rate_hz lines/sec, driven by one thread."""
+
+    def __init__(self, count, rate_hz, checksum=False):
+        self.devices = [FakeDevice(checksum) for _ in range(count)]
+        self.rate_hz = rate_hz
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="fake-serial", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        # one tick per 1/rate_hz: every device writes one line, ticks catch up if late
+        tick = 1.0 / self.rate_hz
+        next_at = time.monotonic()
+        while not self._stop.is_set():
+            for d in self.devices:
+                d.write_line()
+            next_at += tick
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                self._stop.wait(delay)
+
+    def port_args(self, tanks=1):
+        """--port specs for serial_gateway.py, devices spread round-robin over tanks 1..tanks."""
+        return [f"{d.path}:{i % tanks + 1}:FAKE-{i:03d}" for i, d in enumerate(self.devices)]
+
+    def close(self):
+        for d in self.devices:
+            d.close()
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Pty-backed fake serial sensors")
+    p.add_argument("--ports", type=int, default=4)
+    p.add_argument("--rate", type=float, default=1.0, help="lines/sec per device")
+    p.add_argument("--tanks", type=int, default=1, help="spread devices over this many tanks")
+    p.add_argument("--checksum", action="store_true", help="NMEA-style $...*hh framing")
+    args = p.parse_args()
+
+    farm = DeviceFarm(args.ports, args.rate, args.checksum)
+    print(" ".join(f"--port {spec}" for spec in farm.port_args(args.tanks)), flush=True)
+    farm.start()
+    try:
+        while True:
+            time.sleep(10)
+            print(f"written={sum(d.written for d in farm.devices)} dropped={sum(d.dropped for d in farm.devices)}",
+                  flush=True)
+    except KeyboardInterrupt:
+        farm.stop()
+        farm.close()
@@ -1,16 +1,22 @@
 # sensor_simulator.py
 
 import paho.mqtt.client as mqtt
-import serial
+import argparse
 import json
 import time
 
+from spool import Spool, Forwarder
+
 # === MQTT Configuration ===
 MQTT_BROKER = "localhost"
 MQTT_PORT = 1883
 SHIP_ID = "MTGREATMANTA"
 TOPIC = f"ship/{SHIP_ID}/sensors"
 
+# === Sensor identity (the backend files readings under ship/tank/sensor) ===
+TANK_ID = 1
+SENSOR_ID = "SN-G-001"
+
 # === Serial Configuration ===
 SERIAL_PORT = "/dev/ttyUSB0"  # Change this to your actual port (e.g., COM3 on Windows)
 BAUD_RATE = 9600              # Match your sensor’s baud rate
@@ -19,13 +25,17 @@ BAUD_RATE = 9600              # Match your sensor’s baud rate
 client = mqtt.Client()
 
 def connect_mqtt():
-    """Connect to the MQTT broker."""
-    client.connect(MQTT_BROKER, MQTT_PORT, 60)
+    """Connect to the MQTT broker; paho keeps reconnecting in the background after an outage."""
+    client.on_connect = forwarder.on_connect
+    client.on_disconnect = forwarder.on_disconnect
+    client.on_publish = forwarder.on_publish
+    client.connect_async(MQTT_BROKER, MQTT_PORT, 60)
     client.loop_start()
-    print(f"Connected to MQTT broker at {MQTT_BROKER}:{MQTT_PORT}")
+    print(f"Connecting to MQTT broker at {MQTT_BROKER}:{MQTT_PORT}")
 
 def read_serial_data():
     """Read and parse sensor data from the serial port."""
+    import serial
     try:
         ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1)
         print(f"Reading from serial port {SERIAL_PORT} at {BAUD_RATE} baud.")
@@ -34,42 +44,62 @@ def read_serial_data():
         print(f"Error opening serial port: {e}")
         exit(1)
 
-def publish_sensor_data(ser):
-    """Continuously read from serial and publish to MQTT."""
+def make_payload(rows):
+    """Spooled samples -> one message in the backend's multi-sample format."""
+    return json.dumps({
+        "tank_id": TANK_ID,
+        "readings": [{"sensor_id": SENSOR_ID,
+                      "samples": [[ts, o2, co, lel, h2s] for _, ts, o2, co, lel, h2s, _ in rows]}],
+    })
+
+def spool_sensor_data(ser):
+    """Continuously read from serial into the spool; the forwarder publishes it."""
+    last_report = time.time()
     while True:
         line = ser.readline().decode('utf-8').strip()
         if not line:
             continue
 
         try:
-            values = [int(v) for v in line.split()]
+            values = [float(v) for v in line.split()]
             if len(values) < 3:
                 print(f"Ignoring invalid line: {line}")
                 continue
 
-            o2, co, lel = values[:3]  # Take first 3 readings
+            o2, co, lel = values[:3]  # Take first 3 readings (H2S if the sensor sends a 4th)
+            h2s = values[3] if len(values) > 3 else None
 
-            # Create a JSON payload
-            reading = {
-                "O2": o2,
-                "CO": co,
-                "LEL": lel
-            }
-
-            payload = json.dumps(reading)
-            result = client.publish(TOPIC, payload)
-
-            if result[0] == 0:
-                print(f"✅ Sent `{payload}` to topic `{TOPIC}`")
-            else:
-                print(f"⚠️ Failed to send message to topic {TOPIC}")
+            # stamped at read time: the backend files it there however late it is sent
+            spool.append(time.time(), o2, co, lel, h2s)
+            forwarder.wake()
 
         except ValueError:
             print(f"Invalid data format: {line}")
 
-        time.sleep(1)  # Adjust delay to match sensor rate
+        if time.time() - last_report >= 10:
+            print(f"Spool: {forwarder.stats()}")
+            last_report = time.time()
 
 if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Serial -> MQTT bridge with a local store-and-forward spool")
+    p.add_argument("--fake-serial", action="store_true", help="random-walk readings instead of SERIAL_PORT")
+    p.add_argument("--fake-broker", action="store_true", help="in-process broker stand-in instead of MQTT_BROKER")
+    p.add_argument("--outage-every", type=float, default=0, help="fake broker: seconds between link outages")
+    p.add_argument("--outage-for", type=float, default=10, help="fake broker: outage length in seconds")
+    args = p.parse_args()
+
+    if args.fake_broker:
+        from bridge_fakes import FakeMqttClient
+        client = FakeMqttClient()
+        if args.outage_every:
+            client.outages(args.outage_every, args.outage_for)
+    spool = Spool()
+    forwarder = Forwarder(spool, client, TOPIC, make_payload)
+    forwarder.start()
     connect_mqtt()
-    ser = read_serial_data()
-    publish_sensor_data(ser)
+    if args.fake_serial:
+        from bridge_fakes import FakeSerial
+        ser = FakeSerial()
+    else:
+        ser = read_serial_data()
+    spool_sensor_data(ser)
@@ -0,0 +1,261 @@
+# serial_gateway.py
+#
+# Asyncio serial -> MQTT gateway: one process reads any number of sensor
+# ports concurrently and sends everything over a single MQTT connection.
+#
+#   ports    each --port DEVICE:TANK_ID:SENSOR_ID[:BAUD] is opened raw and
+#            non-blocking and watched with loop.add_reader, so a read never
+#            blocks the other ports and nothing waits on a fixed sleep
+#   framing  newline-terminated lines "O2 CO LEL [H2S]", optionally NMEA
+#            style "$O2 CO LEL H2S*hh" with an XOR checksum; partial lines
+#            are kept until the rest arrives, overlong or bad lines counted
+#   batching samples are stamped on arrival and coalesced per tank; every
+#            GATEWAY_FLUSH_SEC each tank's new samples go to its spool
+#            (spool.py) in one transaction, and that tank's Forwarder
+#            publishes them as multi-sensor, multi-sample messages
+#
+# A port that disappears (USB unplugged) is reopened every GATEWAY_REOPEN_SEC.
+# Linux/macOS only (termios, add_reader).
+#
+#   python serial_gateway.py --port /dev/ttyUSB0:1:SN-G-001 --port /dev/ttyUSB1:1:CO-L-23B:19200
+#   python fake_serial_devices.py --ports 4     # prints --port arguments for pty devices
+
+import argparse
+import asyncio
+import json
+import os
+import termios
+import time
+import tty
+
+from spool import Spool, Forwarder
+
+# === MQTT Configuration ===
+MQTT_BROKER = "localhost"
+MQTT_PORT = 1883
+SHIP_ID = "MTGREATMANTA"
+TOPIC = f"ship/{SHIP_ID}/sensors"
+
+GATEWAY_SPOOL_DIR = os.getenv("GATEWAY_SPOOL_DIR", "./gateway_spool")   # one spool file per tank
+GATEWAY_FLUSH_SEC = float(os.getenv("GATEWAY_FLUSH_SEC", "0.5"))
+GATEWAY_REOPEN_SEC = float(os.getenv("GATEWAY_REOPEN_SEC", "5"))
+GATEWAY_STATS_SEC = float(os.getenv("GATEWAY_STATS_SEC", "10"))
+MAX_LINE = 256
+
+BAUD_RATES = {b: getattr(termios, f"B{b}") for b in (1200, 2400, 4800, 9600, 19200, 38400, 57600, 115200, 230400)
+              if hasattr(termios, f"B{b}")}
+
+
+def parse_line(line):
+    """b"O2 CO LEL [H2S]" (or b"$...*hh") -> (O2, CO, LEL, H2S | None); None when malformed."""
+    text = line.decode("ascii", "replace").strip()
+    if text.startswith("$"):
+        body, _, checksum = text[1:].partition("*")
+        expected = 0
+        for ch in body.encode():
+            expected ^= ch
+        try:
+            if int(checksum, 16) != expected:
+                return None
+        except ValueError:
+            return None
+        text = body
+    try:
+        values = [float(v) for v in text.replace(",", " ").split()]
+    except ValueError:
+        return None
+    if len(values) < 3:
+        return None
+    return values[0], values[1], values[2], values[3] if len(values) > 3 else None
+
+
+def parse_port(spec):
+    """"DEVICE:TANK_ID:SENSOR_ID[:BAUD]" -> (device, tank_id, sensor_id, baud)."""
+    parts = spec.split(":")
+    if len(parts) not in (3, 4):
+        raise argparse.ArgumentTypeError(f"expected DEVICE:TANK_ID:SENSOR_ID[:BAUD], got {spec!r}")
+    baud = int(parts[3]) if len(parts) == 4 else 9600
+    if baud not in BAUD_RATES:
+        raise argparse.ArgumentTypeError(f"unsupported baud rate {baud}")
+    return parts[0], int(parts[1]), parts[2], baud
+
+
+class PortReader:
+    """One serial port: reads whatever is available, splits lines, hands samples to on_sample."""
+
+    def __init__(self, device, tank_id, sensor_id, baud, on_sample):
+        self.device = device
+        self.tank_id = tank_id
+        self.sensor_id = sensor_id
+        self.baud = baud
+        self.on_sample = on_sample     # (tank_id, sensor_id, ts, (O2, CO, LEL, H2S))
+        self.fd = None
+        self._buf = b""
+        # stats
+        self.lines = 0
+        self.bad = 0
+        self.reopens = 0
+
+    def open(self, loop):
+        try:
+            self.fd = os.open(self.device, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        except OSError as e:
+            print(f"Gateway: cannot open {self.device}: {e}")
+            loop.call_later(GATEWAY_REOPEN_SEC, self.open, loop)
+            return
+        if os.isatty(self.fd):
+            tty.setraw(self.fd)
+            attrs = termios.tcgetattr(self.fd)
+            attrs[4] = attrs[5] = BAUD_RATES[self.baud]     # ispeed, ospeed
+            termios.tcsetattr(self.fd, termios.TCSANOW, attrs)
+        self._buf = b""
+        loop.add_reader(self.fd, self._readable, loop)
+        print(f"Gateway: reading {self.device} ({self.baud} baud) as tank {self.tank_id} / {self.sensor_id}")
+
+    def close(self, loop):
+        if self.fd is not None:
+            loop.remove_reader(self.fd)
+            os.close(self.fd)
+            self.fd = None
+
+    def _readable(self, loop):
+        try:
+            data = os.read(self.fd, 4096)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            data, err = b"", e
+        else:
+            err = None
+        if not data:
+            print(f"Gateway: lost {self.device} ({err or 'EOF'}), reopening in {GATEWAY_REOPEN_SEC:.0f}s")
+            self.close(loop)
+            self.reopens += 1
+            loop.call_later(GATEWAY_REOPEN_SEC, self.open, loop)
+            return
+        ts = time.time()
+        *lines, self._buf = (self._buf + data).split(b"\n")
+        if len(self._buf) > MAX_LINE:      # no newline in sight: garbage or wrong baud rate
+            self._buf = b""
+            self.bad += 1
+        for line in lines:
+            if not line.strip():
+                continue
+            values = parse_line(line) if len(line) <= MAX_LINE else None
+            if values is None:
+                self.bad += 1
+                continue
+            self.lines += 1
+            self.on_sample(self.tank_id, self.sensor_id, ts, values)
+
+
+class TankBatcher:
+    """Coalesces one tank's samples (from all its sensors) into spool batches."""
+
+    def __init__(self, tank_id, client, spool_dir=GATEWAY_SPOOL_DIR, **forward_opts):
+        self.tank_id = tank_id
+        self.pending = []
+        self.spool = Spool(os.path.join(spool_dir, f"tank_{tank_id}.db"))
+        self.forwarder = Forwarder(self.spool, client, TOPIC, self.make_payload, **forward_opts)
+
+    def add(self, sensor_id, ts, values):
+        self.pending.append((ts, *values, sensor_id))
+
+    def flush(self):
+        if self.pending:
+            batch, self.pending = self.pending, []
+            self.spool.extend(batch)      # one short transaction per tank per flush
+            self.forwarder.wake()
+
+    def make_payload(self, rows):
+        """Spooled rows -> {"tank_id", "readings": [{"sensor_id", "samples": [[ts, O2, CO, LEL, H2S], ...]}]}."""
+        by_sensor = {}
+        for _, ts, o2, co, lel, h2s, sensor_id in rows:
+            by_sensor.setdefault(sensor_id, []).append([ts, o2, co, lel, h2s])
+        return json.dumps({"tank_id": self.tank_id,
+                           "readings": [{"sensor_id": sid, "samples": s} for sid, s in by_sensor.items()]})
+
+
+class Gateway:
+    def __init__(self, ports, client, spool_dir=GATEWAY_SPOOL_DIR, flush_sec=GATEWAY_FLUSH_SEC, **forward_opts):
+        # ports: [(device, tank_id, sensor_id, baud)]; forward_opts: Forwarder batch/rate/... overrides
+        os.makedirs(spool_dir, exist_ok=True)
+        self.client = client
+        self.flush_sec = flush_sec
+        self.tanks = {t: TankBatcher(t, client, spool_dir, **forward_opts) for t in sorted({p[1] for p in ports})}
+        self.readers = [PortReader(*p, on_sample=self._on_sample) for p in ports]
+        # one MQTT connection for every tank: acks and link state go to all forwarders
+        forwarders = [b.forwarder for b in self.tanks.values()]
+        client.on_connect = lambda *a: [f.on_connect(*a) for f in forwarders]
+        client.on_disconnect = lambda *a: [f.on_disconnect(*a) for f in forwarders]
+        client.on_publish = lambda *a: [f.on_publish(*a) for f in forwarders]   # unknown mids are ignored
+        self._stop = None
+
+    def _on_sample(self, tank_id, sensor_id, ts, values):
+        self.tanks[tank_id].add(sensor_id, ts, values)
+
+    async def run(self, stats_sec=GATEWAY_STATS_SEC):
+        loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        for b in self.tanks.values():
+            b.forwarder.start()
+        for r in self.readers:
+            r.open(loop)
+        last_stats = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                try:
+                    await asyncio.wait_for(self._stop.wait(), self.flush_sec)
+                except asyncio.TimeoutError:
+                    pass
+                for b in self.tanks.values():
+                    b.flush()
+                if stats_sec and time.monotonic() - last_stats >= stats_sec:
+                    print(f"Gateway: {self.stats()}")
+                    last_stats = time.monotonic()
+        finally:
+            for r in self.readers:
+                r.close(loop)
+            for b in self.tanks.values():
+                b.flush()
+
+    def stop(self):
+        self._stop.set()
+
+    def close(self):
+        for b in self.tanks.values():
+            b.forwarder.stop()
+            b.spool.close()
+
+    def stats(self):
+        return {
+            "lines": sum(r.lines for r in self.readers),
+            "bad_lines": sum(r.bad for r in self.readers),
+            "reopens": sum(r.reopens for r in self.readers),
+            "tanks": {t: b.forwarder.stats() for t, b in self.tanks.items()},
+        }
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Serial -> MQTT gateway for many sensor ports")
+    p.add_argument("--port", dest="ports", type=parse_port, action="append", required=True,
+                   metavar="DEVICE:TANK_ID:SENSOR_ID[:BAUD]")
+    p.add_argument("--fake-broker", action="store_true", help="in-process broker stand-in (bridge_fakes.py)")
+    args = p.parse_args()
+
+    if args.fake_broker:
+        from bridge_fakes import FakeMqttClient
+        client = FakeMqttClient()
+    else:
+        import paho.mqtt.client as mqtt
+        client = mqtt.Client()
+    gateway = Gateway(args.ports, client)
+    client.connect_async(MQTT_BROKER, MQTT_PORT, 60)
+    client.loop_start()
+    try:
+        asyncio.run(gateway.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        gateway.close()
+        client.loop_stop()
@@ -0,0 +1,221 @@
+# spool.py
+#
+# Store-and-forward for the ship-side serial -> MQTT bridge (sensor_simulate.py).
+#
+# Every sample read from the serial port is appended to a local SQLite spool
+# before anything is sent, so nothing read during a link outage is lost. A
+# Forwarder thread publishes the spool oldest-first, up to SPOOL_BATCH samples
+# per QoS 1 message, and deletes a message's samples only when the broker's
+# PUBACK for its mid arrives (client.on_publish). After a reconnect the
+# backlog drains at DRAIN_MSGS_PER_SEC so it doesn't flood the uplink.
+#
+# Delivery is at-least-once: a message whose PUBACK does not arrive within
+# ACK_TIMEOUT_SEC is sent again (just that message's samples). Samples carry
+# their read time and the backend stores one row per (ship, tank, sensor,
+# time), so a sample that did arrive the first time is ignored on resend.
+
+import collections
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+SPOOL_PATH = os.getenv("SPOOL_PATH", "./bridge_spool.db")
+SPOOL_MAX_ROWS = int(os.getenv("SPOOL_MAX_ROWS", "1000000"))     # oldest samples are dropped beyond this
+SPOOL_BATCH = int(os.getenv("SPOOL_BATCH", "50"))                # samples per MQTT message
+DRAIN_MSGS_PER_SEC = float(os.getenv("DRAIN_MSGS_PER_SEC", "5"))
+MAX_INFLIGHT = int(os.getenv("MAX_INFLIGHT", "20"))              # unacknowledged messages
+ACK_TIMEOUT_SEC = float(os.getenv("ACK_TIMEOUT_SEC", "30"))      # then resend that message's samples
+
+_ERR_NO_CONN = 4   # paho MQTT_ERR_NO_CONN: the message is queued and sent on reconnect
+
+
+class Spool:
+    """Append-only sample log; rows leave it only when acknowledged (or when it overflows)."""
+
+    def __init__(self, path=SPOOL_PATH, max_rows=SPOOL_MAX_ROWS):
+        self.max_rows = max_rows
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")   # survives a process crash; ~1s of loss on power cut
+        self._db.execute("""CREATE TABLE IF NOT EXISTS spool (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts REAL NOT NULL, o2 REAL, co REAL, lel REAL, h2s REAL, sensor_id TEXT)""")
+        if "sensor_id" not in [c[1] for c in self._db.execute("PRAGMA table_info(spool)")]:
+            self._db.execute("ALTER TABLE spool ADD COLUMN sensor_id TEXT")   # spools from single-port bridges
+        self._count = self._db.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+
+    def append(self, ts, o2, co, lel, h2s=None, sensor_id=None):
+        self.extend([(ts, o2, co, lel, h2s, sensor_id)])
+
+    def extend(self, samples):
+        """Append [(ts, o2, co, lel, h2s, sensor_id)] in one transaction."""
+        with self._lock:
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.executemany("INSERT INTO spool (ts, o2, co, lel, h2s, sensor_id) VALUES (?, ?, ?, ?, ?, ?)",
+                                     samples)
+            self._count += len(samples)
+            if self._count > self.max_rows:
+                over = self._count - self.max_rows
+                self._db.execute("DELETE FROM spool WHERE id IN (SELECT id FROM spool ORDER BY id LIMIT ?)", (over,))
+                self._count -= over
+                self.dropped += over
+
+    def pending(self, after_id=0, limit=SPOOL_BATCH):
+        """Oldest rows with id > after_id: [(id, ts, o2, co, lel, h2s, sensor_id)]."""
+        with self._lock:
+            return self._db.execute("SELECT id, ts, o2, co, lel, h2s, sensor_id FROM spool WHERE id > ? ORDER BY id LIMIT ?",
+                                    (after_id, limit)).fetchall()
+
+    def rows(self, first_id, last_id):
+        """Rows still spooled with first_id <= id <= last_id, same shape as pending()."""
+        with self._lock:
+            return self._db.execute("SELECT id, ts, o2, co, lel, h2s, sensor_id FROM spool WHERE id BETWEEN ? AND ? "
+                                    "ORDER BY id", (first_id, last_id)).fetchall()
+
+    def ack(self, first_id, last_id):
+        with self._lock:
+            n = self._db.execute("DELETE FROM spool WHERE id BETWEEN ? AND ?", (first_id, last_id)).rowcount
+            self._count -= n
+            return n
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class Forwarder:
+    """
+    Publishes the spool over a paho client. Wire the client's on_connect,
+    on_disconnect and on_publish callbacks to the methods of the same name.
+    make_payload(rows) turns spool rows into one message body.
+    """
+
+    def __init__(self, spool, client, topic, make_payload, batch=SPOOL_BATCH,
+                 rate=DRAIN_MSGS_PER_SEC, max_inflight=MAX_INFLIGHT, ack_timeout=ACK_TIMEOUT_SEC):
+        self.spool = spool
+        self.client = client
+        self.topic = topic
+        self.make_payload = make_payload
+        self.batch = batch
+        self.rate = rate
+        self.max_inflight = max_inflight
+        self.ack_timeout = ack_timeout
+        self.connected = False
+        self._events = queue.SimpleQueue()   # ("ack", mid) | ("connect",) | ("wake",), handled in run()
+        self._inflight = {}                  # mid -> (first_id, last_id, sent_at)
+        self._cursor = 0                     # highest spool id handed to the client
+        self._resend = collections.deque()   # (first_id, last_id) ranges whose PUBACK timed out
+        self._next_send = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        # stats
+        self.published = 0
+        self.acked = 0
+        self.resends = 0
+
+    # --- paho callbacks (network thread): only signal run() ---
+    def on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            self.connected = True
+            self._events.put(("connect",))
+
+    def on_disconnect(self, client, userdata, rc):
+        self.connected = False
+
+    def on_publish(self, client, userdata, mid):
+        self._events.put(("ack", mid))
+
+    def wake(self):
+        """New samples in the spool (or the link came back)."""
+        self._events.put(("wake",))
+
+    # --- forwarding thread ---
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="spool-forwarder", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        self.wake()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                ev = self._events.get(timeout=self._wait())
+            except queue.Empty:
+                ev = None
+            if ev and ev[0] == "ack":
+                self._ack(ev[1])
+            elif ev and ev[0] == "connect":
+                # paho re-sends its unacknowledged messages on reconnect: give them a fresh timeout
+                now = time.monotonic()
+                self._inflight = {mid: (a, b, now) for mid, (a, b, _) in self._inflight.items()}
+            self._check_timeouts()
+            self._send()
+
+    def _wait(self):
+        return max(0.05, min(1.0, self._next_send - time.monotonic()))
+
+    def _ack(self, mid):
+        entry = self._inflight.pop(mid, None)
+        if entry is not None:        # unknown mids: acks for messages already given up on
+            self.spool.ack(entry[0], entry[1])
+            self.acked += 1
+
+    def _check_timeouts(self):
+        if not self.connected or not self._inflight:
+            return
+        now = time.monotonic()
+        expired = sorted((entry[0], entry[1], mid) for mid, entry in self._inflight.items()
+                         if now - entry[2] > self.ack_timeout)
+        if not expired:
+            return
+        print(f"Spool: no PUBACK for {len(expired)} message(s) in {self.ack_timeout:.0f}s, resending them")
+        for first_id, last_id, mid in expired:
+            del self._inflight[mid]          # a late ack for the old mid is ignored
+            self._resend.append((first_id, last_id))
+        self.resends += len(expired)
+
+    def _send(self):
+        # publish while connected, below the in-flight cap, at most `rate` messages/sec
+        while self.connected and len(self._inflight) < self.max_inflight:
+            now = time.monotonic()
+            if now < self._next_send:
+                return
+            # timed-out messages go first, as the same ranges; then new rows
+            resend = self._resend[0] if self._resend else None
+            rows = self.spool.rows(*resend) if resend else self.spool.pending(self._cursor, self.batch)
+            if not rows:
+                if resend:               # acked late or dropped by overflow meanwhile
+                    self._resend.popleft()
+                    continue
+                return
+            info = self.client.publish(self.topic, self.make_payload(rows), qos=1)
+            if info.rc not in (0, _ERR_NO_CONN):
+                return
+            self._inflight[info.mid] = (rows[0][0], rows[-1][0], now)
+            if resend:
+                self._resend.popleft()
+            else:
+                self._cursor = rows[-1][0]
+            self.published += 1
+            self._next_send = now + 1.0 / self.rate
+            if info.rc == _ERR_NO_CONN:
+                return               # link just dropped: paho sends it on reconnect
+
+    def stats(self):
+        return {"connected": self.connected, "spooled": len(self.spool), "inflight": len(self._inflight),
+                "resend_queued": len(self._resend),
+                "published": self.published, "acked": self.acked, "resends": self.resends,
+                "dropped": self.spool.dropped}
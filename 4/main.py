@@ -4,7 +4,7 @@ import datetime
 from fastapi import FastAPI, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from fastapi.middleware.cors import CORSMiddleware
-import models, database
+import models, database, meta_cache
 import json 
 import threading
 import paho.mqtt.client as mqtt
@@ -93,6 +93,10 @@ def _agg_from_sensors(sensors_dict):
     }
     return display, worst
 
+# --- NEW: ships, tanks, sensor assignments, thresholds and the log sink for
+# on_message, without per-message SELECTs; write endpoints invalidate it ---
+META = meta_cache.MetaCache(database.SessionLocal, DEFAULT_THRESHOLDS)
+
 
 # --- Dependency to get DB session ---
 def get_db():
@@ -190,6 +194,7 @@ def create_ship(ship: models.ShipCreate, db: Session = Depends(get_db)):
     )
     db.add(new_ship)
     db.commit()
+    META.invalidate()
     db.refresh(new_ship)
     return new_ship
 # ... (All your other ship endpoints: update, delete, acknowledge remain the same)
@@ -219,6 +224,7 @@ def create_tank_for_ship(ship_id: str, tank: models.TankCreate, db: Session = De
     new_tank = models.Tank(**tank.dict(), ship_id=ship_id)
     db.add(new_tank)
     db.commit()
+    META.invalidate()
     db.refresh(new_tank)
     return new_tank
 
@@ -245,21 +251,18 @@ def assign_sensors_to_tank(ship_id: str, tank_id: int, request: models.SensorAss
         db_sensor.last_used_on_ship = db_tank.owner_ship.name
     
     db.commit()
+    META.invalidate()
     # Return all sensors now assigned to the tank
     db.refresh(db_tank)
     return db_tank.sensors
 
 @app.get("/api/ships/{ship_id}/tanks/{tank_id}/thresholds", response_model=models.TankThresholdSchema)
-def get_tank_thresholds(ship_id: str, tank_id: int, db: Session = Depends(get_db)):
-    tank = db.query(models.Tank).filter(models.Tank.id==tank_id, models.Tank.ship_id==ship_id).first()
-    if not tank:
+def get_tank_thresholds(ship_id: str, tank_id: int):
+    tank = META.tank(tank_id)
+    if not tank or tank.ship_id != ship_id:
         raise HTTPException(404, "Tank not found")
-    row = db.query(models.TankThreshold).filter(models.TankThreshold.tank_id==tank_id).first()
-    # fill with defaults if not set
-    if not row:
-        return models.TankThresholdSchema(**DEFAULT_THRESHOLDS)
-    data = {k: getattr(row, k) if getattr(row, k) is not None else DEFAULT_THRESHOLDS[k] for k in DEFAULT_THRESHOLDS}
-    return models.TankThresholdSchema(**data)
+    # defaults merged with the tank's overrides
+    return models.TankThresholdSchema(**tank.thresholds)
 
 @app.put("/api/ships/{ship_id}/tanks/{tank_id}/thresholds", response_model=models.TankThresholdSchema)
 def put_tank_thresholds(ship_id: str, tank_id: int, payload: models.TankThresholdSchema, db: Session = Depends(get_db)):
@@ -273,8 +276,8 @@ def put_tank_thresholds(ship_id: str, tank_id: int, payload: models.TankThreshol
     for k, v in payload.dict().items():
         setattr(row, k, v)
     db.commit(); db.refresh(row)
-    data = {k: getattr(row, k) if getattr(row, k) is not None else DEFAULT_THRESHOLDS[k] for k in DEFAULT_THRESHOLDS}
-    return models.TankThresholdSchema(**data)
+    META.invalidate()
+    return models.TankThresholdSchema(**META.resolve_thresholds(row))
 
 @app.get("/api/ships/{ship_id}/tanks/{tank_id}/live")
 def get_tank_live(ship_id: str, tank_id: int):
@@ -393,6 +396,7 @@ def create_master_sensor(payload: models.MasterSensorCreate, db: Session = Depen
         last_used_on_ship=payload.last_used_on_ship
     )
     db.add(row); db.commit(); db.refresh(row)
+    META.invalidate()
     return row
 
 @app.put("/api/master/sensors/{sensor_id}", response_model=models.MasterSensorSchema, tags=["Master Data"])
@@ -418,6 +422,7 @@ def update_master_sensor(sensor_id: str, payload: models.MasterSensorUpdate, db:
         row.last_used_on_ship = payload.last_used_on_ship
 
     db.commit(); db.refresh(row)
+    META.invalidate()
     return row
 
 @app.delete("/api/master/sensors/{sensor_id}", tags=["Master Data"])
@@ -433,6 +438,7 @@ def delete_master_sensor(sensor_id: str, db: Session = Depends(get_db)):
 
     # cascade deletes its logs via relationship
     db.delete(row); db.commit()
+    META.invalidate()
     return {"ok": True}
 
 @app.post("/api/master/sensors/{sensor_id}/calibrate", response_model=models.MasterSensorSchema, tags=["Master Data"])
@@ -475,17 +481,18 @@ def on_message(client, userdata, msg):
         tank_id = data.get("tank_id")
         readings = data.get("readings") or []
 
-        ship = db.query(models.Ship).filter(models.Ship.id == ship_id).first()
-        if not ship or tank_id is None:
+        # ship, tank and assignments come from the metadata cache
+        snap = META.snapshot()
+        tank = snap.tanks.get(tank_id)
+        if ship_id not in snap.ships or not tank or tank.ship_id != ship_id:
             return
-
-        # ensure tank exists for this ship
-        tank = db.query(models.Tank).filter(models.Tank.id == tank_id, models.Tank.ship_id == ship_id).first()
-        if not tank:
+        # the ship row is updated below, so it is the one row still loaded
+        ship = db.get(models.Ship, ship_id)
+        if not ship:
             return
 
         # Build allowed sensor set for this tank
-        assigned_ids = {a.sensor_id for a in tank.sensors}
+        assigned_ids = tank.sensors
 
         # If you want to strictly require assignment, drop unassigned
         filtered = []
@@ -518,24 +525,17 @@ def on_message(client, userdata, msg):
         bucket["updated_at"] = datetime.datetime.now()
         LIVE_CACHE[key] = bucket
 
-        # Load per-tank thresholds if any, else defaults
-        T = DEFAULT_THRESHOLDS.copy()
-        thr = db.query(models.TankThreshold).filter(models.TankThreshold.tank_id == tank_id).first()
-        if thr:
-            for k in T.keys():
-                v = getattr(thr, k, None)
-                if v is not None:
-                    T[k] = v
+        # Per-tank thresholds (defaults merged with overrides), from the cache
+        T = tank.thresholds
 
         new_state = evaluate_state(worst.get("O2"), worst.get("CO"), worst.get("LEL"), worst.get("H2S"), T)
         prev = ship.status or "Idle"
 
         ship.live_o2, ship.live_co, ship.live_lel, ship.live_h2s = disp.get("O2"), disp.get("CO"), disp.get("LEL"), disp.get("H2S")
 
-        sink = db.query(models.MasterSensor).filter(models.MasterSensor.type=="Multi-gas").first()
         def log_event(ev, details):
-            if sink:
-                db.add(models.SensorLogEntry(owner_sensor=sink, event=ev, details=details))
+            if snap.sink:
+                db.add(models.SensorLogEntry(sensor_id=snap.sink, event=ev, details=details))
 
         if new_state == "Danger" and prev != "Danger":
             ship.previousStatus = ship.status
@@ -0,0 +1,95 @@
+# meta_cache.py
+#
+# In-process cache of the slow-changing master data the MQTT ingest needs on
+# every message: which ships/tanks exist, which sensors are assigned to each
+# tank, each tank's resolved thresholds (defaults merged with overrides) and
+# the Multi-gas sensor transition logs are attached to.
+# These rows only change through the REST API, so the write endpoints call
+# `invalidate()` and the next reader reloads everything in a handful of
+# queries. Readers always see one consistent, versioned snapshot.
+
+import threading
+from collections import namedtuple
+
+import models
+
+TankMeta = namedtuple("TankMeta", ["tank_id", "ship_id", "sensors", "thresholds"])
+
+
+class _Snapshot:
+    __slots__ = ("version", "ships", "tanks", "sink")
+
+    def __init__(self, version, ships, tanks, sink):
+        self.version = version
+        self.ships = ships        # frozenset of ship ids
+        self.tanks = tanks        # {tank_id: TankMeta}
+        self.sink = sink          # log-sink sensor id, or None
+
+
+class MetaCache:
+    def __init__(self, session_factory, default_thresholds):
+        self.session_factory = session_factory
+        self.defaults = dict(default_thresholds)
+        self._lock = threading.Lock()
+        self._version = 0
+        self._snap = None
+
+    @property
+    def version(self):
+        return self._version
+
+    def invalidate(self):
+        """Drop the snapshot; the next read reloads it from the DB."""
+        with self._lock:
+            self._version += 1
+            self._snap = None
+
+    def resolve_thresholds(self, row):
+        """DEFAULT_THRESHOLDS merged with a TankThreshold row's non-null overrides."""
+        T = self.defaults.copy()
+        if row is not None:
+            for k in T:
+                v = getattr(row, k, None)
+                if v is not None:
+                    T[k] = v
+        return T
+
+    def _load(self, version):
+        db = self.session_factory()
+        try:
+            ships = frozenset(sid for (sid,) in db.query(models.Ship.id))
+            sensors = {}
+            for tank_id, sensor_id in db.query(models.AssignedSensor.tank_id, models.AssignedSensor.sensor_id):
+                sensors.setdefault(tank_id, set()).add(sensor_id)
+            overrides = {row.tank_id: row for row in db.query(models.TankThreshold)}
+            tanks = {
+                tank_id: TankMeta(tank_id, ship_id,
+                                  frozenset(sensors.get(tank_id, ())),
+                                  self.resolve_thresholds(overrides.get(tank_id)))
+                for tank_id, ship_id in db.query(models.Tank.id, models.Tank.ship_id)
+            }
+            sink = db.query(models.MasterSensor.id).filter(models.MasterSensor.type == "Multi-gas").first()
+            return _Snapshot(version, ships, tanks, sink[0] if sink else None)
+        finally:
+            db.close()
+
+    def snapshot(self):
+        snap = self._snap
+        if snap is not None:
+            return snap
+        with self._lock:
+            if self._snap is None:
+                self._snap = self._load(self._version)
+            return self._snap
+
+    # --- convenience readers ---
+    def has_ship(self, ship_id):
+        return ship_id in self.snapshot().ships
+
+    def tank(self, tank_id):
+        return self.snapshot().tanks.get(tank_id)
+
+    def thresholds(self, tank_id):
+        """Resolved thresholds for a tank (defaults for unknown/None tanks)."""
+        meta = self.snapshot().tanks.get(tank_id)
+        return meta.thresholds if meta else self.defaults.copy()
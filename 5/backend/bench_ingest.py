@@ -0,0 +1,279 @@
+# bench_ingest.py — ingest throughput benchmark
+#
+# Simulates N ships x M tanks x K sensors using the same random-walk model as
+# sensor_simulator.py and drives the backend's ingest path, either
+#   --mode direct : calling main.on_message() with fake MQTT messages, or
+#   --mode mqtt   : publishing through a real broker to main's MQTT client,
+#   --mode pool   : dispatching to a multi-process ingest pool
+#                   (ingest_pool.py), once per --workers count.
+# Reports sustained msgs/sec, ingest latency percentiles (arrival in
+# on_message -> batch committed), DB rows/sec and dropped messages; pool mode
+# prints throughput per worker count (the scaling curve).
+#
+# Runs against a throwaway SQLite file unless --db-url is given, e.g.
+#   python bench_ingest.py --ships 50 --tanks 4 --sensors 3 --interval 1 --duration 30
+#   python bench_ingest.py --mode pool --workers 1,2,4,8 --ships 64 --rate 5000 --duration 10
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import types
+
+import payload_codec
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Benchmark MQTT ingest throughput")
+    p.add_argument("--mode", choices=("direct", "mqtt", "pool"), default="direct")
+    p.add_argument("--ships", type=int, default=10)
+    p.add_argument("--tanks", type=int, default=4, help="tanks per ship")
+    p.add_argument("--sensors", type=int, default=3, help="sensors per tank")
+    p.add_argument("--samples", type=int, default=1,
+                   help="timestamped samples per sensor per message (>1 uses the multi-sample format)")
+    p.add_argument("--encoding", choices=("json", "f32", "f16", "i16"), default="json",
+                   help="payload format (binary encodings: payload_codec.py)")
+    p.add_argument("--interval", type=float, default=3.0, help="seconds between publishes per tank")
+    p.add_argument("--rate", type=float, default=None, help="total msgs/sec (overrides --interval)")
+    p.add_argument("--duration", type=float, default=20.0, help="seconds to publish for")
+    p.add_argument("--db-url", default=None, help="defaults to a temporary SQLite file")
+    p.add_argument("--broker", default="localhost")
+    p.add_argument("--port", type=int, default=1883)
+    p.add_argument("--batch-size", type=int, default=None, help="override INGEST_BATCH_SIZE")
+    p.add_argument("--flush-ms", type=int, default=None, help="override INGEST_FLUSH_MS")
+    p.add_argument("--queue-max", type=int, default=None, help="override INGEST_QUEUE_MAX")
+    p.add_argument("--workers", default="1,2,4", help="pool mode: comma-separated worker counts")
+    return p.parse_args()
+
+
+def percentile(sorted_vals, q):
+    if not sorted_vals:
+        return None
+    i = min(len(sorted_vals) - 1, max(0, int(round(q / 100.0 * (len(sorted_vals) - 1)))))
+    return sorted_vals[i]
+
+
+class Fleet:
+    """N ships x M tanks x K sensors, each sensor random-walking like the simulator."""
+
+    def __init__(self, ships, tanks, sensors, samples=1, encoding="json"):
+        import sensor_simulator as sim
+        self.sim = sim
+        self.samples = samples
+        self.encoding = encoding
+        self.tanks = []   # (ship_id, tank_id, [sensor ids])
+        tank_id = 0
+        for s in range(ships):
+            for _ in range(tanks):
+                tank_id += 1
+                self.tanks.append((f"BENCH{s:04d}", tank_id,
+                                   [f"B-{tank_id}-{k}" for k in range(sensors)]))
+        self.state = {
+            sid: {"O2": sim.O2_BASE, "CO": sim.CO_BASE, "LEL": sim.LEL_BASE, "H2S": sim.H2S_BASE}
+            for _, _, sids in self.tanks for sid in sids
+        }
+
+    def payload(self, i):
+        topic, tank_id, readings = self.message(i)
+        if self.encoding != "json":
+            return topic, payload_codec.encode(tank_id, readings, self.encoding)
+        return topic, json.dumps({"tank_id": tank_id, "readings": readings}).encode()
+
+    def message(self, i):
+        """(topic, tank_id, readings) of the i-th message, readings in the JSON shape."""
+        ship_id, tank_id, sids = self.tanks[i % len(self.tanks)]
+        readings = []
+        now = time.time()
+        for sid in sids:
+            samples = []
+            for j in range(self.samples):
+                self.state[sid] = r = self.sim._tick_sensor(self.state[sid])
+                if random.random() < self.sim.DANGER_PROB / 10:
+                    r = dict(r, CO=self.sim.CO_DANGER_SPIKE)
+                samples.append([round(now - (self.samples - 1 - j), 3)] +
+                               [round(r[k], 2) for k in ("O2", "CO", "LEL", "H2S")])
+            if self.samples == 1:
+                readings.append({"sensor_id": sid, **dict(zip(("O2", "CO", "LEL", "H2S"), samples[0][1:]))})
+            else:
+                readings.append({"sensor_id": sid, "samples": samples})
+        return f"ship/{ship_id}/sensors", tank_id, readings
+
+
+def seed(main, fleet):
+    import models
+    db = main.database.SessionLocal()
+    try:
+        ships = sorted({s for s, _, _ in fleet.tanks})
+        for sid in ships:
+            if db.get(models.Ship, sid) is None:
+                db.add(models.Ship(id=sid, name=sid, lastPort="BENCH", personnel=0, arrived="00:00 HRS"))
+        for ship_id, tank_id, _ in fleet.tanks:
+            if db.get(models.Tank, tank_id) is None:
+                db.add(models.Tank(id=tank_id, ship_id=ship_id, ship_specific_id=f"T{tank_id}", type_id="BALLAST"))
+        db.commit()
+    finally:
+        db.close()
+    main.META.invalidate()
+
+
+def count_rows(main):
+    import models
+    db = main.database.SessionLocal()
+    try:
+        return db.query(models.ReadingArchive).count()
+    finally:
+        db.close()
+
+
+def run():
+    args = parse_args()
+    if args.db_url is None:
+        args.db_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench_'), 'bench.db')}"
+    os.environ["DATABASE_URL"] = args.db_url
+    for flag, env in ((args.batch_size, "INGEST_BATCH_SIZE"), (args.flush_ms, "INGEST_FLUSH_MS"),
+                      (args.queue_max, "INGEST_QUEUE_MAX")):
+        if flag is not None:
+            os.environ[env] = str(flag)
+
+    os.environ.setdefault("INGEST_POOL_STATS_SEC", "0.2")   # pool workers report progress often
+
+    import main   # reads DATABASE_URL / INGEST_* at import time
+
+    fleet = Fleet(args.ships, args.tanks, args.sensors, args.samples, args.encoding)
+    seed(main, fleet)
+    rate = args.rate or len(fleet.tanks) / args.interval
+    if args.mode == "pool":
+        return run_pool(args, main, fleet, rate)
+
+    # --- instrumentation: stamp arrival in on_message, measure at batch commit ---
+    latencies = []
+    lat_lock = threading.Lock()
+    arrival = threading.local()
+    pipeline = main.INGEST
+    orig_submit, orig_handle = pipeline.submit, pipeline.handle_batch
+
+    def timed_submit(item):
+        item["_bench_t0"] = getattr(arrival, "t0", time.perf_counter())
+        return orig_submit(item)
+
+    def timed_handle(items):
+        orig_handle(items)
+        now = time.perf_counter()
+        with lat_lock:
+            latencies.extend(now - it["_bench_t0"] for it in items)
+
+    pipeline.submit, pipeline.handle_batch = timed_submit, timed_handle
+    orig_on_message = main.on_message
+
+    def timed_on_message(client, userdata, msg):
+        arrival.t0 = time.perf_counter()
+        orig_on_message(client, userdata, msg)
+
+    pipeline.start()
+    rows_before = count_rows(main)
+
+    publisher = None
+    if args.mode == "mqtt":
+        import paho.mqtt.client as mqtt
+        main.mqtt_client.on_message = timed_on_message
+        threading.Thread(target=main.start_mqtt_client, daemon=True).start()
+        publisher = mqtt.Client()
+        publisher.connect(args.broker, args.port, 60)
+        publisher.loop_start()
+        time.sleep(1.0)   # let the consumer subscribe
+
+        def send(topic, payload):
+            publisher.publish(topic, payload, qos=0)
+    else:
+        def send(topic, payload):
+            timed_on_message(None, None, types.SimpleNamespace(topic=topic, payload=payload))
+
+    # --- paced publish loop ---
+    print(f"Benchmark: mode={args.mode} ships={args.ships} tanks/ship={args.tanks} "
+          f"sensors/tank={args.sensors} samples/sensor={args.samples} encoding={args.encoding} target={rate:.0f} msgs/s for {args.duration:.0f}s -> {args.db_url}")
+    sent = 0
+    t_start = time.perf_counter()
+    t_end = t_start + args.duration
+    while True:
+        now = time.perf_counter()
+        if now >= t_end:
+            break
+        due = int((now - t_start) * rate) + 1
+        while sent < due:
+            send(*fleet.payload(sent))
+            sent += 1
+        next_due = t_start + sent / rate
+        time.sleep(max(0.0, min(next_due, t_end) - time.perf_counter()))
+    t_pub = time.perf_counter() - t_start
+
+    # drain: wait for the writer to catch up with everything accepted
+    deadline = time.perf_counter() + 60
+    while time.perf_counter() < deadline:
+        st = pipeline.stats()
+        if st["written"] + st["failed"] >= st["enqueued"] and (args.mode == "direct" or st["enqueued"] + st["dropped"] >= sent):
+            break
+        time.sleep(0.05)
+    t_total = time.perf_counter() - t_start
+    pipeline.stop()
+    if publisher:
+        publisher.loop_stop()
+        main.mqtt_client.disconnect()
+
+    st = pipeline.stats()
+    rows = count_rows(main) - rows_before
+    lat = sorted(latencies)
+    ms = lambda v: "n/a" if v is None else f"{v * 1000:.1f}"
+    print(f"published        : {sent} msgs in {t_pub:.1f}s ({sent / t_pub:.0f} msgs/s offered)")
+    print(f"ingested         : {st['written']} msgs in {t_total:.1f}s ({st['written'] / t_total:.0f} msgs/s sustained)")
+    print(f"db rows          : {rows} reading_archive rows ({rows / t_total:.0f} rows/s)")
+    print(f"batches          : {st['batches']} (avg {st['written'] / max(st['batches'], 1):.1f} msgs/batch)")
+    print(f"latency ms       : p50={ms(percentile(lat, 50))} p95={ms(percentile(lat, 95))} "
+          f"p99={ms(percentile(lat, 99))} max={ms(lat[-1] if lat else None)}")
+    print(f"dropped / failed : {st['dropped'] + max(0, sent - st['enqueued'] - st['dropped'])} / {st['failed']}")
+
+
+def run_pool(args, main, fleet, rate):
+    import ingest_pool
+    counts = [int(n) for n in args.workers.split(",")]
+    # generate up front so the publishing side isn't what limits the curve
+    msgs = [fleet.payload(i) for i in range(int(rate * args.duration))]
+    print(f"Benchmark: mode=pool ships={args.ships} tanks/ship={args.tanks} sensors/tank={args.sensors} "
+          f"target={rate:.0f} msgs/s for {args.duration:.0f}s, workers={counts} -> {args.db_url}")
+    print(f"{'workers':>7} {'offered/s':>10} {'ingested/s':>11} {'speedup':>8} {'rows/s':>9} {'dropped':>8} {'failed':>7}")
+    base = None
+    for n in counts:
+        pool = ingest_pool.IngestPool(main.STATE, workers=n, sharding="dispatch")
+        pool.start()
+        # wait until every worker has imported main and reported in
+        while len(pool.worker_stats) < n:
+            time.sleep(0.1)
+        rows_before = count_rows(main)
+        sent = 0
+        t_start = time.perf_counter()
+        for topic, payload in msgs:
+            ahead = t_start + sent / rate - time.perf_counter()
+            if ahead > 0:
+                time.sleep(ahead)
+            pool.dispatch(topic, payload)
+            sent += 1
+        t_pub = time.perf_counter() - t_start
+        deadline = time.perf_counter() + 60
+        while time.perf_counter() < deadline:
+            st = pool.stats()
+            if st["written"] + st["failed"] + st["dropped"] >= sent:
+                break
+            time.sleep(0.05)
+        t_total = time.perf_counter() - t_start
+        pool.stop()
+        st = pool.stats()
+        rows = count_rows(main) - rows_before
+        base = base or st["written"] / t_total
+        print(f"{n:>7} {sent / t_pub:>10.0f} {st['written'] / t_total:>11.0f} "
+              f"{st['written'] / t_total / base:>7.2f}x {rows / t_total:>9.0f} {st['dropped']:>8} {st['failed']:>7}")
+
+
+if __name__ == "__main__":
+    run()
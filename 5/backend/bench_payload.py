@@ -0,0 +1,100 @@
+# bench_payload.py — payload encoding benchmark
+#
+# Builds the same messages bench_ingest.py publishes (K sensors per tank, S
+# samples per sensor) and compares JSON with each binary payload_codec
+# encoding: bytes per message and per reading (one sensor sample of four
+# gases), encode/decode time per message, and the largest value error the
+# lossy encodings introduce. No broker or database needed. Before timing, a
+# round trip checks that epoch and ISO 8601 sample times decode to the same
+# epoch seconds.
+#
+#   python bench_payload.py --sensors 3 --samples 1
+#   python bench_payload.py --sensors 8 --samples 10 --messages 5000
+
+import argparse
+import datetime
+import json
+import time
+
+import payload_codec
+from bench_ingest import Fleet
+
+GAS_KEYS = payload_codec.GAS_KEYS
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Compare JSON and binary sensor payload encodings")
+    p.add_argument("--sensors", type=int, default=3, help="sensors per tank")
+    p.add_argument("--samples", type=int, default=1, help="timestamped samples per sensor per message")
+    p.add_argument("--messages", type=int, default=2000)
+    return p.parse_args()
+
+
+def _values(data):
+    """Every (sensor, sample, gas) value of a decoded payload, in order."""
+    out = []
+    for r in data["readings"]:
+        if "samples" in r:
+            out.extend(v for s in r["samples"] for v in s[1:])
+        else:
+            out.extend(r.get(k) for k in GAS_KEYS)
+    return out
+
+
+def check_timestamps():
+    """Epoch-second and ISO 8601 (naive and with offset) sample times survive every encoding."""
+    t = 1718000000.25
+    naive = datetime.datetime.fromtimestamp(t).isoformat()
+    aware = datetime.datetime.fromtimestamp(t, datetime.timezone.utc).isoformat()
+    for enc in payload_codec.ENCODINGS:
+        for ts in (t, naive, aware):
+            for reading in ({"sensor_id": "S1", "samples": [[ts, 20.9, 1.0, 0.5, None]]},
+                            {"sensor_id": "S1", "ts": ts, "O2": 20.9, "CO": 1.0, "LEL": 0.5, "H2S": None}):
+                got = payload_codec.decode(payload_codec.encode(1, [reading], enc))["readings"][0]
+                got_ts = got["samples"][0][0] if "samples" in got else got["ts"]
+                if abs(got_ts - t) > 0.001:
+                    raise SystemExit(f"{enc}: sample time {ts!r} decoded as {got_ts}, expected {t}")
+
+
+def _timed(fn, items, repeat=5):
+    """(results, best-of-repeat µs per item)."""
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = [fn(x) for x in items]
+        t = time.perf_counter() - t0
+        best = t if best is None else min(best, t)
+    return out, best / len(items) * 1e6
+
+
+def main():
+    args = parse_args()
+    check_timestamps()
+    fleet = Fleet(1, 1, args.sensors, args.samples)
+    msgs = [fleet.message(i)[1:] for i in range(args.messages)]
+    readings_per_msg = args.sensors * args.samples
+    reference = [_values({"readings": readings}) for _, readings in msgs]
+
+    print(f"{args.messages} messages, {args.sensors} sensors x {args.samples} samples "
+          f"({readings_per_msg} readings) each")
+    print(f"{'encoding':>8} {'bytes/msg':>10} {'bytes/reading':>14} {'vs json':>8} "
+          f"{'encode us':>10} {'decode us':>10} {'max error':>10}")
+    json_size = None
+    for enc in ("json",) + tuple(payload_codec.ENCODINGS):
+        if enc == "json":
+            encode = lambda m: json.dumps({"tank_id": m[0], "readings": m[1]}).encode()
+            decode = lambda b: json.loads(b.decode())
+        else:
+            encode = lambda m, enc=enc: payload_codec.encode(m[0], m[1], enc)
+            decode = payload_codec.decode
+        payloads, enc_us = _timed(encode, msgs)
+        decoded, dec_us = _timed(decode, payloads)
+        size = sum(map(len, payloads)) / len(payloads)
+        json_size = json_size or size
+        err = max(abs(a - b) for ref, got in zip(reference, decoded) for a, b in zip(ref, _values(got)))
+        print(f"{enc:>8} {size:>10.1f} {size / readings_per_msg:>14.1f} {size / json_size:>7.0%} "
+              f"{enc_us:>10.1f} {dec_us:>10.1f} {err:>10.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+# cold_archive.py
+#
+# Columnar cold tier for reading_archive. Closed days (older than
+# COLD_AFTER_DAYS) are moved out of SQL into one compressed Arrow IPC file per
+# ship per day:
+#
+#   <COLD_ARCHIVE_DIR>/<ship>/<YYYY-MM-DD>.arrow
+#
+# Files are written to a temp name and renamed, then the day's rows are
+# deleted from SQL in chunks. Readers memory-map the files, filter with
+# pyarrow.compute and merge the result with the hot SQL rows by timestamp, so
+# get_readings and the exports see one continuous series.
+#
+# Needs pyarrow; without it the archive stays disabled and all readings stay
+# in SQL.
+
+import datetime
+import hashlib
+import heapq
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+from sqlalchemy import delete, select
+
+import database
+import models
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:   # optional dependency
+    pa = pc = None
+
+COLD_ARCHIVE_DIR = Path(os.getenv("COLD_ARCHIVE_DIR", str(database.DATA_DIR / "cold")))
+COLD_AFTER_DAYS = int(os.getenv("COLD_AFTER_DAYS", "2"))         # days kept hot in SQL, counting today; 0 disables
+COLD_COMPRESSION = os.getenv("COLD_COMPRESSION", "zstd")          # zstd | lz4 | none
+COLD_DELETE_CHUNK = int(os.getenv("COLD_DELETE_CHUNK", "5000"))
+
+# archive columns, in file order; every cold row tuple follows this order
+COLUMNS = ("timestamp", "ship_id", "tank_id", "sensor_id", "o2", "co", "lel", "h2s")
+
+
+def _schema():
+    return pa.schema([
+        ("id", pa.int64()),   # source row id: makes re-running an interrupted compaction idempotent
+        ("timestamp", pa.timestamp("us")),
+        ("ship_id", pa.dictionary(pa.int32(), pa.string())),
+        ("tank_id", pa.int32()),
+        ("sensor_id", pa.dictionary(pa.int32(), pa.string())),
+        ("o2", pa.float64()), ("co", pa.float64()), ("lel", pa.float64()), ("h2s", pa.float64()),
+    ])
+
+
+def _ship_dir(ship_id):
+    # ship ids are free text: readable prefix + hash keeps directory names safe and unique
+    slug = re.sub(r"[^A-Za-z0-9_-]", "", ship_id)[:32]
+    return f"{slug}_{hashlib.md5(ship_id.encode()).hexdigest()[:8]}"
+
+
+def _day_start(ts):
+    return datetime.datetime.combine(ts.date(), datetime.time.min)
+
+
+class ColdArchive:
+    def __init__(self, root=COLD_ARCHIVE_DIR, after_days=COLD_AFTER_DAYS, compression=COLD_COMPRESSION):
+        self.root = Path(root)
+        self.after_days = after_days
+        self.compression = None if compression == "none" else compression
+        self.enabled = pa is not None
+        if not self.enabled:
+            print("pyarrow not installed: cold reading archive disabled")
+        self._lock = threading.Lock()   # one compaction at a time
+        self.days_compacted = 0
+        self.rows_compacted = 0
+
+    def path(self, ship_id, day):
+        return self.root / _ship_dir(ship_id) / f"{day:%Y-%m-%d}.arrow"
+
+    def _days(self, ship_id, start, end):
+        """Existing day files that overlap [start, end)."""
+        if not self.enabled:
+            return []
+        ship_dir = self.root / _ship_dir(ship_id)
+        if not ship_dir.is_dir():
+            return []
+        first = _day_start(start) if start else None
+        out = []
+        for f in sorted(ship_dir.glob("*.arrow")):
+            day = datetime.datetime.strptime(f.stem, "%Y-%m-%d")
+            if (first is None or day >= first) and (end is None or day < end):
+                out.append(f)
+        return out
+
+    def covers(self, ship_id, start, end=None):
+        return bool(self._days(ship_id, start, end))
+
+    # --- reads ---
+    def _filtered(self, path, tank_id, start, end, sensor_id):
+        # buffers keep the mapping alive for as long as the table needs them
+        table = pa.ipc.open_file(pa.memory_map(str(path))).read_all()
+        mask = None
+        conds = []
+        if tank_id is not None:
+            conds.append(pc.equal(table["tank_id"], tank_id))
+        if sensor_id is not None:
+            conds.append(pc.equal(table["sensor_id"].cast(pa.string()), sensor_id))
+        if start is not None:
+            conds.append(pc.greater_equal(table["timestamp"], pa.scalar(start, pa.timestamp("us"))))
+        if end is not None:
+            conds.append(pc.less(table["timestamp"], pa.scalar(end, pa.timestamp("us"))))
+        for c in conds:
+            mask = c if mask is None else pc.and_(mask, c)
+        return table if mask is None else table.filter(mask)
+
+    def count(self, ship_id, tank_id=None, start=None, end=None, sensor_id=None):
+        return sum(self._filtered(p, tank_id, start, end, sensor_id).num_rows
+                   for p in self._days(ship_id, start, end))
+
+    def rows(self, columns, ship_id, tank_id=None, start=None, end=None, sensor_id=None):
+        """Tuples of `columns` (names from COLUMNS) for the window, oldest first."""
+        for path in self._days(ship_id, start, end):
+            table = self._filtered(path, tank_id, start, end, sensor_id)
+            if table.num_rows:
+                yield from zip(*(table[c].to_pylist() for c in columns))
+
+    # --- compaction ---
+    def compact(self, now=None):
+        """Move every closed day older than after_days from SQL into day files."""
+        if not self.enabled or self.after_days <= 0:
+            return 0
+        horizon = _day_start(now or datetime.datetime.now()) - datetime.timedelta(days=self.after_days - 1)
+        A = models.ReadingArchive
+        moved = 0
+        with self._lock:
+            while True:
+                db = database.ReadSessionLocal()
+                try:
+                    oldest = db.execute(select(A.ship_id, A.timestamp)
+                                          .where(A.timestamp < horizon)
+                                          .order_by(A.id).limit(1)).first()
+                finally:
+                    db.close()
+                if oldest is None:
+                    break
+                moved += self._compact_day(oldest.ship_id, _day_start(oldest.timestamp))
+        return moved
+
+    def _compact_day(self, ship_id, day):
+        A = models.ReadingArchive
+        end = day + datetime.timedelta(days=1)
+        schema = _schema()
+        ids, batches = [], []
+        db = database.ReadSessionLocal()
+        try:
+            result = db.execute(select(*(getattr(A, c) for c in ("id",) + COLUMNS))
+                                  .where(A.ship_id == ship_id, A.timestamp >= day, A.timestamp < end)
+                                  .order_by(A.timestamp, A.id)
+                                  .execution_options(yield_per=50000))
+            for part in result.partitions():
+                ids.extend(r[0] for r in part)
+                batches.append(pa.record_batch([pa.array([r[i] for r in part], type=field.type)
+                                                for i, field in enumerate(schema)], schema=schema))
+        finally:
+            db.close()
+        if not ids:
+            return 0
+        fresh = pa.Table.from_batches(batches, schema=schema)
+        path = self.path(ship_id, day)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists():
+            # late rows for an already compacted day: rewrite the file merged
+            old = pa.ipc.open_file(pa.memory_map(str(path))).read_all()
+            old = old.filter(pc.invert(pc.is_in(old["id"], value_set=fresh["id"].combine_chunks())))
+            fresh = pa.concat_tables([old, fresh])
+            fresh = fresh.take(pc.sort_indices(fresh, sort_keys=[("timestamp", "ascending")]))
+        # IPC files allow one dictionary per column: unify the per-batch ones
+        fresh = fresh.unify_dictionaries().combine_chunks()
+        tmp = path.with_suffix(".arrow.tmp")
+        options = pa.ipc.IpcWriteOptions(compression=self.compression)
+        with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, fresh.schema, options=options) as writer:
+            writer.write_table(fresh, max_chunksize=64 * 1024)
+        os.replace(tmp, path)
+        # file is durable: now drop exactly the rows it holds, in writer-friendly chunks
+        for i in range(0, len(ids), COLD_DELETE_CHUNK):
+            with database.engine.begin() as conn:
+                conn.execute(delete(A).where(A.id.in_(ids[i:i + COLD_DELETE_CHUNK])))
+            time.sleep(0.01)
+        self.days_compacted += 1
+        self.rows_compacted += len(ids)
+        print(f"Cold archive: moved {len(ids)} readings of {ship_id} {day:%Y-%m-%d} to {path.name}")
+        return len(ids)
+
+    def drop_before(self, cutoff):
+        """Retention for the cold tier: delete day files that end before cutoff."""
+        if not self.enabled or not self.root.is_dir():
+            return 0
+        n = 0
+        for f in self.root.glob("*/*.arrow"):
+            day = datetime.datetime.strptime(f.stem, "%Y-%m-%d")
+            if day + datetime.timedelta(days=1) <= cutoff:
+                f.unlink()
+                n += 1
+        return n
+
+    def stats(self):
+        return {"enabled": self.enabled, "after_days": self.after_days, "dir": str(self.root),
+                "days_compacted": self.days_compacted, "rows_compacted": self.rows_compacted}
+
+
+def merge_rows(cold, hot):
+    """Merge two timestamp-ordered row streams whose first field is the timestamp."""
+    return heapq.merge(cold, hot, key=lambda r: r[0])
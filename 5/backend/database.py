@@ -2,8 +2,10 @@
 # database.py
 from pathlib import Path
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
 # Base dir = folder where database.py lives
 BASE_DIR = Path(__file__).resolve().parent
@@ -14,14 +16,88 @@ DATA_DIR.mkdir(parents=True, exist_ok=True)   # ensure folder exists
 DEFAULT_DB_URL = f"sqlite:///{(DATA_DIR / 'shipyard.db').as_posix()}"
 DATABASE_URL = os.getenv("DATABASE_URL", DEFAULT_DB_URL)
 
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+# --- NEW: SQLite performance profile ---
+# WAL lets API readers run while the ingest writer commits, so they no longer
+# hit "database is locked". SQLITE_PROFILE=default keeps SQLite's stock
+# settings; each pragma can also be overridden on its own (SQLITE_<NAME>).
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "tuned")
+SQLITE_PRAGMAS = {
+    # new files only (must precede the first table); retention.py converts
+    # existing ones and runs incremental_vacuum
+    "auto_vacuum":  os.getenv("SQLITE_AUTO_VACUUM", "INCREMENTAL"),
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous":  os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),   # durable at checkpoints in WAL mode
+    "mmap_size":    int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size":   int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),  # negative = KiB, i.e. 64 MB
+    "temp_store":   os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+}
+SQLITE_READER_POOL = int(os.getenv("SQLITE_READER_POOL", "8"))
+
+def _sqlite_pragmas(reader):
+    if SQLITE_PROFILE == "default":
+        return {"busy_timeout": SQLITE_PRAGMAS["busy_timeout"]}
+    pragmas = dict(SQLITE_PRAGMAS)
+    if reader:
+        # journal_mode is persistent in the file and needs the write lock: writer sets it
+        pragmas.pop("journal_mode")
+        pragmas.pop("auto_vacuum")
+        pragmas["query_only"] = "ON"
+    return pragmas
+
+def _apply_pragmas(target_engine, reader):
+    pragmas = _sqlite_pragmas(reader)
+
+    @event.listens_for(target_engine, "connect")
+    def _on_connect(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        for name, value in pragmas.items():
+            cur.execute(f"PRAGMA {name}={value}")
+        cur.close()
+
 # For SQLite + FastAPI threads:
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
-)
+# `engine` is the single writer. On SQLite it holds exactly one connection, so
+# ingest batches and API writes are serialized in the pool instead of racing
+# for the file lock. `reader_engine` is a pool of query_only connections for
+# API reads, exports and the metadata cache.
+if IS_SQLITE:
+    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False},
+                           poolclass=QueuePool, pool_size=1, max_overflow=0, pool_timeout=60)
+    reader_engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False},
+                                  poolclass=QueuePool, pool_size=SQLITE_READER_POOL, max_overflow=0)
+    _apply_pragmas(engine, reader=False)
+    _apply_pragmas(reader_engine, reader=True)
+else:
+    engine = create_engine(DATABASE_URL)
+    reader_engine = engine
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=reader_engine)
 Base = declarative_base()
 
+# --- NEW: async engine for the read-heavy API endpoints ---
+# Same database as DATABASE_URL, reached through an asyncio driver
+# (aiosqlite / asyncpg), so those endpoints await I/O on the event loop
+# instead of each holding a threadpool worker. Override with ASYNC_DATABASE_URL.
+_ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+def _async_url(url):
+    scheme, sep, rest = url.partition("://")
+    dialect = scheme.split("+", 1)[0]
+    return _ASYNC_DRIVERS[dialect] + sep + rest if dialect in _ASYNC_DRIVERS else url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL)
+
+if IS_SQLITE:
+    # async endpoints only read: same query_only profile as reader_engine
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=AsyncAdaptedQueuePool,
+                                       pool_size=SQLITE_READER_POOL, max_overflow=0)
+    _apply_pragmas(async_engine.sync_engine, reader=True)
+else:
+    async_engine = create_async_engine(ASYNC_DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # from sqlalchemy import create_engine
 # from sqlalchemy.orm import sessionmaker
 # from sqlalchemy.ext.declarative import declarative_base
@@ -0,0 +1,116 @@
+# downsample.py
+#
+# Vectorized (NumPy) reduction of a readings series to at most `max_points`
+# points before it is serialized, so chart payloads stay the same size no
+# matter how long the window is.
+#
+#   lttb   - Largest-Triangle-Three-Buckets; keeps the visually important
+#            points. All four gases are scored together so every kept point
+#            is a real reading.
+#   minmax - per bucket, one point with each gas's minimum and one with its
+#            maximum (an envelope; spikes are never lost). max_points=1
+#            falls back to avg.
+#   avg    - per bucket, the mean of each gas.
+
+import datetime
+import warnings
+
+import numpy as np
+
+GAS_KEYS = ("O2", "CO", "LEL", "H2S")
+METHODS = ("lttb", "minmax", "avg")
+
+
+_EPOCH = datetime.datetime(1970, 1, 1)   # naive, like the stored timestamps
+
+
+def _to_points(ts, vals):
+    out = []
+    for t, row in zip(ts.tolist(), vals.tolist()):
+        point = {"ts": (_EPOCH + datetime.timedelta(seconds=t)).isoformat()}
+        for k, v in zip(GAS_KEYS, row):
+            point[k] = None if v != v else v   # NaN -> None
+        out.append(point)
+    return out
+
+
+def _bucket_starts(n, buckets):
+    """Start index of each of `buckets` near-equal, contiguous slices of range(n)."""
+    return np.unique(np.linspace(0, n, buckets, endpoint=False).astype(np.int64))
+
+
+def _avg(ts, vals, max_points):
+    idx = _bucket_starts(len(ts), max_points)
+    present = ~np.isnan(vals)
+    sums = np.add.reduceat(np.where(present, vals, 0.0), idx, axis=0)
+    counts = np.add.reduceat(present.astype(np.int64), idx, axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.where(counts > 0, sums / counts, np.nan)
+    sizes = np.diff(np.append(idx, len(ts)))
+    t_mean = np.add.reduceat(ts, idx) / sizes
+    return t_mean, means
+
+
+def _minmax(ts, vals, max_points):
+    if max_points < 2:   # an envelope needs two points per bucket
+        return _avg(ts, vals, max_points)
+    idx = _bucket_starts(len(ts), max_points // 2)
+    ends = np.append(idx[1:], len(ts)) - 1
+    with np.errstate(invalid="ignore"):
+        mins = np.fmin.reduceat(vals, idx, axis=0)
+        maxs = np.fmax.reduceat(vals, idx, axis=0)
+    # interleave: (bucket start, per-gas min), (bucket end, per-gas max)
+    out_ts = np.empty(len(idx) * 2)
+    out_ts[0::2], out_ts[1::2] = ts[idx], ts[ends]
+    out_vals = np.empty((len(idx) * 2, vals.shape[1]))
+    out_vals[0::2], out_vals[1::2] = mins, maxs
+    return out_ts, out_vals
+
+
+def _lttb(ts, vals, max_points):
+    n = len(ts)
+    if max_points < 3:
+        keep = np.array([0, n - 1][:max_points])
+        return ts[keep], vals[keep]
+    # normalize each gas to [0, 1] so they contribute comparably to the area score
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)   # all-NaN gas column
+        lo, hi = np.nanmin(vals, axis=0), np.nanmax(vals, axis=0)
+    span = np.where(hi > lo, hi - lo, 1.0)
+    y = np.nan_to_num((vals - lo) / span)
+    x = (ts - ts[0]) / max(ts[-1] - ts[0], 1e-9)
+
+    # interior buckets over points 1..n-2; first and last points are always kept
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    keep = np.empty(max_points, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(max_points - 2):
+        lo_i, hi_i = edges[i], max(edges[i + 1], edges[i] + 1)
+        # average of the next bucket (or the last point) is the third vertex
+        nlo, nhi = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        if nhi <= nlo:
+            nlo, nhi = n - 1, n
+        cx, cy = x[nlo:nhi].mean(), y[nlo:nhi].mean(axis=0)
+        bx, by = x[lo_i:hi_i], y[lo_i:hi_i]
+        area = np.abs((x[a] - cx) * (by - y[a]) - (x[a] - bx)[:, None] * (cy - y[a])).sum(axis=1)
+        a = lo_i + int(np.argmax(area))
+        keep[i + 1] = a
+    return ts[keep], vals[keep]
+
+
+def downsample(rows, max_points, method="lttb"):
+    """
+    Reduce (timestamp, O2, CO, LEL, H2S) tuples, in time order, to at most
+    max_points {"ts", "O2", "CO", "LEL", "H2S"} dicts.
+    """
+    if method not in METHODS:
+        raise ValueError(f"unknown downsampling method {method!r}")
+    if not rows:
+        return []
+    ts = np.array([(r[0] - _EPOCH).total_seconds() for r in rows], dtype=np.float64)
+    vals = np.array([r[1:] for r in rows], dtype=np.float64)   # None -> NaN
+    if len(rows) <= max_points:
+        return _to_points(ts, vals)
+    reducer = {"lttb": _lttb, "minmax": _minmax, "avg": _avg}[method]
+    return _to_points(*reducer(ts, vals, max_points))
@@ -0,0 +1,87 @@
+# exports.py
+#
+# Constant-memory CSV / NDJSON exports. Rows are pulled from a server-side
+# cursor (`yield_per`) inside the response generator, encoded into ~64 KB
+# chunks and optionally gzip-compressed on the fly, so a multi-month export
+# never sits in memory as a whole.
+
+import csv
+import heapq
+import io
+import json
+import zlib
+
+import database
+
+EXPORT_CHUNK_BYTES = 64 * 1024
+EXPORT_YIELD_PER = 2000
+
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def _cell(v):
+    return v.isoformat() if hasattr(v, "isoformat") else v
+
+
+def _encode(rows, columns, fmt):
+    """Yield text lines for rows (tuples aligned with columns)."""
+    if fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow([_cell(v) for v in row])
+            if buf.tell() >= EXPORT_CHUNK_BYTES:
+                yield buf.getvalue()
+                buf.seek(0); buf.truncate()
+        yield buf.getvalue()
+    else:
+        lines = []
+        size = 0
+        for row in rows:
+            line = json.dumps({c: _cell(v) for c, v in zip(columns, row)}) + "\n"
+            lines.append(line)
+            size += len(line)
+            if size >= EXPORT_CHUNK_BYTES:
+                yield "".join(lines)
+                lines, size = [], 0
+        yield "".join(lines)
+
+
+def _gzip(chunks):
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)   # wbits=31 -> gzip container
+    for chunk in chunks:
+        out = z.compress(chunk)
+        if out:
+            yield out
+    yield z.flush()
+
+
+def stream_query(stmt, columns, fmt="csv", gzip=False, merge_with=None):
+    """
+    Generator of bytes for a SELECT of plain columns. Opens its own session,
+    because a request-scoped one is closed before the body is streamed.
+    merge_with: optional iterable of extra rows (e.g. cold archive rows), in
+    the same column order and sorted by the first column, merged in order.
+    """
+    def rows():
+        db = database.ReadSessionLocal()
+        try:
+            result = db.execute(stmt.execution_options(yield_per=EXPORT_YIELD_PER))
+            for row in result:
+                yield row
+        finally:
+            db.close()
+
+    source = rows() if merge_with is None else heapq.merge(merge_with, rows(), key=lambda r: r[0])
+    chunks = (text.encode("utf-8") for text in _encode(source, columns, fmt) if text)
+    return _gzip(chunks) if gzip else chunks
+
+
+def response_headers(filename, fmt, gzip=False):
+    name = f"{filename}.{fmt}" + (".gz" if gzip else "")
+    headers = {"Content-Disposition": f'attachment; filename="{name}"'}
+    media_type = MEDIA_TYPES[fmt]
+    if gzip:
+        media_type = "application/gzip"
+    return media_type, headers
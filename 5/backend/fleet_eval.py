@@ -0,0 +1,101 @@
+# fleet_eval.py
+#
+# Vectorized (NumPy) twin of main._agg_from_sensors + main.evaluate_state for
+# fleet-wide recomputation: every live sensor reading goes into one float
+# matrix (one row per sensor, rows grouped by tank) and every tank's
+# thresholds into another, and display/worst aggregates and
+# Danger/Warning/OK states for all tanks come out of a single pass.
+#
+# Results are identical to the scalar functions: aggregates are the original
+# reading objects (so 5 stays 5, not 5.0; on ties the first sensor in dict
+# order wins, as with max()/min()), missing gases are None, and comparisons
+# against missing values are false. NaN readings are treated as missing.
+
+import numpy as np
+
+GAS_KEYS = ("O2", "CO", "LEL", "H2S")
+# threshold matrix columns: danger limits, then warning limits, in GAS_KEYS order
+THRESHOLD_KEYS = ("danger_o2_low", "danger_co_high", "danger_lel_high", "danger_h2s_high",
+                  "warn_o2_low", "warn_co_high", "warn_lel_high", "warn_h2s_high")
+STATES = ("OK", "Warning", "Danger")
+
+
+class FleetArrays:
+    """Live readings and thresholds of many tanks in contiguous arrays."""
+
+    def __init__(self, tanks, thresholds_for):
+        # tanks: iterable of (key, {sensor_id: {"O2": .., "CO": .., "LEL": .., "H2S": ..}})
+        # thresholds_for(key) -> thresholds dict (THRESHOLD_KEYS)
+        self.keys = []
+        rows, counts = [], []
+        for key, sensors in tanks:
+            rows.extend((v.get("O2"), v.get("CO"), v.get("LEL"), v.get("H2S")) for v in sensors.values())
+            counts.append(len(sensors))
+            self.keys.append(key)
+        self.objects = np.empty((len(rows), len(GAS_KEYS)), dtype=object)   # original values, for output
+        if rows:
+            self.objects[:] = rows
+        self.values = _to_float(self.objects)                                # NaN = missing
+        self.tank_of = np.repeat(np.arange(len(counts)), counts)             # non-decreasing
+        # most tanks share one thresholds dict (the defaults): build each distinct row once
+        distinct, index = {}, []
+        for T in map(thresholds_for, self.keys):
+            index.append(distinct.setdefault(id(T), (len(distinct), T))[0])
+        limits = np.array([[T[k] for k in THRESHOLD_KEYS] for _, T in distinct.values()],
+                          dtype=np.float64).reshape(-1, len(THRESHOLD_KEYS))
+        self.thresholds = limits[np.array(index, dtype=np.int64)]
+
+    def __len__(self):
+        return len(self.keys)
+
+
+def _to_float(objects):
+    out = np.full(objects.shape, np.nan)
+    present = ~np.equal(objects, None)
+    out[present] = objects[present].astype(np.float64)
+    return out
+
+
+def _pick(values, objects, tank_of, n_tanks, ufunc):
+    """Per tank, the object at the ufunc (maximum/minimum) of its non-missing values; first on ties."""
+    out = np.full(n_tanks, None, dtype=object)
+    has = ~np.isnan(values)
+    if not has.any():
+        return out
+    v, t, o = values[has], tank_of[has], objects[has]
+    starts = np.flatnonzero(np.r_[True, t[1:] != t[:-1]])
+    best = ufunc.reduceat(v, starts)
+    hit = np.flatnonzero(v == np.repeat(best, np.diff(np.r_[starts, len(v)])))
+    first = hit[np.r_[True, t[hit][1:] != t[hit][:-1]]]
+    out[t[first]] = o[first]
+    return out
+
+
+def aggregate(arr):
+    """(display, worst) object matrices, one row per tank, columns in GAS_KEYS order."""
+    n = len(arr)
+    display = np.empty((n, len(GAS_KEYS)), dtype=object)
+    worst = np.empty((n, len(GAS_KEYS)), dtype=object)
+    for j, gas in enumerate(GAS_KEYS):
+        hi = _pick(arr.values[:, j], arr.objects[:, j], arr.tank_of, n, np.maximum)
+        display[:, j] = hi
+        # lower O2 is worse; higher is worse for everything else
+        worst[:, j] = _pick(arr.values[:, j], arr.objects[:, j], arr.tank_of, n, np.minimum) if gas == "O2" else hi
+    return display, worst
+
+
+def evaluate(worst, thresholds):
+    """State index (into STATES) per row of worst [O2, CO, LEL, H2S] floats (NaN = missing)."""
+    def breached(limits):
+        return (worst[:, 0] <= limits[:, 0]) | (worst[:, 1:] >= limits[:, 1:]).any(axis=1)
+    danger = breached(thresholds[:, :4])
+    warning = breached(thresholds[:, 4:])
+    return np.where(danger, 2, np.where(warning, 1, 0))
+
+
+def evaluate_fleet(arr):
+    """[(display, worst, state)] per tank, aligned with arr.keys."""
+    display, worst = aggregate(arr)
+    states = evaluate(_to_float(worst), arr.thresholds)
+    return [(dict(zip(GAS_KEYS, d)), dict(zip(GAS_KEYS, w)), STATES[s])
+            for d, w, s in zip(display.tolist(), worst.tolist(), states.tolist())]
@@ -0,0 +1,112 @@
+# ingest.py
+#
+# Queue-backed MQTT ingest. The paho network thread only decodes the message
+# and calls `submit()`; a single writer thread drains the queue in
+# micro-batches (N messages or T milliseconds, whichever comes first) and
+# hands each batch to a callback that commits it in one transaction.
+
+import os
+import queue
+import threading
+import time
+
+# --- Tunables (env overrides) ---
+INGEST_QUEUE_MAX = int(os.getenv("INGEST_QUEUE_MAX", "10000"))   # max queued messages before dropping
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "200"))   # flush after this many messages...
+INGEST_FLUSH_MS = int(os.getenv("INGEST_FLUSH_MS", "250"))       # ...or after this many ms, whichever first
+
+
+class IngestPipeline:
+    """Bounded queue + single writer thread that flushes micro-batches."""
+
+    def __init__(self, handle_batch, maxsize=INGEST_QUEUE_MAX,
+                 batch_size=INGEST_BATCH_SIZE, flush_ms=INGEST_FLUSH_MS):
+        self.handle_batch = handle_batch
+        self.batch_size = max(1, batch_size)
+        self.flush_sec = max(0, flush_ms) / 1000.0
+        self.q = queue.Queue(maxsize=maxsize)
+        self._stop = threading.Event()
+        self._thread = None
+        # counters (written by one thread each, read by the stats endpoint)
+        self.enqueued = 0
+        self.dropped = 0
+        self.batches = 0
+        self.written = 0
+        self.failed = 0
+        self.last_batch_size = 0
+        self.last_flush_ms = 0.0
+
+    def submit(self, item):
+        """Non-blocking enqueue. Returns False (and counts a drop) when full."""
+        try:
+            self.q.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stop the writer after flushing whatever is already queued."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _next_batch(self):
+        # block (briefly) for the first item so an idle pipeline doesn't spin
+        try:
+            first = self.q.get(timeout=0.5)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.flush_sec
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self.q.get_nowait())
+                else:
+                    batch.append(self.q.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch):
+        t0 = time.perf_counter()
+        try:
+            self.handle_batch(batch)
+            self.written += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            print(f"Error writing ingest batch of {len(batch)}: {e}")
+        self.batches += 1
+        self.last_batch_size = len(batch)
+        self.last_flush_ms = (time.perf_counter() - t0) * 1000.0
+
+    def _run(self):
+        while not (self._stop.is_set() and self.q.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._flush(batch)
+
+    def stats(self):
+        return {
+            "queue_depth": self.q.qsize(),
+            "queue_max": self.q.maxsize,
+            "batch_size": self.batch_size,
+            "flush_ms": int(self.flush_sec * 1000),
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "written": self.written,
+            "failed": self.failed,
+            "last_batch_size": self.last_batch_size,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+        }
@@ -0,0 +1,213 @@
+# ingest_pool.py
+#
+# Multi-process ingest. With INGEST_WORKERS > 0 the ingest leader no longer
+# decodes and writes MQTT messages itself: it starts that many consumer
+# processes, each running the normal pipeline (on_message -> IngestPipeline
+# -> _write_batch) for its share of the ships, so decoding, live aggregation
+# and alarm evaluation scale with cores instead of sharing one GIL.
+#
+#   INGEST_SHARDING=dispatch  the leader keeps its one MQTT subscription and
+#                             routes each raw message to worker
+#                             jump_hash(ship_id) over a pipe (any broker)
+#   INGEST_SHARDING=shared    every worker subscribes with an MQTT v5 shared
+#                             subscription ($share/<group>/ship/+/sensors) and
+#                             the broker balances the load
+#
+# In dispatch mode a ship always maps to the same worker, so its messages are
+# applied in arrival order. Shared subscriptions only keep that guarantee
+# with a broker strategy that pins a topic to one member (e.g. EMQX
+# hash_topic); round-robin brokers may interleave a ship across workers.
+#
+# Workers publish live payloads and events to the shared state: directly when
+# it is Redis, otherwise through the leader, which applies them to its
+# in-process state and forwards cache invalidations back down.
+
+import hashlib
+import multiprocessing
+import os
+import queue
+import threading
+import types
+
+import ingest
+import shared_state
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "0"))               # 0 = ingest in the leader process
+INGEST_SHARDING = os.getenv("INGEST_SHARDING", "dispatch")           # dispatch | shared
+INGEST_SHARE_GROUP = os.getenv("INGEST_SHARE_GROUP", "ingest")
+INGEST_POOL_STATS_SEC = float(os.getenv("INGEST_POOL_STATS_SEC", "2"))
+
+
+def jump_hash(key, buckets):
+    """Jump consistent hash (Lamping & Veach): growing the pool moves only ~1/n of the ships."""
+    k = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little")
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        k = (k * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * ((1 << 31) / ((k >> 33) + 1)))
+    return b
+
+
+class IngestPool:
+    """Leader-side handle on the consumer processes."""
+
+    def __init__(self, state, workers=INGEST_WORKERS, sharding=INGEST_SHARDING):
+        self.state = state            # the leader's STATE
+        self.workers = workers
+        self.sharding = sharding
+        self._ctx = multiprocessing.get_context("spawn")
+        self._procs, self._inboxes = [], []
+        self._outbox = None
+        self._drain_thread = None
+        self._route = {}              # ship_id -> worker index
+        # stats
+        self.dispatched = 0
+        self.dropped = 0
+        self.worker_stats = {}
+
+    @property
+    def running(self):
+        return bool(self._procs)
+
+    def start(self):
+        if self.running or self.workers <= 0:
+            return
+        forward = not self.state.shared
+        self._outbox = self._ctx.Queue()
+        for i in range(self.workers):
+            inbox = self._ctx.Queue(maxsize=ingest.INGEST_QUEUE_MAX)
+            p = self._ctx.Process(target=_consumer_main, name=f"ingest-{i}", daemon=True,
+                                  args=(i, self.sharding, inbox, self._outbox, forward))
+            p.start()
+            self._procs.append(p)
+            self._inboxes.append(inbox)
+        self._drain_thread = threading.Thread(target=self._drain, name="ingest-pool-drain", daemon=True)
+        self._drain_thread.start()
+        print(f"Ingest pool: {self.workers} workers, {self.sharding} sharding")
+
+    def stop(self, timeout=10.0):
+        """Workers flush their queues and exit; then the leader applies what they sent last."""
+        if not self.running:
+            return
+        for inbox in self._inboxes:
+            inbox.put(("stop",))
+        for p in self._procs:
+            p.join(timeout)
+            if p.is_alive():
+                print(f"Ingest pool: {p.name} did not stop, terminating")
+                p.terminate()
+        self._outbox.put(None)
+        self._drain_thread.join(timeout)
+        self._procs, self._inboxes = [], []
+
+    # --- leader -> workers ---
+    def dispatch(self, topic, payload):
+        """Route one raw MQTT message to its ship's worker. Non-blocking; False when dropped."""
+        parts = topic.split("/")
+        if len(parts) < 3:
+            return False
+        i = self._route.get(parts[1])
+        if i is None:
+            i = self._route[parts[1]] = jump_hash(parts[1], self.workers)
+        try:
+            self._inboxes[i].put_nowait(("msg", topic, payload))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.dispatched += 1
+        return True
+
+    def forward(self, kind, ship_id=None, tank_id=None):
+        """Cache invalidation for every worker (only needed when the state is not Redis)."""
+        for inbox in self._inboxes:
+            try:
+                inbox.put(("event", kind, ship_id, tank_id), timeout=5)
+            except queue.Full:
+                print(f"Ingest pool: could not forward '{kind}' event, worker queue full")
+
+    # --- workers -> leader ---
+    def _drain(self):
+        while True:
+            op = self._outbox.get()
+            if op is None:
+                break
+            try:
+                if op[0] == "stats":
+                    self.worker_stats[op[1]] = op[2]
+                elif op[0] == "put_live":
+                    self.state.put_live(*op[1:])
+                elif op[0] == "remove_live":
+                    self.state.remove_live(*op[1:])
+                elif op[0] == "publish":
+                    _, kind, ship_id, tank_id, data = op
+                    if kind == "live":
+                        # the stored copy carries the seq assigned by put_live above
+                        data = self.state.get_live(ship_id, tank_id) or data
+                    self.state.publish(kind, ship_id, tank_id, data)
+            except Exception as e:
+                print(f"Ingest pool: failed to apply worker update: {e}")
+
+    def stats(self):
+        per_worker = [self.worker_stats.get(i) for i in range(self.workers)]
+        total = lambda k: sum((w or {}).get(k, 0) for w in per_worker)
+        return {
+            "workers": self.workers,
+            "sharding": self.sharding,
+            "running": self.running,
+            "dispatched": self.dispatched,
+            "dropped": self.dropped + total("dropped"),
+            "written": total("written"),
+            "failed": total("failed"),
+            "per_worker": per_worker,
+        }
+
+
+# --- worker process ---
+def _worker_stats(main):
+    return {**main.INGEST.stats(), "pid": os.getpid(), "live_tanks": len(main.LIVE_CACHE)}
+
+
+def _report(main, index, outbox, stop):
+    while not stop.wait(INGEST_POOL_STATS_SEC):
+        outbox.put(("stats", index, _worker_stats(main)))
+
+
+def _shared_client(main, index):
+    import paho.mqtt.client as mqtt
+    topic = f"$share/{INGEST_SHARE_GROUP}/{main.TOPIC}"
+    client = mqtt.Client(client_id=f"{INGEST_SHARE_GROUP}-{index}-{os.getpid()}", protocol=mqtt.MQTTv5)
+    client.on_connect = lambda c, userdata, flags, rc, properties=None: c.subscribe(topic)
+    client.on_message = main.on_message
+    client.connect(main.MQTT_BROKER, main.MQTT_PORT, 60)
+    client.loop_start()
+    return client
+
+
+def _consumer_main(index, sharding, inbox, outbox, forward):
+    import main   # same pipeline, caches and write path as single-process ingest
+    if forward:
+        main.STATE = shared_state.ForwardState(outbox)
+    main.STATE.start()
+    main.INGEST.start()
+    threading.Thread(target=main._live_sweeper, name="live-sweep", daemon=True).start()
+    client = _shared_client(main, index) if sharding == "shared" else None
+    stop = threading.Event()
+    threading.Thread(target=_report, args=(main, index, outbox, stop), daemon=True).start()
+    while True:
+        op = inbox.get()
+        if op[0] == "msg":
+            main.on_message(None, None, types.SimpleNamespace(topic=op[1], payload=op[2]))
+        elif op[0] == "event":
+            main._on_state_event(op[1], op[2], op[3], None)
+        elif op[0] == "stop":
+            break
+    if client is not None:
+        client.disconnect()
+        client.loop_stop()
+    main.INGEST.stop()
+    main._LIVE_SWEEP_STOP.set()
+    main._flush_ship_live(force=True)
+    stop.set()
+    outbox.put(("stats", index, _worker_stats(main)))
+    main.STATE.stop()
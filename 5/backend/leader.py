@@ -0,0 +1,154 @@
+# leader.py
+#
+# Exactly one process per deployment runs ingest (MQTT subscription, writer
+# thread, retention, live-cache sweep); every other uvicorn worker or replica
+# only serves the API from the shared live state (shared_state.py).
+#
+#   REDIS_URL set   -> RedisLock: SET NX PX lease, renewed every
+#                      LEADER_RETRY_SEC; a crashed leader is replaced once
+#                      its LEADER_TTL_SEC lease runs out (works across hosts)
+#   REDIS_URL unset -> FileLock: flock on LEADER_LOCK_FILE, released by the
+#                      OS when the holder exits (workers on one host only)
+
+import os
+import threading
+import uuid
+
+import database
+
+try:
+    import fcntl
+except ImportError:   # Windows: no flock, single-process deployments only
+    fcntl = None
+
+REDIS_URL = os.getenv("REDIS_URL")
+LEADER_KEY = os.getenv("LEADER_KEY", os.getenv("LIVE_STATE_PREFIX", "maritime:") + "ingest-leader")
+LEADER_TTL_SEC = float(os.getenv("LEADER_TTL_SEC", "15"))
+LEADER_RETRY_SEC = float(os.getenv("LEADER_RETRY_SEC", "5"))
+LEADER_LOCK_FILE = os.getenv("LEADER_LOCK_FILE", str(database.DATA_DIR / "ingest.leader.lock"))
+
+
+class FileLock:
+    def __init__(self, path=LEADER_LOCK_FILE):
+        self.path = path
+        self._fh = None
+
+    def acquire(self):
+        if fcntl is None:
+            return True
+        fh = open(self.path, "a")
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            fh.close()
+            return False
+        self._fh = fh
+        return True
+
+    def renew(self):
+        return True   # held until released or the process dies
+
+    def release(self):
+        if self._fh is not None:
+            self._fh.close()   # closing drops the flock
+            self._fh = None
+
+
+# compare-and-act on our own token, so a lease that already expired and was
+# taken by another process is never extended or deleted by us
+_RENEW = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) end return 0"
+_RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+
+class RedisLock:
+    def __init__(self, url=REDIS_URL, key=LEADER_KEY, ttl_sec=LEADER_TTL_SEC, client=None):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.r = client
+        self.key = key
+        self.ttl_ms = int(ttl_sec * 1000)
+        self.token = uuid.uuid4().hex
+
+    def acquire(self):
+        return bool(self.r.set(self.key, self.token, nx=True, px=self.ttl_ms))
+
+    def renew(self):
+        return bool(self.r.eval(_RENEW, 1, self.key, self.token, self.ttl_ms))
+
+    def release(self):
+        self.r.eval(_RELEASE, 1, self.key, self.token)
+
+
+class LeaderElection:
+    """
+    Campaigns for the lock in a daemon thread. on_elect() runs when this
+    process becomes leader, on_demote() when it loses the lease or stops.
+    """
+
+    def __init__(self, lock, on_elect, on_demote, retry_sec=LEADER_RETRY_SEC):
+        self.lock = lock
+        self.on_elect = on_elect
+        self.on_demote = on_demote
+        self.retry_sec = retry_sec
+        self.is_leader = False
+        self.elections = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        # first attempt inline, so a lone process has ingest running when startup returns
+        self._tick()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="leader-election", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        if self.is_leader:
+            self._demote()
+            self.lock.release()
+
+    def _run(self):
+        while not self._stop.wait(self.retry_sec):
+            try:
+                self._tick()
+            except Exception as e:
+                # lock backend unreachable: we cannot prove we still hold the lease
+                print(f"Leader election failed: {e}")
+                if self.is_leader:
+                    self._demote()
+
+    def _tick(self):
+        if self.is_leader:
+            if not self.lock.renew():
+                print("Lost ingest leadership")
+                self._demote()
+        elif self.lock.acquire():
+            print(f"Elected ingest leader (pid {os.getpid()})")
+            self.is_leader = True
+            self.elections += 1
+            self.on_elect()
+
+    def _demote(self):
+        self.is_leader = False
+        try:
+            self.on_demote()
+        except Exception as e:
+            print(f"Ingest step-down failed: {e}")
+
+    def stats(self):
+        return {"is_leader": self.is_leader, "pid": os.getpid(), "elections": self.elections,
+                "lock": type(self.lock).__name__}
+
+
+def from_env(on_elect, on_demote):
+    lock = None
+    if REDIS_URL:
+        try:
+            lock = RedisLock()
+        except ImportError:
+            print("REDIS_URL is set but the redis package is not installed: using a file lock for ingest leadership")
+    return LeaderElection(lock or FileLock(), on_elect, on_demote)
@@ -0,0 +1,175 @@
+# live_cache.py
+#
+# Latest reading per (ship, tank, sensor), shared by the ingest writer thread
+# and the API/SSE readers. Tanks are striped over LIVE_CACHE_SHARDS locks by
+# ship id, so one ship's tanks share a lock and unrelated ships never contend.
+# Each sensor is a __slots__ record rather than a nested dict.
+#
+# Sensors that have not reported for LIVE_SENSOR_TTL_SEC drop out of their
+# tank's aggregates; a tank with no live sensors left is removed. The cache
+# holds at most LIVE_CACHE_MAX_SENSORS sensor records; past that, the least
+# recently updated tanks of the shard being written are evicted.
+#
+# Readings may carry the device sample time as "ts"; a reading older than the
+# sample already held for that sensor (late delivery) never replaces it.
+
+import datetime
+import os
+import threading
+import time
+
+LIVE_CACHE_SHARDS = int(os.getenv("LIVE_CACHE_SHARDS", "16"))
+LIVE_SENSOR_TTL_SEC = float(os.getenv("LIVE_SENSOR_TTL_SEC", "300"))      # 0 = never expire
+LIVE_CACHE_MAX_SENSORS = int(os.getenv("LIVE_CACHE_MAX_SENSORS", "50000"))
+
+
+class SensorRecord:
+    __slots__ = ("o2", "co", "lel", "h2s", "seen", "sampled_at")
+
+    def __init__(self, o2, co, lel, h2s, seen, sampled_at=None):
+        self.o2, self.co, self.lel, self.h2s, self.seen = o2, co, lel, h2s, seen
+        self.sampled_at = sampled_at   # device timestamp, when the payload had one
+
+    def as_dict(self):
+        return {"O2": self.o2, "CO": self.co, "LEL": self.lel, "H2S": self.h2s}
+
+
+class TankLive:
+    __slots__ = ("sensors", "updated_at", "display", "worst")
+
+    def __init__(self):
+        self.sensors = {}          # sensor_id -> SensorRecord
+        self.updated_at = None     # wall clock, for clients
+        self.display = None        # aggregate dicts from the aggregate callback
+        self.worst = None
+
+    def view(self):
+        """JSON-ready copy in the shape get_tank_live has always returned."""
+        return {
+            "updated_at": self.updated_at,
+            "sensors": {sid: rec.as_dict() for sid, rec in self.sensors.items()},
+            "aggregates": {"display": dict(self.display), "worst": dict(self.worst)},
+        }
+
+
+class _Shard:
+    __slots__ = ("lock", "tanks", "sensors")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tanks = {}            # (ship_id, tank_id) -> TankLive, least recently updated first
+        self.sensors = 0           # sensor records in this shard
+
+
+class LiveCache:
+    def __init__(self, aggregate, shards=LIVE_CACHE_SHARDS, ttl_sec=LIVE_SENSOR_TTL_SEC,
+                 max_sensors=LIVE_CACHE_MAX_SENSORS):
+        self.aggregate = aggregate     # {sensor_id: {"O2",..}} -> (display, worst)
+        self.ttl_sec = ttl_sec
+        self._shards = [_Shard() for _ in range(max(1, shards))]
+        self._shard_cap = max(1, max_sensors // len(self._shards))
+        self.expired_sensors = 0
+        self.evicted_tanks = 0
+
+    def _shard(self, ship_id):
+        return self._shards[hash(ship_id) % len(self._shards)]
+
+    def _reaggregate(self, tank):
+        tank.display, tank.worst = self.aggregate({sid: rec.as_dict() for sid, rec in tank.sensors.items()})
+
+    def _drop_stale(self, shard, tank, now):
+        if self.ttl_sec <= 0:
+            return 0
+        stale = [sid for sid, rec in tank.sensors.items() if now - rec.seen > self.ttl_sec]
+        for sid in stale:
+            del tank.sensors[sid]
+        shard.sensors -= len(stale)
+        self.expired_sensors += len(stale)
+        return len(stale)
+
+    # --- writer side ---
+    def update(self, ship_id, tank_id, readings, now=None):
+        """Store a message's readings; returns the tank's (display, worst) aggregates."""
+        now = time.monotonic() if now is None else now
+        key = (ship_id, tank_id)
+        shard = self._shard(ship_id)
+        with shard.lock:
+            tank = shard.tanks.pop(key, None) or TankLive()
+            shard.tanks[key] = tank            # re-insert: most recently updated last
+            for r in readings:
+                sid = r.get("sensor_id")
+                if not sid:
+                    continue
+                rec = tank.sensors.get(sid)
+                ts = r.get("ts")
+                if rec is None:
+                    tank.sensors[sid] = SensorRecord(r.get("O2"), r.get("CO"), r.get("LEL"), r.get("H2S"), now, ts)
+                    shard.sensors += 1
+                elif ts is None or rec.sampled_at is None or ts >= rec.sampled_at:
+                    rec.o2, rec.co, rec.lel, rec.h2s, rec.seen = r.get("O2"), r.get("CO"), r.get("LEL"), r.get("H2S"), now
+                    rec.sampled_at = ts
+            self._drop_stale(shard, tank, now)
+            self._reaggregate(tank)
+            tank.updated_at = datetime.datetime.now()
+            display, worst = dict(tank.display), dict(tank.worst)
+            # hard cap: evict least recently updated tanks (never the one just written)
+            while shard.sensors > self._shard_cap and len(shard.tanks) > 1:
+                old_key = next(iter(shard.tanks))
+                shard.sensors -= len(shard.tanks.pop(old_key).sensors)
+                self.evicted_tanks += 1
+        return display, worst
+
+    def expire(self, now=None):
+        """
+        Drop sensors past their TTL. Returns (changed, removed): tanks whose
+        aggregates changed but still have live sensors, and tanks now empty.
+        """
+        now = time.monotonic() if now is None else now
+        changed, removed = [], []
+        if self.ttl_sec <= 0:
+            return changed, removed
+        for shard in self._shards:
+            with shard.lock:
+                for key, tank in list(shard.tanks.items()):
+                    dropped = self._drop_stale(shard, tank, now)
+                    if tank.sensors:
+                        if dropped:
+                            self._reaggregate(tank)
+                            changed.append(key)
+                    else:
+                        del shard.tanks[key]
+                        removed.append(key)
+        return changed, removed
+
+    # --- reader side ---
+    def get(self, ship_id, tank_id):
+        shard = self._shard(ship_id)
+        with shard.lock:
+            tank = shard.tanks.get((ship_id, tank_id))
+            return tank.view() if tank else None
+
+    def items(self):
+        """[((ship_id, tank_id), view)] for every tank, shard by shard."""
+        out = []
+        for shard in self._shards:
+            with shard.lock:
+                out.extend((key, tank.view()) for key, tank in shard.tanks.items())
+        return out
+
+    def __contains__(self, key):
+        shard = self._shard(key[0])
+        with shard.lock:
+            return key in shard.tanks
+
+    def __len__(self):
+        return sum(len(s.tanks) for s in self._shards)
+
+    def stats(self):
+        return {
+            "tanks": len(self),
+            "sensors": sum(s.sensors for s in self._shards),
+            "max_sensors": self._shard_cap * len(self._shards),
+            "ttl_sec": self.ttl_sec,
+            "expired_sensors": self.expired_sensors,
+            "evicted_tanks": self.evicted_tanks,
+        }
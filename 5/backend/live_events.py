@@ -0,0 +1,77 @@
+# live_events.py
+#
+# Fan-out of live tank updates and alarm transitions to streaming (SSE)
+# clients. The ingest writer thread calls `publish()`; each connected client
+# owns a small asyncio queue on the server's event loop and only receives
+# events matching its ship/tank filter.
+
+import asyncio
+import json
+import os
+import threading
+
+STREAM_CLIENT_QUEUE = int(os.getenv("STREAM_CLIENT_QUEUE", "256"))   # per-client backlog before we resync
+STREAM_KEEPALIVE_SEC = float(os.getenv("STREAM_KEEPALIVE_SEC", "15"))
+
+
+def sse_frame(event, data):
+    """Format one Server-Sent Events frame (data is JSON-encoded)."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class Subscriber:
+    def __init__(self, loop, ship_ids=None, tank_ids=None, maxsize=STREAM_CLIENT_QUEUE):
+        self.loop = loop
+        self.ship_ids = set(ship_ids) if ship_ids else None
+        self.tank_ids = set(tank_ids) if tank_ids else None
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        # set when we had to drop events for a slow client; the stream then
+        # sends a fresh snapshot instead of the missed deltas
+        self.lagged = False
+
+    def wants(self, ship_id, tank_id):
+        if self.ship_ids is not None and ship_id not in self.ship_ids:
+            return False
+        if self.tank_ids is not None and tank_id not in self.tank_ids:
+            return False
+        return True
+
+    def _offer(self, frame):
+        # runs on the event loop
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.lagged = True
+
+
+class EventHub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs = set()
+
+    def subscribe(self, loop, ship_ids=None, tank_ids=None):
+        sub = Subscriber(loop, ship_ids, tank_ids)
+        with self._lock:
+            self._subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subs.discard(sub)
+
+    def client_count(self):
+        return len(self._subs)
+
+    def publish(self, event, ship_id, tank_id, data):
+        """Thread-safe: encode once, hand the frame to every matching client."""
+        with self._lock:
+            targets = [s for s in self._subs if s.wants(ship_id, tank_id)]
+        if not targets:
+            return
+        frame = sse_frame(event, data)
+        for sub in targets:
+            try:
+                sub.loop.call_soon_threadsafe(sub._offer, frame)
+            except RuntimeError:
+                # loop already closed (client went away during shutdown)
+                self.unsubscribe(sub)
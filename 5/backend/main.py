@@ -1,37 +1,64 @@
 # main.py
 
 import datetime
-from fastapi import FastAPI, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+import asyncio
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from pydantic import TypeAdapter
 from fastapi.middleware.cors import CORSMiddleware
 import models, database
+import ingest, ingest_pool, leader, payload_codec, shared_state
+import meta_cache, live_cache, live_events, fleet_eval, ship_live
+import readings_store, rollups, downsample, exports, retention, cold_archive, migrations
 import json 
 import threading
 import paho.mqtt.client as mqtt
-import os, io, csv
-from fastapi.responses import StreamingResponse, JSONResponse
+import os, uuid
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 
 
-# --- In-memory live cache for quick UI reads (survives process lifetime) ---
-# LIVE_CACHE[(ship_id, tank_id)] = {
+# --- In-memory live cache for quick UI reads: see LIVE_CACHE below _agg_from_sensors ---
+# LIVE_CACHE.get(ship_id, tank_id) -> {
 #   "updated_at": datetime,
-#   "sensors": { "<sensor_id>": {"O2": float|None, "CO": float|None, "LEL": float|None} },
+#   "sensors": { "<sensor_id>": {"O2": float|None, "CO": float|None, "LEL": float|None, "H2S": float|None} },
 #   "aggregates": {
-#       "display": {"O2": float|None, "CO": float|None, "LEL": float|None},
-#       "worst":   {"O2": float|None, "CO": float|None, "LEL": float|None}
+#       "display": {"O2": float|None, "CO": float|None, "LEL": float|None, "H2S": float|None},
+#       "worst":   {"O2": float|None, "CO": float|None, "LEL": float|None, "H2S": float|None}
 #   }
 # }
-LIVE_CACHE = {}
 
+# Push channel for LIVE_CACHE updates + alarm transitions (see /api/stream/live)
+HUB = live_events.EventHub()
+
+# Precomputed /api/fleet/live entries live in STATE (defined below
+# _on_state_event), shared by every worker: STATE.get_live(ship_id, tank_id)
+# -> payload. Every refresh stamps the payload with a new, increasing "seq" so
+# clients can ask for only what changed with ?since=<last seq>.
+_FLEET_LOCK = threading.Lock()
+_FLEET_FULL = {"seq": None, "body": None}   # cached since=0 response body (per worker)
+
+
+# Reading archive backend (plain table, or partitioned PostgreSQL); its setup
+# runs first so a partitioned reading_archive exists before create_all.
+STORE = readings_store.from_env(database.DATABASE_URL)
+STORE.setup(database.engine)
+# Closed days of readings compacted to per-ship/day Arrow files (retention pass)
+COLD = cold_archive.ColdArchive()
 
 # Create all database tables on startup
 models.Base.metadata.create_all(bind=database.engine)
+# ...and bring older shipyard.db files up to the current schema
+migrations.upgrade(database.engine)
 
 app = FastAPI()
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # --- NEW: Global default thresholds (used if per-tank thresholds not set) ---
@@ -46,6 +73,11 @@ DEFAULT_THRESHOLDS = {
     "danger_h2s_high": 15.0,
 }
 
+# Cached ships/tanks/assignments/resolved thresholds for the ingest hot path.
+# Every endpoint that writes those rows must call _broadcast("meta"), which
+# invalidates it in every worker.
+META = meta_cache.MetaCache(database.ReadSessionLocal, DEFAULT_THRESHOLDS)
+
 def evaluate_state(o2, co, lel, h2s, t):
     """Return 'Danger' | 'Warning' | 'OK' based on thresholds dict t."""
     # danger first
@@ -88,8 +120,38 @@ def _agg_from_sensors(sensors_dict):
     }
     return display, worst
 
+# Sharded, TTL'd live state (ingest writer thread writes, API/SSE read)
+LIVE_CACHE = live_cache.LiveCache(_agg_from_sensors)
+
+# --- NEW: state shared by all workers (see shared_state.py, leader.py) ---
+# Only the ingest leader fills LIVE_CACHE; it publishes the resulting fleet
+# payloads to STATE, and every worker serves /api/fleet/live, tank live and
+# SSE from there. Events published to STATE reach every worker's handler.
+def _on_state_event(kind, ship_id, tank_id, data):
+    if kind in ("live", "alarm"):
+        HUB.publish(kind, ship_id, tank_id, data)
+    elif kind in ("meta", "thresholds"):
+        META.invalidate()
+        # state in the fleet snapshot depends on thresholds; only the process
+        # ingesting a tank has its sensors (no-op everywhere else)
+        _reevaluate_live()
+    elif kind == "ships":
+        _bump_ship_state()
+    if kind in ("meta", "thresholds") and not STATE.shared and POOL.running:
+        POOL.forward(kind, ship_id, tank_id)   # pool workers don't see in-process events
+
+STATE = shared_state.from_env(_on_state_event)
+
+def _broadcast(kind, ship_id=None, tank_id=None):
+    """Apply a cache invalidation on every worker (this one first, for read-your-writes)."""
+    if STATE.shared:
+        _on_state_event(kind, ship_id, tank_id, None)
+    STATE.publish(kind, ship_id, tank_id)
+
 
 # --- Dependency to get DB session ---
+# Mutating routes only: on SQLite this is the single writer connection, shared
+# with the ingest thread.
 def get_db():
     db = database.SessionLocal()
     try:
@@ -97,6 +159,19 @@ def get_db():
     finally:
         db.close()
 
+# --- NEW: read-only sync routes use the reader pool, never queueing behind ingest ---
+def get_read_db():
+    db = database.ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# --- NEW: async session for the read-heavy endpoints (runs on the event loop) ---
+async def get_async_db():
+    async with database.AsyncSessionLocal() as db:
+        yield db
+
 # --- One-time Data Seeding ---
 @app.on_event("startup")
 def seed_initial_data():
@@ -123,50 +198,93 @@ def seed_initial_data():
         db.add_all(initial_sensors)
         db.commit()
     db.close()
-    # This ensures the MQTT client starts when the FastAPI app starts
-    mqtt_thread = threading.Thread(target=start_mqtt_client)
-    mqtt_thread.daemon = True
-    mqtt_thread.start()
+    META.invalidate()
+    STATE.start()
+    # Ingest (writer, retention, sweep, MQTT) runs only in the elected leader
+    LEADER.start()
 
 
 # --- MASTER DATA ENDPOINTS ---
 @app.get("/api/master/sensors", response_model=list[models.MasterSensorSchema], tags=["Master Data"])
-def get_master_sensor_list(db: Session = Depends(get_db)):
-    return db.query(models.MasterSensor).all()
+async def get_master_sensor_list(db: AsyncSession = Depends(get_async_db)):
+    result = await db.scalars(select(models.MasterSensor).options(selectinload(models.MasterSensor.logs)))
+    return result.all()
 
 # Ensure you already have this (detail). If not, add it:
 @app.get("/api/master/sensors/{sensor_id}", response_model=models.MasterSensorSchema, tags=["Master Data"])
-def get_sensor_detail(sensor_id: str, db: Session = Depends(get_db)):
-    sensor = db.query(models.MasterSensor).filter(models.MasterSensor.id == sensor_id).first()
+async def get_sensor_detail(sensor_id: str, db: AsyncSession = Depends(get_async_db)):
+    sensor = await db.get(models.MasterSensor, sensor_id, options=[selectinload(models.MasterSensor.logs)])
     if not sensor:
         raise HTTPException(404, "Sensor not found")
     return sensor
 
 # NEW: CSV download of a sensor's event logs
 @app.get("/api/master/sensors/{sensor_id}/logs.csv")
-def download_sensor_logs(sensor_id: str, db: Session = Depends(get_db)):
+def download_sensor_logs(sensor_id: str, db: Session = Depends(get_read_db)):
     sensor = db.query(models.MasterSensor).filter(models.MasterSensor.id == sensor_id).first()
     if not sensor:
         raise HTTPException(404, "Sensor not found")
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["timestamp","event","details","sensor_id"])
-    for log in sensor.logs:
-        writer.writerow([log.timestamp.isoformat(), log.event, log.details, sensor.id])
-    output.seek(0)
-    return StreamingResponse(iter([output.getvalue()]),
+    L = models.SensorLogEntry
+    stmt = (select(L.timestamp, L.event, L.details, L.sensor_id)
+              .where(L.sensor_id == sensor_id).order_by(L.timestamp, L.id))
+    return StreamingResponse(exports.stream_query(stmt, ["timestamp","event","details","sensor_id"]),
         media_type="text/csv",
         headers={"Content-Disposition": f'attachment; filename="{sensor_id}_logs.csv"'}
     )
 
 @app.get("/api/master/tank-types", response_model=list[models.MasterTankTypeSchema], tags=["Master Data"])
-def get_master_tank_types(db: Session = Depends(get_db)):
-    return db.query(models.MasterTankType).all()
+async def get_master_tank_types(db: AsyncSession = Depends(get_async_db)):
+    result = await db.scalars(select(models.MasterTankType))
+    return result.all()
 
 # --- SHIP ENDPOINTS ---
+# /api/ships is the ship graph from the database, rebuilt only when
+# ship/tank/assignment metadata (META.version) or ship status
+# (SHIP_STATE_VERSION) change; the ETag follows those two alone, so dashboard
+# polls get 304s while readings stream in. live_* are overlaid from the live
+# state when the body is rebuilt (the Ship.live_* columns are write-behind,
+# ship_live.py) and are not kept current between rebuilds: current values
+# come from /api/fleet/live and the SSE stream. The counters are per process,
+# so the ETag also names the process: a client that moves to another worker
+# gets a fresh 200 instead of a wrong 304.
+SHIP_STATE_VERSION = 0
+_PROCESS_TAG = uuid.uuid4().hex[:8]
+_SHIPS_CACHE = {"etag": None, "body": None}
+_SHIPS_ADAPTER = TypeAdapter(list[models.ShipSchema])
+
+def _bump_ship_state():
+    global SHIP_STATE_VERSION
+    SHIP_STATE_VERSION += 1
+
+def _fresh_ship_live(tanks):
+    """{ship_id: {live_o2: .., ...}} from the most recently updated live tank of each ship."""
+    latest = {}
+    for p in tanks:
+        if p["ship_id"] not in latest or p["seq"] > latest[p["ship_id"]]["seq"]:
+            latest[p["ship_id"]] = p
+    return {ship_id: {col: p["aggregates"]["display"].get(gas) for col, gas in ship_live.LIVE_COLUMNS.items()}
+            for ship_id, p in latest.items()}
+
 @app.get("/api/ships", response_model=list[models.ShipSchema], tags=["Ships"])
-def get_all_ships(db: Session = Depends(get_db)):
-    return db.query(models.Ship).all()
+async def get_all_ships(request: Request, db: AsyncSession = Depends(get_async_db)):
+    etag = f'W/"ships-{_PROCESS_TAG}-{META.version}-{SHIP_STATE_VERSION}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    cached = _SHIPS_CACHE
+    if cached["etag"] != etag:
+        # whole ship -> tank -> sensor graph in 3 queries instead of lazy loads per row
+        rows = (await db.scalars(
+            select(models.Ship)
+              .options(selectinload(models.Ship.tanks).selectinload(models.Tank.sensors)))).all()
+        ships = _SHIPS_ADAPTER.dump_python(_SHIPS_ADAPTER.validate_python(rows, from_attributes=True),
+                                           mode="json")
+        live = _fresh_ship_live(STATE.fleet(0)[1])
+        body = json.dumps([{**s, **live[s["id"]]} if s["id"] in live else s for s in ships],
+                          separators=(",", ":"))
+        cached = {"etag": etag, "body": body}
+        _SHIPS_CACHE.update(cached)
+    return Response(cached["body"], media_type="application/json", headers=headers)
 
 @app.post("/api/ships", response_model=models.ShipSchema, tags=["Ships"])
 def create_ship(ship: models.ShipCreate, db: Session = Depends(get_db)):
@@ -186,6 +304,7 @@ def create_ship(ship: models.ShipCreate, db: Session = Depends(get_db)):
     db.add(new_ship)
     db.commit()
     db.refresh(new_ship)
+    _broadcast("meta")
     return new_ship
 # ... (All your other ship endpoints: update, delete, acknowledge remain the same)
 
@@ -215,6 +334,7 @@ def create_tank_for_ship(ship_id: str, tank: models.TankCreate, db: Session = De
     db.add(new_tank)
     db.commit()
     db.refresh(new_tank)
+    _broadcast("meta")
     return new_tank
 
 @app.post("/api/ships/{ship_id}/tanks/{tank_id}/sensors", response_model=list[models.AssignedSensorSchema], tags=["Sensors"])
@@ -240,21 +360,18 @@ def assign_sensors_to_tank(ship_id: str, tank_id: int, request: models.SensorAss
         db_sensor.last_used_on_ship = db_tank.owner_ship.name
     
     db.commit()
+    _broadcast("meta")
     # Return all sensors now assigned to the tank
     db.refresh(db_tank)
     return db_tank.sensors
 
 @app.get("/api/ships/{ship_id}/tanks/{tank_id}/thresholds", response_model=models.TankThresholdSchema)
-def get_tank_thresholds(ship_id: str, tank_id: int, db: Session = Depends(get_db)):
-    tank = db.query(models.Tank).filter(models.Tank.id==tank_id, models.Tank.ship_id==ship_id).first()
-    if not tank:
+def get_tank_thresholds(ship_id: str, tank_id: int):
+    # served from the metadata cache (already merged with defaults)
+    tank = META.tank(tank_id)
+    if not tank or tank.ship_id != ship_id:
         raise HTTPException(404, "Tank not found")
-    row = db.query(models.TankThreshold).filter(models.TankThreshold.tank_id==tank_id).first()
-    # fill with defaults if not set
-    if not row:
-        return models.TankThresholdSchema(**DEFAULT_THRESHOLDS)
-    data = {k: getattr(row, k) if getattr(row, k) is not None else DEFAULT_THRESHOLDS[k] for k in DEFAULT_THRESHOLDS}
-    return models.TankThresholdSchema(**data)
+    return models.TankThresholdSchema(**tank.thresholds)
 
 @app.put("/api/ships/{ship_id}/tanks/{tank_id}/thresholds", response_model=models.TankThresholdSchema)
 def put_tank_thresholds(ship_id: str, tank_id: int, payload: models.TankThresholdSchema, db: Session = Depends(get_db)):
@@ -268,21 +385,185 @@ def put_tank_thresholds(ship_id: str, tank_id: int, payload: models.TankThreshol
     for k, v in payload.dict().items():
         setattr(row, k, v)
     db.commit(); db.refresh(row)
-    data = {k: getattr(row, k) if getattr(row, k) is not None else DEFAULT_THRESHOLDS[k] for k in DEFAULT_THRESHOLDS}
-    return models.TankThresholdSchema(**data)
+    # invalidates META everywhere; the leader re-evaluates the tank's live state
+    _broadcast("thresholds", ship_id, tank_id)
+    return models.TankThresholdSchema(**META.resolve_thresholds(row))
 
 @app.get("/api/ships/{ship_id}/tanks/{tank_id}/live")
 def get_tank_live(ship_id: str, tank_id: int):
-    key = (ship_id, tank_id)
-    bucket = LIVE_CACHE.get(key)
-    if not bucket:
-        return {
-            "updated_at": None,
-            "sensors": {},
-            "aggregates": {"display": {"O2": None, "CO": None, "LEL": None, "H2S": None},
-                           "worst":   {"O2": None, "CO": None, "LEL": None, "H2S": None}}
-        }
-    return bucket
+    payload = STATE.get_live(ship_id, tank_id)
+    if not payload:
+        return _empty_live()
+    return {k: payload[k] for k in ("updated_at", "sensors", "aggregates")}
+
+def _empty_live():
+    return {
+        "updated_at": None,
+        "sensors": {},
+        "aggregates": {"display": {"O2": None, "CO": None, "LEL": None, "H2S": None},
+                       "worst":   {"O2": None, "CO": None, "LEL": None, "H2S": None}}
+    }
+
+def _live_payload(ship_id, tank_id, bucket, state=None):
+    """JSON-ready view of a LIVE_CACHE bucket plus its thresholds and evaluated state."""
+    worst = bucket["aggregates"]["worst"]
+    T = META.thresholds(tank_id)
+    if state is None:
+        state = evaluate_state(worst.get("O2"), worst.get("CO"), worst.get("LEL"), worst.get("H2S"), T)
+    return {
+        "ship_id": ship_id,
+        "tank_id": tank_id,
+        "updated_at": bucket["updated_at"].isoformat() if bucket["updated_at"] else None,
+        "sensors": {sid: dict(v) for sid, v in bucket["sensors"].items()},
+        "aggregates": {"display": dict(bucket["aggregates"]["display"]), "worst": dict(worst)},
+        "thresholds": dict(T),
+        "state": state,
+    }
+
+# One read-LIVE_CACHE-then-publish sequence at a time (ingest writer, sweeper,
+# threshold re-evaluation), so a payload built from an older view of a tank
+# can never be stored or published after a newer one.
+_LIVE_PUBLISH_LOCK = threading.RLock()
+
+def _refresh_live(ship_id, tank_id):
+    """Recompute the shared fleet entry for one bucket and publish it (leader only)."""
+    with _LIVE_PUBLISH_LOCK:
+        bucket = LIVE_CACHE.get(ship_id, tank_id)
+        if bucket:
+            STATE.publish("live", ship_id, tank_id,
+                          STATE.put_live(ship_id, tank_id, _live_payload(ship_id, tank_id, bucket)))
+
+def _reevaluate_live():
+    """
+    Recompute aggregates and state of every tank in LIVE_CACHE in one
+    vectorized pass (fleet_eval.py) and push the tanks whose thresholds or
+    state changed.
+    """
+    with _LIVE_PUBLISH_LOCK:
+        tanks = LIVE_CACHE.items()   # copies; LIVE_CACHE keeps its own aggregates current
+        if not tanks:
+            return
+        arr = fleet_eval.FleetArrays(((key, b["sensors"]) for key, b in tanks), lambda key: META.thresholds(key[1]))
+        current = {(p["ship_id"], p["tank_id"]): p for p in STATE.fleet(0)[1]}
+        for ((ship_id, tank_id), view), (display, worst, state) in zip(tanks, fleet_eval.evaluate_fleet(arr)):
+            payload = _live_payload(ship_id, tank_id, {**view, "aggregates": {"display": display, "worst": worst}},
+                                    state)
+            prev = current.get((ship_id, tank_id))
+            if prev and prev["state"] == payload["state"] and prev["thresholds"] == payload["thresholds"]:
+                continue
+            STATE.publish("live", ship_id, tank_id, STATE.put_live(ship_id, tank_id, payload))
+
+# --- NEW: live-cache TTL sweep (sensors that stopped reporting) ---
+LIVE_SWEEP_SEC = float(os.getenv("LIVE_SWEEP_SEC", "10"))
+_LIVE_SWEEP_STOP = threading.Event()
+
+# --- NEW: write-behind Ship.live_* (ship_live.py) ---
+SHIP_LIVE = ship_live.ShipLiveBuffer()
+# One flush transaction at a time, so an older value never lands last. Always
+# taken BEFORE checking out the (single) writer connection, never while holding it.
+_SHIP_FLUSH_LOCK = threading.Lock()
+
+def _flush_ship_live(force=False):
+    """Write buffered live_* of ships no ingest batch has flushed (they went quiet, or shutdown)."""
+    with _SHIP_FLUSH_LOCK:
+        due = SHIP_LIVE.take_due(force=force)
+        if not due:
+            return
+        db = get_db_for_mqtt()
+        try:
+            for ship in db.query(models.Ship).filter(models.Ship.id.in_(due)):
+                ship_live.apply(ship, due[ship.id])
+            db.commit()
+        except Exception:
+            db.rollback()
+            SHIP_LIVE.restore(due)
+            raise
+        finally:
+            db.close()
+    _broadcast("ships")   # tanks that expired from STATE fall back to these columns
+
+def _expire_live():
+    """Drop TTL-expired sensors and push the tanks whose live view changed."""
+    changed, removed = LIVE_CACHE.expire()
+    for ship_id, tank_id in changed:
+        _refresh_live(ship_id, tank_id)
+    if LIVE_CACHE.ttl_sec > 0:
+        # entries a previous leader left behind for tanks that stopped reporting
+        horizon = datetime.datetime.now() - datetime.timedelta(seconds=LIVE_CACHE.ttl_sec)
+        for p in STATE.fleet(0)[1]:
+            key = (p["ship_id"], p["tank_id"])
+            if key not in LIVE_CACHE and (not p["updated_at"] or
+                                          datetime.datetime.fromisoformat(p["updated_at"]) < horizon):
+                removed.append(key)
+    with _LIVE_PUBLISH_LOCK:
+        for ship_id, tank_id in removed:
+            if (ship_id, tank_id) in LIVE_CACHE:
+                continue   # reported again since expire()
+            # nothing reporting any more: clients get an empty entry, snapshots forget the tank
+            STATE.remove_live(ship_id, tank_id)
+            STATE.publish("live", ship_id, tank_id, _live_payload(ship_id, tank_id, _empty_live()))
+
+def _live_sweeper():
+    while not _LIVE_SWEEP_STOP.wait(LIVE_SWEEP_SEC):
+        try:
+            _expire_live()
+        except Exception as e:
+            print(f"Live cache sweep failed: {e}")
+        try:
+            _flush_ship_live()
+        except Exception as e:
+            print(f"Ship live flush failed: {e}")
+
+@app.get("/api/fleet/live", tags=["Live"])
+def get_fleet_live(since: int = Query(0, ge=0)):
+    """
+    Every (ship_id, tank_id) live bucket with thresholds and state, in one response.
+    Pass since=<seq from the previous response> to get only entries updated after it.
+    """
+    seq, tanks = STATE.fleet(since)
+    with _FLEET_LOCK:
+        if since == 0 and _FLEET_FULL["seq"] == seq:
+            return Response(_FLEET_FULL["body"], media_type="application/json")
+    body = json.dumps({"seq": seq, "tanks": tanks})
+    if since == 0:
+        with _FLEET_LOCK:
+            _FLEET_FULL["seq"], _FLEET_FULL["body"] = seq, body
+    return Response(body, media_type="application/json")
+
+@app.get("/api/stream/live", tags=["Live"])
+async def stream_live(request: Request,
+                      ship_id: list[str] | None = Query(None),
+                      tank_id: list[int] | None = Query(None)):
+    """
+    Server-Sent Events stream. Sends a 'live' snapshot of every matching tank
+    on connect, then 'live' updates and 'alarm' transitions (Danger/Warning/Clear)
+    as ingest produces them. Filter with repeated ?ship_id=&tank_id= params.
+    """
+    sub = HUB.subscribe(asyncio.get_running_loop(), ship_id, tank_id)
+
+    def snapshot():
+        return [live_events.sse_frame("live", p)
+                for p in STATE.fleet(0)[1] if sub.wants(p["ship_id"], p["tank_id"])]
+
+    async def gen():
+        try:
+            for frame in snapshot():
+                yield frame
+            while not await request.is_disconnected():
+                if sub.lagged:
+                    sub.lagged = False
+                    yield live_events.sse_frame("resync", {})
+                    for frame in snapshot():
+                        yield frame
+                try:
+                    yield await asyncio.wait_for(sub.queue.get(), timeout=live_events.STREAM_KEEPALIVE_SEC)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            HUB.unsubscribe(sub)
+
+    return StreamingResponse(gen(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @app.put("/api/ships/{ship_id}/acknowledge", response_model=models.ShipSchema)
@@ -292,80 +573,178 @@ def acknowledge_alarm(ship_id: str, db: Session = Depends(get_db)):
         raise HTTPException(404, "Ship not found")
     ship.status = ship.previousStatus or "Idle"
     db.commit(); db.refresh(ship)
-    return ship
+    _broadcast("ships")
+    live = _fresh_ship_live(STATE.fleet(0)[1]).get(ship_id, {})
+    return models.ShipSchema.model_validate(ship).model_copy(update=live)
 
 # === Event timeline & readings API ===
 
 
 @app.get("/api/logs", tags=["Logs"])
-def get_logs(ship_id: str | None = None,
+async def get_logs(response: Response,
+             ship_id: str | None = None,
              severity: str | None = None,
              tank_id: int | None = None,
              minutes: int = Query(60, ge=1, le=10080),
-             db: Session = Depends(get_db)):
+             limit: int | None = Query(None, ge=1, le=5000),
+             cursor: str | None = None,
+             db: AsyncSession = Depends(get_async_db)):
     """
-    Returns recent event logs (Safety/User/Config). For demo we reuse SensorLogEntry.
-    We'll interpret event names: Danger/Warning/OK/Clear plus any UI action events.
+    Returns recent events (Safety/User/Config) from event_log, newest first.
+    Filtering and ordering run in SQL. Without limit the whole window is
+    returned (what the timeline page expects). With limit, results are
+    keyset-paginated: when more rows exist, the X-Next-Cursor response header
+    holds the value to pass back as ?cursor= for the next page.
     """
+    E = models.EventLog
     cutoff = datetime.datetime.now() - datetime.timedelta(minutes=minutes)
-    q = db.query(models.SensorLogEntry).filter(models.SensorLogEntry.timestamp >= cutoff)
-    # ship_id/tank_id embedded in details if coming from MQTT or UI; filter best-effort
-    # Example details format recommendation: "[ship MTGREATMANTA tank 1] ... "
-    rows = q.order_by(models.SensorLogEntry.timestamp.desc()).all()
-    payload = []
-    for r in rows:
-        sev = None
-        if r.event in ("Danger", "Warning", "OK", "Clear"):
-            sev = "Danger" if r.event == "Danger" else ("Warning" if r.event == "Warning" else "OK")
-        # quick text parsing (non-fatal if not present)
-        s_id, t_id = None, None
-        txt = r.details or ""
-        # crude parse like: "[tank 3]" or "[ship MT.. tank 2]"
+    q = select(E).where(E.timestamp >= cutoff)
+    # events without a ship/tank (dockyard-wide, e.g. Emergency) stay visible under those filters
+    if ship_id:
+        q = q.where(or_(E.ship_id == ship_id, E.ship_id.is_(None)))
+    if tank_id is not None:
+        q = q.where(or_(E.tank_id == tank_id, E.tank_id.is_(None)))
+    if severity:
+        q = q.where(E.severity == severity)
+    if cursor:
+        # cursor = "<iso timestamp>|<id>" of the last row of the previous page
         try:
-            if "ship " in txt:
-                s_id = txt.split("ship ")[1].split(" ")[0].strip("[]:,")
-            if "tank " in txt:
-                t_id = int(txt.split("tank ")[1].split("]")[0].split()[0].strip("[]:,"))
-        except Exception:
-            pass
-        if ship_id and s_id and s_id != ship_id: 
-            continue
-        if tank_id is not None and t_id is not None and t_id != tank_id:
-            continue
-        if severity and sev and sev != severity:
-            continue
-        payload.append({
-            "timestamp": r.timestamp.isoformat(),
-            "ship_id": s_id,
-            "tank_id": t_id,
-            "severity": sev,
-            "event": r.event,
-            "details": r.details
-        })
-    return payload
+            c_ts, c_id = cursor.rsplit("|", 1)
+            c_ts, c_id = datetime.datetime.fromisoformat(c_ts), int(c_id)
+        except ValueError:
+            raise HTTPException(400, "Invalid cursor")
+        q = q.where(or_(E.timestamp < c_ts, and_(E.timestamp == c_ts, E.id < c_id)))
+    q = q.order_by(E.timestamp.desc(), E.id.desc())
+    if limit is not None:
+        q = q.limit(limit + 1)
+    rows = (await db.scalars(q)).all()
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = f"{rows[-1].timestamp.isoformat()}|{rows[-1].id}"
+    return [{
+        "id": r.id,
+        "timestamp": r.timestamp.isoformat(),
+        "ship_id": r.ship_id,
+        "tank_id": r.tank_id,
+        "severity": r.severity,
+        "event": r.event,
+        "details": r.details,
+        "worst": {"O2": r.worst_o2, "CO": r.worst_co, "LEL": r.worst_lel, "H2S": r.worst_h2s},
+    } for r in rows]
 
 @app.post("/api/logs", tags=["Logs"])
-def post_log(event: str, details: str = "", db: Session = Depends(get_db)):
+def post_log(event: str, details: str = "", ship_id: str | None = None, tank_id: int | None = None,
+             db: Session = Depends(get_db)):
     """
-    Allows UI to append user/audit events into the same log sink.
+    Allows UI to append user/audit events into the event log. Without
+    ship_id/tank_id, they are taken from a "[ship X tank N]" prefix in details
+    (what the UI sends).
     """
-    any_sensor = db.query(models.MasterSensor).first()
-    if not any_sensor:
-        raise HTTPException(400, "No sensor sink available to attach log")
-    entry = models.SensorLogEntry(owner_sensor=any_sensor, event=event, details=details)
-    db.add(entry); db.commit()
+    if ship_id is None or tank_id is None:
+        parsed_ship, parsed_tank, _ = migrations.parse_details(details or "")
+        ship_id = ship_id if ship_id is not None else parsed_ship
+        tank_id = tank_id if tank_id is not None else parsed_tank
+    db.add(models.EventLog(event=event, details=details, ship_id=ship_id, tank_id=tank_id))
+    db.commit()
     return {"ok": True}
 
 @app.get("/api/ships/{ship_id}/tanks/{tank_id}/readings", tags=["Readings"])
-def get_readings(ship_id: str, tank_id: int, minutes: int = Query(60, ge=1, le=1440), db: Session = Depends(get_db)):
+async def get_readings(ship_id: str, tank_id: int,
+                 minutes: int = Query(60, ge=1, le=1440),
+                 max_points: int | None = Query(None, ge=1),
+                 method: str | None = Query(None, pattern="^(lttb|minmax|avg)$"),
+                 sensor_id: str | None = None,
+                 db: AsyncSession = Depends(get_async_db)):
+    """
+    Raw readings for the window (optionally a single sensor). With max_points,
+    long tank-level windows are served from the 1m/15m/1h rollups instead: each
+    point is a bucket whose O2/CO/LEL/H2S are averages, with per-gas
+    "min"/"max"/"last" alongside. With max_points and method=lttb|minmax|avg,
+    the raw series is reduced server-side to at most max_points points; a
+    single sensor's series (no rollups) defaults to lttb.
+    """
+    if method is not None and max_points is None:
+        raise HTTPException(400, "method requires max_points")
     cutoff = datetime.datetime.now() - datetime.timedelta(minutes=minutes)
-    rows = (db.query(models.ReadingArchive)
-              .filter(models.ReadingArchive.ship_id==ship_id,
-                      models.ReadingArchive.tank_id==tank_id,
-                      models.ReadingArchive.timestamp >= cutoff)
-              .order_by(models.ReadingArchive.timestamp.asc())
-              .all())
-    return [{"ts": r.timestamp.isoformat(), "O2": r.o2, "CO": r.co, "LEL": r.lel,"H2S": r.h2s} for r in rows]
+    A = models.ReadingArchive
+    window = dict(ship_id=ship_id, tank_id=tank_id, start=cutoff, sensor_id=sensor_id)
+    cold = await run_in_threadpool(COLD.covers, ship_id, cutoff)   # globs the ship's day files
+    if sensor_id is not None and max_points is not None and method is None:
+        method = "lttb"   # rollups are per tank, so a sensor's series is reduced instead
+    if sensor_id is None and max_points is not None and method is None:
+        raw_count = await db.scalar(STORE.count_window(**window))
+        if cold:
+            raw_count += await run_in_threadpool(COLD.count, **window)
+        level = rollups.choose_level(minutes, max_points, raw_count)
+        if level is not None:
+            rows = await db.scalars(rollups.rollup_select(ship_id, tank_id, cutoff, level))
+            return rollups.rollup_points(rows, max_points)
+    if method is not None:
+        rows = await _window_rows(db, ("timestamp", "o2", "co", "lel", "h2s"), window, cold)
+        # NumPy reduction is CPU work; keep it off the event loop
+        return await run_in_threadpool(downsample.downsample, rows, max_points, method)
+    rows = await _window_rows(db, ("timestamp", "sensor_id", "o2", "co", "lel", "h2s"), window, cold)
+    return [{"ts": ts.isoformat(), "sensor_id": sid, "O2": o2, "CO": co, "LEL": lel,"H2S": h2s}
+            for ts, sid, o2, co, lel, h2s in rows]
+
+async def _window_rows(db, names, window, cold):
+    """Hot SQL rows of the window, merged by time with cold archive rows when it reaches back that far."""
+    A = models.ReadingArchive
+    hot = (await db.execute(STORE.select_window([getattr(A, n) for n in names], **window))).all()
+    if not cold:
+        return hot
+    cold_rows = await run_in_threadpool(lambda: list(COLD.rows(names, **window)))
+    return list(cold_archive.merge_rows(cold_rows, hot))
+
+
+# === Streaming exports (constant memory; CSV or NDJSON, optional gzip) ===
+
+@app.get("/api/export/readings", tags=["Export"])
+def export_readings(ship_id: str,
+                    tank_id: int | None = None,
+                    sensor_id: str | None = None,
+                    start: datetime.datetime | None = None,
+                    end: datetime.datetime | None = None,
+                    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+                    gzip: bool = False):
+    A = models.ReadingArchive
+    stmt = STORE.select_window([getattr(A, c) for c in cold_archive.COLUMNS],
+                               ship_id, tank_id, start, end, sensor_id)
+    # older days live in the cold archive: merged in by timestamp, read lazily per day file
+    cold = COLD.rows(cold_archive.COLUMNS, ship_id, tank_id, start, end, sensor_id)
+    media_type, headers = exports.response_headers(f"{ship_id}_readings", format, gzip)
+    return StreamingResponse(
+        exports.stream_query(stmt, ["timestamp", "ship_id", "tank_id", "sensor_id", "O2", "CO", "LEL", "H2S"], format, gzip,
+                             merge_with=cold),
+        media_type=media_type, headers=headers)
+
+@app.get("/api/export/events", tags=["Export"])
+def export_events(ship_id: str | None = None,
+                  tank_id: int | None = None,
+                  severity: str | None = None,
+                  start: datetime.datetime | None = None,
+                  end: datetime.datetime | None = None,
+                  format: str = Query("csv", pattern="^(csv|ndjson)$"),
+                  gzip: bool = False):
+    E = models.EventLog
+    stmt = select(E.timestamp, E.ship_id, E.tank_id, E.severity, E.event, E.details,
+                  E.worst_o2, E.worst_co, E.worst_lel, E.worst_h2s)
+    if ship_id:
+        stmt = stmt.where(E.ship_id == ship_id)
+    if tank_id is not None:
+        stmt = stmt.where(E.tank_id == tank_id)
+    if severity:
+        stmt = stmt.where(E.severity == severity)
+    if start is not None:
+        stmt = stmt.where(E.timestamp >= start)
+    if end is not None:
+        stmt = stmt.where(E.timestamp < end)
+    stmt = stmt.order_by(E.timestamp, E.id)
+    media_type, headers = exports.response_headers(f"{ship_id or 'fleet'}_events", format, gzip)
+    return StreamingResponse(
+        exports.stream_query(stmt, ["timestamp", "ship_id", "tank_id", "severity", "event", "details",
+                                    "worst_O2", "worst_CO", "worst_LEL", "worst_H2S"], format, gzip),
+        media_type=media_type, headers=headers)
 
 
 # ===================================================================
@@ -376,6 +755,13 @@ MQTT_BROKER = "localhost"
 MQTT_PORT = 1883
 TOPIC = "ship/+/sensors"
 
+# --- NEW: device-timestamped samples ---
+# Samples older than this (vs. arrival) are history only: archived and rolled
+# up, but never shown as live or evaluated for alarms.
+LIVE_MAX_SAMPLE_AGE_SEC = float(os.getenv("LIVE_MAX_SAMPLE_AGE_SEC", "60"))
+# Device clocks ahead of ours by more than this are not trusted (arrival time is used).
+INGEST_MAX_CLOCK_SKEW_SEC = float(os.getenv("INGEST_MAX_CLOCK_SKEW_SEC", "300"))
+
 # This is the helper function to get a database session inside the MQTT thread.
 # It's crucial because the main `get_db` is tied to API requests.
 def get_db_for_mqtt():
@@ -386,191 +772,247 @@ def on_connect(client, userdata, flags, rc):
     client.subscribe(TOPIC)
 
 def on_message(client, userdata, msg):
-    print(f"Received message on topic {msg.topic}: {msg.payload.decode()}")
-    db = get_db_for_mqtt()
+    # Runs on the paho network thread: decode + enqueue only. All DB work
+    # happens in the ingest writer thread (see _write_batch).
+    # topic: ship/<SHIP_ID>/sensors
+    parts = msg.topic.split('/')
+    if len(parts) < 3 or parts[0] != 'ship' or parts[2] != 'sensors':
+        return
+    # expected payload (multi-sensor):
+    # {
+    #   "tank_id": 1,
+    #   "readings": [
+    #     {"sensor_id": "S1", "O2": 21.0, "CO": 10.0, "LEL": 1.0},
+    #     {"sensor_id": "S2", "O2": 20.0, "CO": 12.0, "LEL": 0.5},
+    #     ...
+    #   ]
+    # }
+    # or, buffered on the device, any number of timestamped samples per sensor
+    # (ts = epoch seconds or ISO 8601; any order):
+    #     {"sensor_id": "S1", "samples": [[1718000000.0, 21.0, 10.0, 1.0, 0.0], ...]}
+    # A single-sample reading may also carry "ts"; without one it is stamped
+    # with the arrival time.
     try:
-        # topic: ship/<SHIP_ID>/sensors
-        parts = msg.topic.split('/')
-        if len(parts) < 3 or parts[0] != 'ship' or parts[2] != 'sensors':
-            return
-        ship_id = parts[1]
-
-        data = json.loads(msg.payload.decode())
-        # expected payload (multi-sensor):
-        # {
-        #   "tank_id": 1,
-        #   "readings": [
-        #     {"sensor_id": "S1", "O2": 21.0, "CO": 10.0, "LEL": 1.0},
-        #     {"sensor_id": "S2", "O2": 20.0, "CO": 12.0, "LEL": 0.5},
-        #     ...
-        #   ]
-        # }
-        tank_id = data.get("tank_id")
+        # --- NEW: compact binary payloads (payload_codec.py) next to JSON, per message ---
+        if payload_codec.is_binary(msg.payload):
+            data = payload_codec.decode(msg.payload)
+        else:
+            data = json.loads(msg.payload.decode())
+        # nothing may raise out of this callback: paho would stop the network loop
+        if not isinstance(data, dict):
+            raise ValueError(f"expected an object, got {type(data).__name__}")
         readings = data.get("readings") or []
-
-        ship = db.query(models.Ship).filter(models.Ship.id == ship_id).first()
-        if not ship:
-            return
-
-        # 1) Update LIVE_CACHE per sensor
-        key = (ship_id, tank_id)
-        bucket = LIVE_CACHE.get(key, {"sensors": {}, "aggregates": {}})
-        for r in readings:
-            sid = r.get("sensor_id")
-            if not sid: 
-                continue
-            # normalize numeric fields
-            bucket["sensors"][sid] = {"O2": r.get("O2"), "CO": r.get("CO"), "LEL": r.get("LEL"), "H2S": r.get("H2S")}
-            # 2) Archive each sensor reading (optional but useful)
-            db.add(models.ReadingArchive(
-                ship_id=ship_id, tank_id=tank_id,
-                o2=r.get("O2"), co=r.get("CO"), lel=r.get("LEL"), h2s=r.get("H2S")
-            ))
-        disp, worst = _agg_from_sensors(bucket["sensors"])
-        bucket["aggregates"] = {"display": disp, "worst": worst}
-        bucket["updated_at"] = datetime.datetime.now()
-        LIVE_CACHE[key] = bucket
-
-        # 3) Resolve thresholds (per-tank overrides if any)
-        T = DEFAULT_THRESHOLDS.copy()
-        if tank_id is not None:
-            thr = db.query(models.TankThreshold).filter(models.TankThreshold.tank_id == tank_id).first()
-            if thr:
-                for k in T.keys():
-                    v = getattr(thr, k, None)
-                    if v is not None:
-                        T[k] = v
-
-        # 4) Use WORST aggregate to evaluate safety (correct severity)
-        new_state = evaluate_state(worst.get("O2"), worst.get("CO"), worst.get("LEL"), worst.get("H2S"), T)
-        prev = ship.status or "Idle"
-
-        # 5) Put DISPLAY aggregate on ship.live_* so your current UI shows the overview
-        ship.live_o2  = disp.get("O2")
-        ship.live_co  = disp.get("CO")
-        ship.live_lel = disp.get("LEL")
-        ship.live_h2s = disp.get("H2S")
-
-        # 6) Log transitions + set ship status (ack still required to clear Danger)
-        sink = db.query(models.MasterSensor).filter(models.MasterSensor.type=="Multi-gas").first()
-        def log_event(ev, details):
-            if sink:
-                db.add(models.SensorLogEntry(owner_sensor=sink, event=ev, details=details))
-
-        if new_state == "Danger" and prev != "Danger":
-            ship.previousStatus = ship.status
-            ship.status = "Danger"
-            log_event("Danger", f"[tank {tank_id}] worst O2={worst.get('O2')}, CO={worst.get('CO')}, LEL={worst.get('LEL')}, H2S={worst.get('H2S')}")
-        elif new_state == "Warning" and prev not in ("Danger","Warning"):
-            ship.status = "Warning"
-            log_event("Warning", f"[tank {tank_id}] worst O2={worst.get('O2')}, CO={worst.get('CO')}, LEL={worst.get('LEL')}, H2S={worst.get('H2S')}")
-        elif new_state == "OK" and prev in ("Danger","Warning"):
-            log_event("Clear", f"[tank {tank_id}] recovered; worst O2={worst.get('O2')}, CO={worst.get('CO')}, LEL={worst.get('LEL')}, H2S={worst.get('H2S')}")
-
-        db.commit()
+        if not isinstance(readings, list) or not all(isinstance(r, dict) for r in readings):
+            raise ValueError("readings must be a list of objects")
+        item = {
+            "ship_id": parts[1],
+            "tank_id": data.get("tank_id"),
+            "readings": readings,
+            "received_at": datetime.datetime.now(),
+        }
     except Exception as e:
-        print(f"Error processing MQTT message: {e}")
-    finally:
-        db.close()
-
-    # print(f"Received message on topic {msg.topic}: {msg.payload.decode()}")
-    # db = get_db_for_mqtt()
-    # try:
-    #     # topic pattern: ship/<SHIP_ID>/sensors
-    #     parts = msg.topic.split('/')
-    #     if len(parts) < 3 or parts[0] != 'ship' or parts[2] != 'sensors':
-    #         return
-    #     ship_id = parts[1]
-
-    #     data = json.loads(msg.payload.decode())  # expected keys: O2, CO, LEL
-
-    #     ship = db.query(models.Ship).filter(models.Ship.id == ship_id).first()
-    #     if not ship:
-    #         # unknown ship id; ignore
-    #         return
-
-    #     # 1) Update live values
-    #     ship.live_o2 = data.get("O2")
-    #     ship.live_co = data.get("CO")
-    #     ship.live_lel = data.get("LEL")
-
-    #     # 2) Archive the reading (for charts/exports later)
-    #     db.add(models.ReadingArchive(
-    #         ship_id=ship_id,
-    #         tank_id=None,  # optional: bind per tank if you route by tank topic later
-    #         o2=ship.live_o2, co=ship.live_co, lel=ship.live_lel
-    #     ))
-
-    #     # 3) Resolve thresholds — for now global defaults (per-tank if you later route by tank)
-    #     t = DEFAULT_THRESHOLDS
-    #     new_state = evaluate_state(ship.live_o2, ship.live_co, ship.live_lel, t)
-    #     prev_state = ship.status or "Idle"
-
-    #     # 4) Generate logs on transitions (attach to any 'Multi-gas' sensor as a global log sink)
-    #     log_sensor = db.query(models.MasterSensor).filter(models.MasterSensor.type == "Multi-gas").first()
-
-    #     def log_event(event, details):
-    #         if log_sensor:
-    #             db.add(models.SensorLogEntry(
-    #                 owner_sensor=log_sensor, event=event, details=details
-    #             ))
-
-    #     if new_state == "Danger" and prev_state != "Danger":
-    #         ship.previousStatus = ship.status
-    #         ship.status = "Danger"
-    #         log_event("Danger", f"O2={ship.live_o2}, CO={ship.live_co}, LEL={ship.live_lel}")
-    #     elif new_state == "Warning" and prev_state not in ("Danger", "Warning"):
-    #         # keep operational status but log warning
-    #         log_event("Warning", f"O2={ship.live_o2}, CO={ship.live_co}, LEL={ship.live_lel}")
-    #     elif new_state == "OK" and prev_state in ("Danger","WIP","Warning"):
-    #         log_event("Clear", f"Recovered O2={ship.live_o2}, CO={ship.live_co}, LEL={ship.live_lel}")
-    #         # don't auto-flip status from Danger; wait for /acknowledge
-
-    #     db.commit()
-    # except Exception as e:
-    #     print(f"Error processing MQTT message: {e}")
-    # finally:
-    #     db.close()
-
-# def on_message(client, userdata, msg):
-#     """
-#     This function is called for every MQTT message.
-#     It now finds the ship in the database and updates its live readings.
-#     """
-#     print(f"Received message on topic {msg.topic}: {msg.payload.decode()}")
-#     db = get_db_for_mqtt()
-#     try:
-#         ship_id = msg.topic.split('/')[1]
-#         data = json.loads(msg.payload.decode())
-
-#         # Find the ship in the database
-#         db_ship = db.query(models.Ship).filter(models.Ship.id == ship_id).first()
-
-#         if db_ship:
-#             # Update live sensor readings in the database
-#             db_ship.live_o2 = data.get("O2")
-#             db_ship.live_co = data.get("CO")
-#             db_ship.live_lel = data.get("LEL")
-
-#             # Check for danger conditions
-#             is_danger = (
-#                 data.get("CO", 0) >= 100 or
-#                 data.get("LEL", 0) >= 10 or
-#                 (data.get("O2", 21) <= 18 and data.get("O2") is not None)
-#             )
-#             if is_danger and db_ship.status != "Danger":
-#                 print(f"!!! DANGER DETECTED for ship {ship_id} !!!")
-#                 db_ship.previousStatus = db_ship.status
-#                 db_ship.status = "Danger"
-            
-#             # Save all changes to the database
-#             db.commit()
-
-#     except Exception as e:
-#         print(f"Error processing MQTT message: {e}")
-#     finally:
-#         # Always close the session
-#         db.close()
+        print(f"Bad MQTT payload on {msg.topic}: {e}")
+        return
+    INGEST.submit(item)
+
+def _write_batch(items):
+    """Apply a micro-batch of decoded MQTT messages in a single transaction."""
+    snap = META.snapshot()
+    flushed = {}
+    with _SHIP_FLUSH_LOCK:
+        db = get_db_for_mqtt()
+        try:
+            # unknown ships are dropped via the cache; known ones are loaded in one query
+            ids = {it["ship_id"] for it in items if it["ship_id"] in snap.ships}
+            ships = {s.id: s for s in db.query(models.Ship).filter(models.Ship.id.in_(ids))} if ids else {}
+            touched, alarms = {}, []
+            acc = rollups.RollupAccumulator()
+            archive = []
+            for item in items:
+                # validated up front so one malformed message is skipped on its own,
+                # before it touches LIVE_CACHE or the batch's rows
+                try:
+                    readings = _parse_readings(item)
+                except (TypeError, ValueError) as e:
+                    print(f"Skipping malformed message from ship {item.get('ship_id')}: {e}")
+                    continue
+                _apply_message(db, item, readings, ships, snap, touched, alarms, archive)
+            # buffered live_*: ships whose interval is up, and at once where the status moved
+            flushed = SHIP_LIVE.take_due(ships)
+            flushed.update(SHIP_LIVE.take_due({ev["ship_id"] for ev in alarms}, force=True))
+            for ship_id, values in flushed.items():
+                ship_live.apply(ships[ship_id], values)
+            # resent samples are already stored: only rows actually inserted reach the rollups
+            for r in STORE.write(db, archive):
+                acc.add(r["ship_id"], r["tank_id"], r["timestamp"],
+                        {"O2": r["o2"], "CO": r["co"], "LEL": r["lel"], "H2S": r["h2s"]})
+            acc.flush(db)
+            db.commit()
+        except Exception:
+            db.rollback()
+            SHIP_LIVE.restore(flushed)
+            raise
+        finally:
+            db.close()
+    if alarms:
+        _broadcast("ships")   # status moved; /api/ships caches are stale (live_* come from STATE)
+
+    # push only after the batch is durable; live updates coalesce to one per tank
+    for ev in alarms:
+        STATE.publish("alarm", ev["ship_id"], ev["tank_id"], ev)
+    for (ship_id, tank_id) in touched:
+        _refresh_live(ship_id, tank_id)
+
+def _sample_time(ts, received_at):
+    """Device timestamp (epoch seconds or ISO 8601) as a naive local datetime like received_at."""
+    if ts is None:
+        return received_at
+    if isinstance(ts, (int, float)):
+        t = datetime.datetime.fromtimestamp(ts)
+    else:
+        t = datetime.datetime.fromisoformat(ts)
+        if t.tzinfo is not None:
+            t = t.astimezone().replace(tzinfo=None)
+    if (t - received_at).total_seconds() > INGEST_MAX_CLOCK_SKEW_SEC:
+        return received_at
+    return t
+
+def _is_gas_value(v):
+    return v is None or (isinstance(v, (int, float)) and not isinstance(v, bool))
+
+def _samples(r, received_at):
+    """[(ts, O2, CO, LEL, H2S)] of one reading entry, oldest first; malformed samples are skipped."""
+    raw = r.get("samples")
+    if raw is None:
+        raw = [(r.get("ts"), r.get("O2"), r.get("CO"), r.get("LEL"), r.get("H2S"))]
+    elif not isinstance(raw, list):
+        raise ValueError(f"samples of sensor {r.get('sensor_id')} is not a list")
+    out = []
+    for sample in raw:
+        try:
+            ts, o2, co, lel, h2s = sample
+            # gas values feed rollups and alarm thresholds: numbers or null only
+            if not all(_is_gas_value(v) for v in (o2, co, lel, h2s)):
+                raise ValueError("non-numeric gas value")
+            out.append((_sample_time(ts, received_at), o2, co, lel, h2s))
+        except (TypeError, ValueError, OverflowError, OSError):
+            print(f"Skipping malformed sample from sensor {r.get('sensor_id')}: {sample!r}")
+    out.sort(key=lambda s: s[0])
+    return out
+
+def _parse_readings(item):
+    """[(sensor_id, samples)] of a message; raises ValueError when it is malformed."""
+    readings = item.get("readings")
+    if not isinstance(readings, list):
+        raise ValueError("readings must be a list of objects")
+    out = []
+    for r in readings:
+        if not isinstance(r, dict):
+            raise ValueError(f"reading is not an object: {r!r}")
+        sid = r.get("sensor_id")
+        if sid:
+            out.append((sid, _samples(r, item["received_at"])))
+    return out
+
+def _apply_message(db, item, readings, ships, snap, touched, alarms, archive):
+    ship_id = item["ship_id"]
+    tank_id = item["tank_id"]
+    received_at = item["received_at"]
+
+    ship = ships.get(ship_id)
+    if not ship:
+        return
+
+    live = []
+    for sid, samples in readings:
+        # 1) Archive every sample at its device time, late ones included
+        #    (collected for one STORE.write per batch, which skips samples already
+        #    stored; reads order by timestamp)
+        for ts, o2, co, lel, h2s in samples:
+            archive.append({
+                "timestamp": ts, "ship_id": ship_id, "tank_id": tank_id, "sensor_id": sid,
+                "o2": o2, "co": co, "lel": lel, "h2s": h2s,
+            })
+        # 2) Only the sensor's newest sample can be live, and only if it is recent
+        if samples and (received_at - samples[-1][0]).total_seconds() <= LIVE_MAX_SAMPLE_AGE_SEC:
+            ts, o2, co, lel, h2s = samples[-1]
+            live.append({"sensor_id": sid, "ts": ts, "O2": o2, "CO": co, "LEL": lel, "H2S": h2s})
+    if not live:
+        return   # a late burst: history only, no live update, no alarms for stale data
+
+    # 3) Update LIVE_CACHE per sensor (aggregates over the tank's live sensors)
+    key = (ship_id, tank_id)
+    disp, worst = LIVE_CACHE.update(ship_id, tank_id, live)
+    touched[key] = True
+
+    # 4) Resolve thresholds (per-tank overrides if any), from the metadata cache
+    tank = snap.tanks.get(tank_id)
+    T = tank.thresholds if tank else DEFAULT_THRESHOLDS
+
+    # 5) Use WORST aggregate to evaluate safety (correct severity)
+    new_state = evaluate_state(worst.get("O2"), worst.get("CO"), worst.get("LEL"), worst.get("H2S"), T)
+    prev = ship.status or "Idle"
+
+    # 6) DISPLAY aggregate for ship.live_*: write-behind (see ship_live.py); the
+    #    API serves it from the live state meanwhile
+    SHIP_LIVE.put(ship_id, disp)
+
+    # 7) Log transitions + set ship status (ack still required to clear Danger)
+    def log_event(ev, details):
+        db.add(models.EventLog(
+            timestamp=item["received_at"], ship_id=ship_id, tank_id=tank_id,
+            severity="OK" if ev == "Clear" else ev, event=ev, details=details,
+            worst_o2=worst.get("O2"), worst_co=worst.get("CO"),
+            worst_lel=worst.get("LEL"), worst_h2s=worst.get("H2S"),
+        ))
+        alarms.append({"ship_id": ship_id, "tank_id": tank_id, "event": ev, "status": ship.status,
+                       "worst": dict(worst), "timestamp": datetime.datetime.now().isoformat()})
+
+    if new_state == "Danger" and prev != "Danger":
+        ship.previousStatus = ship.status
+        ship.status = "Danger"
+        log_event("Danger", f"[tank {tank_id}] worst O2={worst.get('O2')}, CO={worst.get('CO')}, LEL={worst.get('LEL')}, H2S={worst.get('H2S')}")
+    elif new_state == "Warning" and prev not in ("Danger","Warning"):
+        ship.status = "Warning"
+        log_event("Warning", f"[tank {tank_id}] worst O2={worst.get('O2')}, CO={worst.get('CO')}, LEL={worst.get('LEL')}, H2S={worst.get('H2S')}")
+    elif new_state == "OK" and prev in ("Danger","Warning"):
+        log_event("Clear", f"[tank {tank_id}] recovered; worst O2={worst.get('O2')}, CO={worst.get('CO')}, LEL={worst.get('LEL')}, H2S={worst.get('H2S')}")
+
+# --- Ingest pipeline: on_message enqueues, a writer thread commits batches ---
+INGEST = ingest.IngestPipeline(_write_batch)
+
+# --- NEW: multi-process ingest, sharded by ship (INGEST_WORKERS > 0) ---
+POOL = ingest_pool.IngestPool(STATE)
+
+def on_message_pooled(client, userdata, msg):
+    # leader side of INGEST_SHARDING=dispatch: route the raw message, decode in the worker
+    POOL.dispatch(msg.topic, msg.payload)
+
+@app.get("/api/ingest/stats", tags=["Ingest"])
+def get_ingest_stats():
+    return {**INGEST.stats(), "live_cache": LIVE_CACHE.stats(), "ship_live": SHIP_LIVE.stats(),
+            "pool": POOL.stats() if POOL.workers > 0 else None}
+
+@app.on_event("shutdown")
+def stop_ingest():
+    # the leader steps down: flushes anything still queued before the process exits
+    LEADER.stop()
+    STATE.stop()
+
+# --- Retention: chunked deletes of aged rows + SQLite incremental vacuum ---
+RETENTION = retention.RetentionScheduler(database.engine, STORE, COLD)
+
+@app.get("/api/retention/stats", tags=["Ingest"])
+def get_retention_stats():
+    return RETENTION.stats()
+
+@app.on_event("shutdown")
+def stop_retention():
+    RETENTION.stop()
+
+@app.on_event("shutdown")
+async def close_async_engine():
+    await database.async_engine.dispose()
 
 # --- SETUP AND START MQTT CLIENT IN A BACKGROUND THREAD ---
 mqtt_client = mqtt.Client()
@@ -580,3 +1022,34 @@ mqtt_client.on_message = on_message
 def start_mqtt_client():
     mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
     mqtt_client.loop_forever()
+
+# --- NEW: ingest leadership (one MQTT consumer per deployment) ---
+def _become_leader():
+    RETENTION.start()
+    _LIVE_SWEEP_STOP.clear()
+    threading.Thread(target=_live_sweeper, name="live-sweep", daemon=True).start()
+    if POOL.workers > 0:
+        POOL.start()
+        if POOL.sharding == "shared":
+            return   # workers hold the subscriptions
+        mqtt_client.on_message = on_message_pooled
+    else:
+        # Writer stage must be running before messages start arriving
+        INGEST.start()
+    mqtt_thread = threading.Thread(target=lambda: start_mqtt_client(), name="mqtt")
+    mqtt_thread.daemon = True
+    mqtt_thread.start()
+
+def _step_down():
+    mqtt_client.disconnect()   # ends loop_forever
+    POOL.stop()
+    INGEST.stop()
+    RETENTION.stop()
+    _LIVE_SWEEP_STOP.set()
+    _flush_ship_live(force=True)
+
+LEADER = leader.from_env(_become_leader, _step_down)
+
+@app.get("/api/cluster/stats", tags=["Ingest"])
+def get_cluster_stats():
+    return {**LEADER.stats(), "shared_state": type(STATE).__name__}
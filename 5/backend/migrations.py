@@ -0,0 +1,146 @@
+# migrations.py
+#
+# Minimal in-place schema upgrades for existing shipyard.db files.
+# `create_all` only creates missing tables, so columns/indexes added to
+# existing tables are applied here. Every step checks the live schema first,
+# so running upgrade() on every startup is safe.
+
+import re
+
+from sqlalchemy import func, inspect, select, text
+
+import models
+
+# alarm events that older builds wrote into sensor_logs (see _backfill_event_log;
+# their other events are copied by _backfill_legacy_events)
+_ALARM_SEVERITY = {"Danger": "Danger", "Warning": "Warning", "OK": "OK", "Clear": "OK"}
+
+
+def _add_column(conn, insp, table, column, ddl_type):
+    if column not in {c["name"] for c in insp.get_columns(table)}:
+        print(f"Migrating: adding {table}.{column}")
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+
+
+def _sync_indexes(conn, insp, table, drop=()):
+    """Create the model's declared indexes that are missing; drop superseded ones."""
+    present = {ix["name"] for ix in insp.get_indexes(table)}
+    for name in drop:
+        if name in present:
+            print(f"Migrating: dropping index {name}")
+            conn.execute(text(f"DROP INDEX {name}"))
+    for ix in models.Base.metadata.tables[table].indexes:
+        if ix.name not in present:
+            print(f"Migrating: creating index {ix.name}")
+            ix.create(bind=conn)
+
+
+_WORST_RE = re.compile(r"\b(O2|CO|LEL|H2S)=(-?[0-9.]+)")
+
+
+def parse_details(txt):
+    """Best-effort '[ship X tank N] worst O2=.., CO=..' parse of free-text details (legacy rows, UI events)."""
+    ship_id, tank_id = None, None
+    try:
+        if "ship " in txt:
+            ship_id = txt.split("ship ")[1].split(" ")[0].strip("[]:,")
+        if "tank " in txt:
+            tank_id = int(txt.split("tank ")[1].split("]")[0].split()[0].strip("[]:,"))
+    except (IndexError, ValueError):
+        pass
+    worst = {gas: float(v) for gas, v in _WORST_RE.findall(txt)}
+    return ship_id, tank_id, worst
+
+
+def _mark(conn, name):
+    """Progress of a one-shot data migration (None: never ran)."""
+    conn.execute(text("CREATE TABLE IF NOT EXISTS migration_marks (name VARCHAR PRIMARY KEY, value INTEGER NOT NULL)"))
+    return conn.execute(text("SELECT value FROM migration_marks WHERE name = :n"), {"n": name}).scalar()
+
+
+def _set_mark(conn, name, value):
+    if conn.execute(text("UPDATE migration_marks SET value = :v WHERE name = :n"), {"n": name, "v": value}).rowcount == 0:
+        conn.execute(text("INSERT INTO migration_marks (name, value) VALUES (:n, :v)"), {"n": name, "v": value})
+
+
+def _backfill_event_log(conn):
+    """Copy legacy alarm rows from sensor_logs into event_log (once)."""
+    if _mark(conn, "event_log_alarms") is not None:
+        return
+    L = models.SensorLogEntry.__table__.c
+    # builds from before the mark copied only into an empty event_log
+    if conn.execute(text("SELECT 1 FROM event_log LIMIT 1")).first():
+        legacy = []
+    else:
+        legacy = conn.execute(
+            select(L.timestamp, L.event, L.details).where(L.event.in_(list(_ALARM_SEVERITY)))
+        ).all()
+    if legacy:
+        print(f"Migrating: copying {len(legacy)} alarm events from sensor_logs to event_log")
+        rows = []
+        for ts, event, details in legacy:
+            ship_id, tank_id, worst = parse_details(details or "")
+            rows.append({"timestamp": ts, "ship_id": ship_id, "tank_id": tank_id,
+                         "severity": _ALARM_SEVERITY[event], "event": event, "details": details,
+                         "worst_o2": worst.get("O2"), "worst_co": worst.get("CO"),
+                         "worst_lel": worst.get("LEL"), "worst_h2s": worst.get("H2S")})
+        conn.execute(models.EventLog.__table__.insert(), rows)
+    _set_mark(conn, "event_log_alarms", 1)
+
+
+def _backfill_legacy_events(conn):
+    """Copy the other sensor_logs events (UI/audit actions, device notes) the old timeline
+    showed. Only rows above the highest sensor_logs id already handled are read, so rows
+    event_log retention later purges are not copied back."""
+    L, E = models.SensorLogEntry.__table__.c, models.EventLog.__table__.c
+    done = _mark(conn, "event_log_legacy_events")
+    top = conn.execute(select(func.max(L.id))).scalar() or 0
+    if done is not None and top <= done:
+        return
+    legacy = conn.execute(
+        select(L.timestamp, L.event, L.details)
+        .where(L.id > (done or 0), L.id <= top, L.event.is_not(None), L.event.not_in(list(_ALARM_SEVERITY)))
+    ).all()
+    copied = set()
+    if done is None and legacy:
+        # the first version of this step ran without a mark: skip what it copied
+        copied = set(conn.execute(select(E.timestamp, E.event, E.details).where(E.severity.is_(None))).all())
+    rows = []
+    for ts, event, details in legacy:
+        if (ts, event, details) in copied:
+            continue
+        ship_id, tank_id, _ = parse_details(details or "")
+        rows.append({"timestamp": ts, "ship_id": ship_id, "tank_id": tank_id, "severity": None,
+                     "event": event, "details": details})
+    if rows:
+        print(f"Migrating: copying {len(rows)} user/device events from sensor_logs to event_log")
+        conn.execute(models.EventLog.__table__.insert(), rows)
+    _set_mark(conn, "event_log_legacy_events", top)
+
+
+def _dedup_reading_archive(conn, insp):
+    """Remove duplicate samples (at-least-once resends) so the unique sample index can be built."""
+    if "ux_reading_archive_sample" in {ix["name"] for ix in insp.get_indexes("reading_archive")}:
+        return
+    n = conn.execute(text(
+        "DELETE FROM reading_archive WHERE id NOT IN ("
+        " SELECT MIN(id) FROM reading_archive GROUP BY ship_id, tank_id, sensor_id, timestamp)")).rowcount
+    if n:
+        print(f"Migrating: removed {n} duplicate samples from reading_archive")
+
+
+def upgrade(engine):
+    with engine.begin() as conn:
+        insp = inspect(conn)
+        # reading_archive: per-sensor column + composite range-scan indexes and
+        # the unique sample key; the old single-column ship_id index is a prefix
+        # of the new one
+        _add_column(conn, insp, "reading_archive", "sensor_id", "VARCHAR")
+        insp = inspect(conn)
+        _dedup_reading_archive(conn, insp)
+        _sync_indexes(conn, insp, "reading_archive", drop=("ix_reading_archive_ship_id",))
+        # rollups track their newest sample time (device-timestamped, out-of-order ingest)
+        _add_column(conn, insp, "reading_rollups", "last_ts", "TIMESTAMP")
+        # alarms moved from sensor_logs to the structured event_log table
+        _backfill_event_log(conn)
+        _backfill_legacy_events(conn)
@@ -1,6 +1,6 @@
 # models.py
 
-from sqlalchemy import Column, String, Integer, ForeignKey, Date, DateTime, JSON, Float
+from sqlalchemy import Column, String, Integer, ForeignKey, Date, DateTime, JSON, Float, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from database import Base
 from pydantic import BaseModel, Field
@@ -87,15 +87,81 @@ class TankThreshold(Base):
 # --- NEW: Simple reading archive (for plotting/download later) ---
 class ReadingArchive(Base):
     __tablename__ = "reading_archive"
+    __table_args__ = (
+        # per-tank / per-sensor window queries are index range scans, already in ts order
+        Index("ix_reading_archive_ship_tank_ts", "ship_id", "tank_id", "timestamp"),
+        Index("ix_reading_archive_sensor_ts", "sensor_id", "timestamp"),
+        # one row per sensor sample: at-least-once resends from the ship are ignored
+        Index("ux_reading_archive_sample", "ship_id", "tank_id", "sensor_id", "timestamp", unique=True),
+    )
     id = Column(Integer, primary_key=True, index=True)
-    ship_id = Column(String, index=True, nullable=False)
+    ship_id = Column(String, nullable=False)
     tank_id = Column(Integer, nullable=True)  # optional: wire to a specific tank later
+    sensor_id = Column(String, nullable=True)
     timestamp = Column(DateTime, default=datetime.datetime.now, nullable=False)
     o2 = Column(Float, nullable=True)
     co = Column(Float, nullable=True)
     lel = Column(Float, nullable=True)
     h2s = Column(Float, nullable=True)
 
+# --- NEW: Structured alarm/event log (replaces parsing SensorLogEntry.details) ---
+class EventLog(Base):
+    __tablename__ = "event_log"
+    __table_args__ = (
+        Index("ix_event_log_ts", "timestamp", "id"),
+        Index("ix_event_log_ship_tank_ts", "ship_id", "tank_id", "timestamp"),
+        Index("ix_event_log_severity_ts", "severity", "timestamp"),
+    )
+    id = Column(Integer, primary_key=True)
+    timestamp = Column(DateTime, default=datetime.datetime.now, nullable=False)
+    ship_id = Column(String, nullable=True)
+    tank_id = Column(Integer, nullable=True)
+    severity = Column(String, nullable=True)     # Danger | Warning | OK | None (user/audit events)
+    event = Column(String, nullable=False)
+    details = Column(String, nullable=True)
+    worst_o2 = Column(Float, nullable=True)
+    worst_co = Column(Float, nullable=True)
+    worst_lel = Column(Float, nullable=True)
+    worst_h2s = Column(Float, nullable=True)
+
+# --- NEW: Time-bucketed rollups of reading_archive (maintained by ingest) ---
+# One row per (ship, tank, resolution, bucket). Per gas we keep min/max/last
+# plus sum+count so the average stays exact as the bucket fills up.
+class ReadingRollup(Base):
+    __tablename__ = "reading_rollups"
+    __table_args__ = (
+        # doubles as the range-scan index for get_readings
+        UniqueConstraint("ship_id", "tank_id", "bucket_sec", "bucket_start", name="uq_rollup_bucket"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    ship_id = Column(String, nullable=False)
+    tank_id = Column(Integer, nullable=True)
+    bucket_sec = Column(Integer, nullable=False)        # 60 | 900 | 3600
+    bucket_start = Column(DateTime, nullable=False)
+    samples = Column(Integer, default=0, nullable=False)
+    last_ts = Column(DateTime, nullable=True)           # newest sample time; orders late (out-of-order) samples
+
+    o2_min = Column(Float, nullable=True)
+    o2_max = Column(Float, nullable=True)
+    o2_sum = Column(Float, nullable=True)
+    o2_n = Column(Integer, default=0, nullable=False)
+    o2_last = Column(Float, nullable=True)
+    co_min = Column(Float, nullable=True)
+    co_max = Column(Float, nullable=True)
+    co_sum = Column(Float, nullable=True)
+    co_n = Column(Integer, default=0, nullable=False)
+    co_last = Column(Float, nullable=True)
+    lel_min = Column(Float, nullable=True)
+    lel_max = Column(Float, nullable=True)
+    lel_sum = Column(Float, nullable=True)
+    lel_n = Column(Integer, default=0, nullable=False)
+    lel_last = Column(Float, nullable=True)
+    h2s_min = Column(Float, nullable=True)
+    h2s_max = Column(Float, nullable=True)
+    h2s_sum = Column(Float, nullable=True)
+    h2s_n = Column(Integer, default=0, nullable=False)
+    h2s_last = Column(Float, nullable=True)
+
 # --- Pydantic Schemas (For API Validation) ---
 
 class SensorLogEntrySchema(BaseModel):
@@ -0,0 +1,160 @@
+# payload_codec.py
+#
+# Compact binary encoding of a ship/<id>/sensors payload, for metered links.
+# Carries the same content as the JSON format (see main.on_message), with each
+# sensor id sent once in a table and the gas values as packed arrays:
+#
+#   header   <2sBBiB   magic b"MG", version, flags, tank_id, sensor count
+#   [base]   <d        epoch seconds all sample offsets refer to (FLAG_TS only)
+#   table    per sensor: <B length + UTF-8 sensor id
+#   [counts] <H per sensor: its number of samples                  (FLAG_TS only)
+#   [ts]     <i per sample: ms after base, sensors in table order   (FLAG_TS only)
+#   values   O2, CO, LEL, H2S per sample, sensors in table order,
+#            in the flags' value encoding
+#
+# Each array is contiguous, so decode is one numpy view per array rather
+# than a struct call per value.
+#
+# Value encodings (flags & 0x03):
+#   f32  float32, missing = NaN
+#   f16  float16 (~3 significant digits), missing = NaN
+#   i16  int16 scaled by SCALES (O2/LEL/H2S 0.01, CO 0.1), missing = -32768
+#
+# Without FLAG_TS every sensor has exactly one sample, stamped at arrival.
+# Timestamps may be given as epoch seconds or ISO 8601 strings, as in JSON;
+# they are sent as epoch seconds (naive ISO times are local time, the same
+# reading main._sample_time gives them).
+# JSON payloads start with "{" (or whitespace), so is_binary() tells the two
+# formats apart from the first bytes.
+
+import datetime
+import math
+import struct
+
+import numpy as np
+
+MAGIC = b"MG"
+VERSION = 1
+ENCODINGS = {"f32": 0, "f16": 1, "i16": 2}
+FLAG_TS = 0x80
+
+GAS_KEYS = ("O2", "CO", "LEL", "H2S")
+SCALES = (100, 10, 100, 100)          # i16: stored = round(value * scale)
+_I16_MISSING = -32768
+_NO_TANK = -2 ** 31
+_NO_TS = -2 ** 31
+
+_HEADER = struct.Struct("<2sBBiB")
+_BASE = struct.Struct("<d")
+_DTYPES = {0: np.dtype("<f4"), 1: np.dtype("<f2"), 2: np.dtype("<i2")}
+_DECIMALS = {0: 4, 1: 2}               # decoded floats are rounded to the encoding's precision
+
+
+def is_binary(payload):
+    return payload[:2] == MAGIC
+
+
+def _epoch(ts):
+    """Sample time (epoch seconds or ISO 8601) as epoch seconds; None stays None."""
+    if ts is None or (isinstance(ts, (int, float)) and not isinstance(ts, bool)):
+        return ts
+    if isinstance(ts, str):
+        return datetime.datetime.fromisoformat(ts).timestamp()   # naive: local time
+    raise ValueError(f"bad sample timestamp {ts!r}")
+
+
+def _samples(r):
+    """[(epoch ts | None, O2, CO, LEL, H2S)] of one reading in the JSON shape."""
+    if "samples" in r:
+        return [(_epoch(s[0]), *s[1:]) for s in r["samples"]]
+    return [(_epoch(r.get("ts")), r.get("O2"), r.get("CO"), r.get("LEL"), r.get("H2S"))]
+
+
+def _pack_values(code, samples):
+    vals = np.array([math.nan if v is None else v for s in samples for v in s[1:]],
+                    dtype=np.float64).reshape(-1, len(GAS_KEYS))
+    if code != 2:
+        return vals.astype(_DTYPES[code]).tobytes()
+    missing = np.isnan(vals)
+    scaled = np.round(np.where(missing, 0, vals) * SCALES)
+    bad = np.abs(scaled) > 32767
+    if bad.any():
+        row, col = np.argwhere(bad)[0]
+        raise ValueError(f"{GAS_KEYS[col]}={vals[row, col]} out of range for i16 encoding")
+    return np.where(missing, _I16_MISSING, scaled).astype(_DTYPES[2]).tobytes()
+
+
+def encode(tank_id, readings, encoding="f32"):
+    """Binary payload for {"tank_id": .., "readings": [..]} (legacy or "samples" readings)."""
+    code = ENCODINGS[encoding]
+    ids = [r["sensor_id"].encode() for r in readings]
+    per_sensor = [_samples(r) for r in readings]
+    samples = [s for ss in per_sensor for s in ss]
+    timestamped = any("samples" in r or "ts" in r for r in readings)
+    if not timestamped and len(samples) != len(readings):
+        raise ValueError("untimestamped readings carry one sample each")
+    out = [_HEADER.pack(MAGIC, VERSION, code | (FLAG_TS if timestamped else 0),
+                        _NO_TANK if tank_id is None else tank_id, len(ids))]
+    stamps = [s[0] for s in samples if s[0] is not None]
+    base = min(stamps) if stamps else 0.0
+    if timestamped:
+        out.append(_BASE.pack(base))
+    for sid in ids:
+        out.append(struct.pack("<B", len(sid)) + sid)
+    if timestamped:
+        out.append(struct.pack(f"<{len(ids)}H", *map(len, per_sensor)))
+        out.append(struct.pack(f"<{len(samples)}i",
+                               *(_NO_TS if s[0] is None else round((s[0] - base) * 1000) for s in samples)))
+    out.append(_pack_values(code, samples))
+    return b"".join(out)
+
+
+def decode(payload):
+    """Binary payload -> the equivalent JSON-shaped dict."""
+    magic, version, flags, tank_id, n = _HEADER.unpack_from(payload, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"unsupported payload version {version}")
+    code = flags & 0x03
+    if code not in _DTYPES:
+        raise ValueError(f"unknown value encoding {code}")
+    pos = _HEADER.size
+    timestamped = bool(flags & FLAG_TS)
+    if timestamped:
+        (base,) = _BASE.unpack_from(payload, pos)
+        pos += _BASE.size
+    ids = []
+    for _ in range(n):
+        size = payload[pos]
+        ids.append(payload[pos + 1:pos + 1 + size].decode())
+        pos += 1 + size
+    counts, offsets = [1] * n, None
+    if timestamped:
+        counts = struct.unpack_from(f"<{n}H", payload, pos)
+        pos += 2 * n
+        offsets = np.frombuffer(payload, "<i4", sum(counts), pos)
+        pos += offsets.nbytes
+    raw = np.frombuffer(payload, _DTYPES[code], sum(counts) * len(GAS_KEYS), pos).reshape(-1, len(GAS_KEYS))
+    pos += raw.nbytes
+    if pos != len(payload):
+        raise ValueError(f"{len(payload) - pos} trailing bytes")
+    # one row per sample, [ts, O2, CO, LEL, H2S] (ts only with FLAG_TS), built in numpy
+    if code == 2:
+        missing = raw == _I16_MISSING
+        vals = raw / SCALES
+    else:
+        missing = np.isnan(raw)
+        vals = raw.astype(np.float64).round(_DECIMALS[code])
+    if timestamped:
+        vals = np.column_stack((base + offsets / 1000.0, vals))
+        missing = np.column_stack((offsets == _NO_TS, missing))
+    rows = vals.tolist()
+    for i, j in np.argwhere(missing).tolist():
+        rows[i][j] = None
+    readings, k = [], 0
+    for sid, count in zip(ids, counts):
+        if timestamped:
+            readings.append({"sensor_id": sid, "samples": rows[k:k + count]})
+        else:
+            readings.append({"sensor_id": sid, **dict(zip(GAS_KEYS, rows[k]))})
+        k += count
+    return {"tank_id": None if tank_id == _NO_TANK else tank_id, "readings": readings}
@@ -0,0 +1,243 @@
+# readings_store.py
+#
+# Storage backend for the reading archive. The MQTT ingest writes through
+# STORE.write() and get_readings / the readings export build their queries with
+# STORE.select_window(), so the archive can be a plain table (SQLite, the
+# default) or a PostgreSQL table partitioned by time range and ship.
+#
+#   READINGS_STORE=auto|sql|postgres   auto = postgres when DATABASE_URL is PostgreSQL
+#   READINGS_PARTITION=day|week        partition width for the postgres store
+#
+# Samples are unique per (ship_id, tank_id, sensor_id, timestamp): the ship
+# side delivers at least once, so write() skips rows already stored and
+# returns only the ones it inserted (rollups are built from those).
+
+import csv
+import datetime
+import hashlib
+import io
+import os
+import re
+import threading
+
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+
+import models
+
+# keys of every row dict passed to write(), in COPY column order
+COLUMNS = ("timestamp", "ship_id", "tank_id", "sensor_id", "o2", "co", "lel", "h2s")
+
+
+def _key(r):
+    return r["ship_id"], r["tank_id"], r["sensor_id"], r["timestamp"]
+
+
+def _inserted(rows, stored):
+    """The rows whose (ship, tank, sensor, ts) key came back from INSERT ... RETURNING."""
+    by_key = {_key(r): r for r in rows}
+    return [by_key[tuple(k)] for k in stored if tuple(k) in by_key]
+
+
+class SqlReadingStore:
+    """reading_archive as one ordinary table, created by create_all (SQLite or any SQL DB)."""
+    name = "sql"
+
+    def setup(self, engine):
+        pass
+
+    def write(self, db, rows):
+        """Insert a batch of reading dicts inside the caller's transaction; returns the rows inserted."""
+        if not rows:
+            return []
+        A = models.ReadingArchive
+        dialect = db.get_bind().dialect.name
+        if dialect == "sqlite":
+            stmt = sqlite.insert(A).on_conflict_do_nothing()
+        elif dialect == "postgresql":
+            stmt = postgresql.insert(A).on_conflict_do_nothing()
+        else:
+            db.execute(insert(A), rows)
+            return rows
+        stored = db.execute(stmt.returning(A.ship_id, A.tank_id, A.sensor_id, A.timestamp), rows).all()
+        return _inserted(rows, stored)
+
+    def drop_partitions_before(self, cutoff):
+        """Drop whole storage units that end before cutoff; returns rows dropped (none here)."""
+        return 0
+
+    def _where(self, ship_id, tank_id=None, start=None, end=None, sensor_id=None):
+        A = models.ReadingArchive
+        where = [A.ship_id == ship_id]
+        if tank_id is not None:
+            where.append(A.tank_id == tank_id)
+        if sensor_id is not None:
+            where.append(A.sensor_id == sensor_id)
+        if start is not None:
+            where.append(A.timestamp >= start)
+        if end is not None:
+            where.append(A.timestamp < end)
+        return where
+
+    def select_window(self, columns, ship_id, tank_id=None, start=None, end=None, sensor_id=None):
+        """SELECT of `columns` for one ship's readings in [start, end), oldest first."""
+        A = models.ReadingArchive
+        return (select(*columns)
+                  .where(*self._where(ship_id, tank_id, start, end, sensor_id))
+                  .order_by(A.timestamp, A.id))
+
+    def count_window(self, ship_id, tank_id=None, start=None, end=None, sensor_id=None):
+        return (select(func.count())
+                  .select_from(models.ReadingArchive)
+                  .where(*self._where(ship_id, tank_id, start, end, sensor_id)))
+
+
+class PostgresPartitionedStore(SqlReadingStore):
+    """
+    reading_archive as a PostgreSQL table partitioned by RANGE(timestamp) into
+    day/week partitions, each sub-partitioned by LIST(ship_id) into one table
+    per ship. Partitions are created on demand before a batch is written, rows
+    go in with COPY, and every window query filters on both partition keys so
+    the planner prunes to the few partitions that can match.
+    """
+    name = "postgres"
+
+    _DDL = """
+        CREATE TABLE reading_archive (
+            id        BIGSERIAL,
+            ship_id   VARCHAR NOT NULL,
+            tank_id   INTEGER,
+            sensor_id VARCHAR,
+            timestamp TIMESTAMP NOT NULL,
+            o2 DOUBLE PRECISION, co DOUBLE PRECISION,
+            lel DOUBLE PRECISION, h2s DOUBLE PRECISION,
+            PRIMARY KEY (id, timestamp, ship_id)
+        ) PARTITION BY RANGE (timestamp)
+    """
+    _UNIQUE = ("CREATE UNIQUE INDEX IF NOT EXISTS ux_reading_archive_sample "
+               "ON reading_archive (ship_id, tank_id, sensor_id, timestamp)")
+    # COPY has no ON CONFLICT: batches go through a per-session staging table
+    _STAGE = """
+        CREATE TEMP TABLE IF NOT EXISTS reading_stage (
+            timestamp TIMESTAMP, ship_id VARCHAR, tank_id INTEGER, sensor_id VARCHAR,
+            o2 DOUBLE PRECISION, co DOUBLE PRECISION, lel DOUBLE PRECISION, h2s DOUBLE PRECISION
+        ) ON COMMIT DELETE ROWS
+    """
+
+    def __init__(self, period="day"):
+        if period not in ("day", "week"):
+            raise ValueError(f"unknown READINGS_PARTITION {period!r}")
+        self.period = period
+        self.engine = None
+        self._known = set()          # (ship_id, period start) partitions known to exist
+        self._lock = threading.Lock()
+
+    def setup(self, engine):
+        """Create the partitioned parent before create_all would create a plain table."""
+        self.engine = engine
+        with engine.begin() as conn:
+            kind = conn.execute(text(
+                "SELECT c.relkind FROM pg_class c WHERE c.oid = to_regclass('reading_archive')")).scalar()
+            if kind is None:
+                print(f"Creating partitioned reading_archive ({self.period} x ship)")
+                conn.execute(text(self._DDL))
+                conn.execute(text(self._UNIQUE))
+            elif kind != "p":
+                print("reading_archive exists as a plain table; writing to it without partitioning")
+                self._known = None
+
+    # --- partition management ---
+    def _period(self, ts):
+        start = datetime.datetime.combine(ts.date(), datetime.time.min)
+        if self.period == "week":
+            start -= datetime.timedelta(days=start.weekday())   # Monday
+            return start, start + datetime.timedelta(days=7)
+        return start, start + datetime.timedelta(days=1)
+
+    @staticmethod
+    def _ship_suffix(ship_id):
+        # ship ids are free text: readable prefix + hash keeps names unique and < 63 chars
+        slug = re.sub(r"[^a-z0-9]", "", ship_id.lower())[:20]
+        return f"{slug}_{hashlib.md5(ship_id.encode()).hexdigest()[:8]}"
+
+    def _ensure_partitions(self, keys):
+        missing = keys - self._known
+        if not missing:
+            return
+        with self._lock, self.engine.begin() as conn:
+            # own transaction: a rolled-back ingest batch must not take new partitions with it
+            for ship_id, start in sorted(missing - self._known):
+                end = self._period(start)[1]
+                parent = f"reading_archive_{start:%Y%m%d}"
+                conn.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {parent} PARTITION OF reading_archive "
+                    f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}') "
+                    f"PARTITION BY LIST (ship_id)"))
+                literal = ship_id.replace("'", "''")
+                conn.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {parent}_{self._ship_suffix(ship_id)} "
+                    f"PARTITION OF {parent} FOR VALUES IN ('{literal}')"))
+            self._known |= missing
+
+    def drop_partitions_before(self, cutoff):
+        """Retention: drop time partitions (with their ship sub-partitions) that end before cutoff."""
+        if self._known is None:
+            return 0
+        dropped = 0
+        with self._lock, self.engine.begin() as conn:
+            children = conn.execute(text(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = 'reading_archive'::regclass")).scalars().all()
+            for name in children:
+                m = re.fullmatch(r"reading_archive_(\d{8})", name)
+                if not m:
+                    continue
+                start = datetime.datetime.strptime(m.group(1), "%Y%m%d")
+                if self._period(start)[1] > cutoff:
+                    continue
+                dropped += conn.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+                conn.execute(text(f"DROP TABLE {name}"))
+                print(f"Retention: dropped partition {name}")
+            self._known = {k for k in self._known if self._period(k[1])[1] > cutoff}
+        return dropped
+
+    def write(self, db, rows):
+        if not rows:
+            return []
+        if self._known is None:   # legacy unpartitioned table
+            return super().write(db, rows)
+        self._ensure_partitions({(r["ship_id"], self._period(r["timestamp"])[0]) for r in rows})
+        db.execute(text(self._STAGE))
+        copy_sql = f"COPY reading_stage ({', '.join(COLUMNS)}) FROM STDIN"
+        cur = db.connection().connection.cursor()
+        try:
+            if hasattr(cur, "copy"):   # psycopg 3
+                with cur.copy(copy_sql) as cp:
+                    for r in rows:
+                        cp.write_row(tuple(r[c] for c in COLUMNS))
+            else:                      # psycopg2
+                buf = io.StringIO()
+                writer = csv.writer(buf)
+                for r in rows:
+                    writer.writerow(["" if r[c] is None else r[c] for c in COLUMNS])
+                buf.seek(0)
+                cur.copy_expert(copy_sql + " WITH (FORMAT csv)", buf)
+        finally:
+            cur.close()
+        cols = ", ".join(COLUMNS)
+        stored = db.execute(text(
+            f"INSERT INTO reading_archive ({cols}) SELECT {cols} FROM reading_stage "
+            f"ON CONFLICT DO NOTHING RETURNING ship_id, tank_id, sensor_id, timestamp")).all()
+        db.execute(text("DELETE FROM reading_stage"))
+        return _inserted(rows, stored)
+
+
+def from_env(database_url):
+    kind = os.getenv("READINGS_STORE", "auto")
+    if kind == "auto":
+        kind = "postgres" if database_url.startswith("postgresql") else "sql"
+    if kind == "sql":
+        return SqlReadingStore()
+    if kind == "postgres":
+        return PostgresPartitionedStore(os.getenv("READINGS_PARTITION", "day"))
+    raise ValueError(f"unknown READINGS_STORE {kind!r}")
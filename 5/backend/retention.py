@@ -0,0 +1,206 @@
+# retention.py
+#
+# Background retention for the time-series tables. Every RETENTION_INTERVAL_SEC
+# the scheduler thread deletes rows older than each policy's age in chunks of
+# RETENTION_CHUNK rows, one short transaction per chunk with a pause in
+# between, so the single writer connection keeps going back to the ingest
+# thread. Afterwards, on SQLite, freed pages are returned to the filesystem
+# with incremental vacuum.
+#
+# Databases created before auto_vacuum=INCREMENTAL was the default need one
+# full VACUUM to switch over. That rewrites the whole file while holding the
+# write lock, which stalls ingest for as long as it runs, so it is an offline
+# step: stop the backend, then
+#     sqlite3 shipyard.db "PRAGMA auto_vacuum=INCREMENTAL; VACUUM;"
+# (RETENTION_FULL_VACUUM=1 lets the scheduler do it in place, for small files.)
+#
+# Ages are in days; 0 keeps a table forever. Raw readings can go early
+# because the 1m/15m/1h rollups already summarize them. When the cold archive
+# is enabled, each pass first moves closed days of raw readings into it
+# (cold_archive.py), so the raw policy only sees what is still hot.
+
+import datetime
+import os
+import threading
+import time
+
+from sqlalchemy import delete, select, text
+
+import models
+
+RETENTION_INTERVAL_SEC = int(os.getenv("RETENTION_INTERVAL_SEC", "3600"))   # 0 disables the scheduler
+RETENTION_CHUNK = int(os.getenv("RETENTION_CHUNK", "5000"))                 # rows per DELETE
+RETENTION_PAUSE_MS = int(os.getenv("RETENTION_PAUSE_MS", "50"))             # yield to ingest between chunks
+RETENTION_VACUUM_PAGES = int(os.getenv("RETENTION_VACUUM_PAGES", "2000"))   # pages per incremental_vacuum step
+# converting an existing SQLite file to auto_vacuum=INCREMENTAL needs one full VACUUM (see above)
+RETENTION_FULL_VACUUM = os.getenv("RETENTION_FULL_VACUUM", "0") == "1"
+RETENTION_COLD_DAYS = int(os.getenv("RETENTION_COLD_DAYS", "0"))            # cold archive files; 0 = forever
+
+
+def _days(name, default):
+    return int(os.getenv(name, str(default)))
+
+
+class Policy:
+    __slots__ = ("name", "table", "ts_col", "where", "days")
+
+    def __init__(self, name, table, ts_col, days, where=()):
+        self.name = name
+        self.table = table
+        self.ts_col = ts_col
+        self.where = tuple(where)
+        self.days = days
+
+
+def default_policies():
+    A, R = models.ReadingArchive.__table__, models.ReadingRollup.__table__
+    L, E = models.SensorLogEntry.__table__, models.EventLog.__table__
+    return [
+        Policy("reading_archive", A, A.c.timestamp, _days("RETENTION_RAW_DAYS", 7)),
+        Policy("rollup_1m", R, R.c.bucket_start, _days("RETENTION_ROLLUP_1M_DAYS", 90), [R.c.bucket_sec == 60]),
+        Policy("rollup_15m", R, R.c.bucket_start, _days("RETENTION_ROLLUP_15M_DAYS", 365), [R.c.bucket_sec == 900]),
+        Policy("rollup_1h", R, R.c.bucket_start, _days("RETENTION_ROLLUP_1H_DAYS", 0), [R.c.bucket_sec == 3600]),
+        Policy("sensor_logs", L, L.c.timestamp, _days("RETENTION_SENSOR_LOGS_DAYS", 365)),
+        Policy("event_log", E, E.c.timestamp, _days("RETENTION_EVENTS_DAYS", 0)),
+    ]
+
+
+class RetentionScheduler:
+    """Daemon thread applying retention policies on a fixed interval."""
+
+    def __init__(self, engine, store, cold=None, policies=None, interval_sec=RETENTION_INTERVAL_SEC,
+                 chunk=RETENTION_CHUNK, pause_ms=RETENTION_PAUSE_MS):
+        self.engine = engine
+        self.store = store
+        self.cold = cold
+        self.policies = policies if policies is not None else default_policies()
+        self.interval_sec = interval_sec
+        self.chunk = max(1, chunk)
+        self.pause_sec = max(0, pause_ms) / 1000.0
+        self._stop = threading.Event()
+        self._thread = None
+        # stats (written by the scheduler thread, read by the stats endpoint)
+        self.runs = 0
+        self.last_run = None
+        self.last_run_sec = 0.0
+        self.deleted = {p.name: 0 for p in self.policies}
+        self.cold_files_deleted = 0
+        self.pages_reclaimed = 0
+        self.last_error = None
+        self._vacuum_warned = False
+
+    def start(self):
+        if self.interval_sec <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        # first pass shortly after startup, then every interval
+        while not self._stop.wait(min(60, self.interval_sec) if self.runs == 0 else self.interval_sec):
+            try:
+                self.run_once()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Retention pass failed: {e}")
+
+    # --- one pass ---
+    def run_once(self, now=None):
+        t0 = time.perf_counter()
+        now = now or datetime.datetime.now()
+        if self.cold is not None:
+            self.cold.compact(now)
+            if RETENTION_COLD_DAYS > 0:
+                self.cold_files_deleted += self.cold.drop_before(now - datetime.timedelta(days=RETENTION_COLD_DAYS))
+        for p in self.policies:
+            if p.days <= 0 or self._stop.is_set():
+                continue
+            cutoff = now - datetime.timedelta(days=p.days)
+            if p.table is models.ReadingArchive.__table__:
+                # partitioned stores drop whole partitions; the boundary one is chunk-deleted below
+                self.deleted[p.name] += self.store.drop_partitions_before(cutoff)
+            self.deleted[p.name] += self._purge(p, cutoff)
+        if self.engine.dialect.name == "sqlite" and not self._stop.is_set():
+            self.pages_reclaimed += self._reclaim_sqlite()
+        self.runs += 1
+        self.last_run = now.isoformat()
+        self.last_run_sec = round(time.perf_counter() - t0, 3)
+        self.last_error = None
+
+    def _purge(self, p, cutoff):
+        t = p.table
+        oldest = (select(t.c.id)
+                    .where(p.ts_col < cutoff, *p.where)
+                    .order_by(t.c.id)
+                    .limit(self.chunk))
+        total = 0
+        while not self._stop.is_set():
+            with self.engine.begin() as conn:
+                n = conn.execute(delete(t).where(t.c.id.in_(oldest))).rowcount
+            total += n
+            if n < self.chunk:
+                break
+            time.sleep(self.pause_sec)
+        if total:
+            print(f"Retention: removed {total} rows from {p.name} older than {cutoff:%Y-%m-%d %H:%M}")
+        return total
+
+    def _reclaim_sqlite(self):
+        with self.engine.connect() as conn:
+            mode = conn.execute(text("PRAGMA auto_vacuum")).scalar()
+            free = conn.execute(text("PRAGMA freelist_count")).scalar()
+        if not free:
+            return 0
+        if mode != 2:   # not INCREMENTAL yet
+            if free < RETENTION_VACUUM_PAGES:
+                return 0
+            if not RETENTION_FULL_VACUUM:
+                if not self._vacuum_warned:
+                    print(f"Retention: {free} free pages can't be reclaimed: the database predates "
+                          f"auto_vacuum=INCREMENTAL. Run a full VACUUM offline (see retention.py).")
+                    self._vacuum_warned = True
+                return 0
+            print(f"Retention: VACUUM to enable incremental auto_vacuum ({free} free pages)")
+            with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                conn.execute(text("PRAGMA auto_vacuum=INCREMENTAL"))
+                conn.execute(text("VACUUM"))
+                conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+            return free
+        reclaimed = 0
+        while free > 0 and not self._stop.is_set():
+            step = min(free, RETENTION_VACUUM_PAGES)
+            with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                # the pragma frees one page per sqlite3_step(); executescript() steps it to completion
+                conn.connection.driver_connection.executescript(f"PRAGMA incremental_vacuum({step});")
+                left = conn.execute(text("PRAGMA freelist_count")).scalar()
+            reclaimed += free - left
+            if left >= free:
+                break
+            free = left
+            time.sleep(self.pause_sec)
+        if reclaimed:
+            # the file only shrinks once the truncated pages are checkpointed out of the WAL
+            with self.engine.connect() as conn:
+                conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+        return reclaimed
+
+    def stats(self):
+        return {
+            "interval_sec": self.interval_sec,
+            "chunk": self.chunk,
+            "policies_days": {p.name: p.days for p in self.policies},
+            "runs": self.runs,
+            "last_run": self.last_run,
+            "last_run_sec": self.last_run_sec,
+            "deleted": dict(self.deleted),
+            "cold_files_deleted": self.cold_files_deleted,
+            "cold": self.cold.stats() if self.cold is not None else None,
+            "pages_reclaimed": self.pages_reclaimed,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,168 @@
+# rollups.py
+#
+# Continuous 1-minute / 15-minute / 1-hour rollups of the reading archive.
+# The ingest writer feeds every reading STORE.write() actually inserted (not
+# resends it skipped) into a RollupAccumulator and flushes it with the same
+# transaction, so rollups are always in step with reading_archive.
+# get_readings uses choose_level() to serve long windows from a rollup instead
+# of every raw row.
+
+import datetime
+
+from sqlalchemy import insert, select, update
+
+import models
+
+ROLLUP_LEVELS = (60, 900, 3600)   # bucket sizes in seconds, finest first
+
+# payload key -> column prefix
+GASES = (("O2", "o2"), ("CO", "co"), ("LEL", "lel"), ("H2S", "h2s"))
+
+
+def bucket_start(ts, bucket_sec):
+    """Floor a naive datetime to the start of its bucket."""
+    epoch = int(ts.replace(tzinfo=datetime.timezone.utc).timestamp())
+    start = epoch - epoch % bucket_sec
+    return datetime.datetime.fromtimestamp(start, datetime.timezone.utc).replace(tzinfo=None)
+
+
+class _Partial:
+    """Aggregate of the readings of one bucket seen in the current batch."""
+    __slots__ = ("samples", "gas", "last_ts")
+
+    def __init__(self):
+        self.samples = 0
+        self.gas = {p: [None, None, 0.0, 0, None, None] for _, p in GASES}   # min, max, sum, n, last, last ts
+        self.last_ts = None
+
+    def add(self, reading, ts):
+        # samples can arrive out of order: "last" is the value with the latest timestamp
+        self.samples += 1
+        if self.last_ts is None or ts > self.last_ts:
+            self.last_ts = ts
+        for key, p in GASES:
+            v = reading.get(key)
+            if v is None:
+                continue
+            g = self.gas[p]
+            g[0] = v if g[0] is None else min(g[0], v)
+            g[1] = v if g[1] is None else max(g[1], v)
+            g[2] += v
+            g[3] += 1
+            if g[5] is None or ts >= g[5]:
+                g[4], g[5] = v, ts
+
+
+class RollupAccumulator:
+    def __init__(self, levels=ROLLUP_LEVELS):
+        self.levels = levels
+        self.partials = {}   # (ship_id, tank_id, bucket_sec, bucket_start) -> _Partial
+
+    def add(self, ship_id, tank_id, ts, reading):
+        for sec in self.levels:
+            key = (ship_id, tank_id, sec, bucket_start(ts, sec))
+            part = self.partials.get(key)
+            if part is None:
+                part = self.partials[key] = _Partial()
+            part.add(reading, ts)
+
+    def flush(self, db):
+        """Merge the batch's partials into reading_rollups (caller commits)."""
+        if not self.partials:
+            return
+        R = models.ReadingRollup
+        ships = {k[0] for k in self.partials}
+        starts = {k[3] for k in self.partials}
+        existing = {
+            (r.ship_id, r.tank_id, r.bucket_sec, r.bucket_start): r
+            for r in db.execute(select(R.__table__).where(R.ship_id.in_(ships), R.bucket_start.in_(starts)))
+        }
+        # every dict carries every column so each list goes out as one executemany
+        inserts, updates = [], []
+        for key, part in self.partials.items():
+            row = existing.get(key)
+            vals = {"samples": (row.samples if row else 0) + part.samples}
+            # late samples must not replace a stored "last" from a later time
+            newer = row is None or row.last_ts is None or part.last_ts >= row.last_ts
+            vals["last_ts"] = part.last_ts if newer else row.last_ts
+            for _, p in GASES:
+                mn, mx, sm, n, last, _ts = part.gas[p]
+                cur_min = getattr(row, f"{p}_min") if row else None
+                cur_max = getattr(row, f"{p}_max") if row else None
+                cur_sum = getattr(row, f"{p}_sum") if row else None
+                cur_n = getattr(row, f"{p}_n") if row else 0
+                cur_last = getattr(row, f"{p}_last") if row else None
+                if n:
+                    cur_min = mn if cur_min is None else min(cur_min, mn)
+                    cur_max = mx if cur_max is None else max(cur_max, mx)
+                    cur_sum = (cur_sum or 0.0) + sm
+                    cur_n += n
+                    if newer or cur_last is None:
+                        cur_last = last
+                vals.update({f"{p}_min": cur_min, f"{p}_max": cur_max, f"{p}_sum": cur_sum,
+                             f"{p}_n": cur_n, f"{p}_last": cur_last})
+            if row is None:
+                ship_id, tank_id, sec, start = key
+                inserts.append({"ship_id": ship_id, "tank_id": tank_id, "bucket_sec": sec,
+                                "bucket_start": start, **vals})
+            else:
+                updates.append({"id": row.id, **vals})
+        if inserts:
+            db.execute(insert(R), inserts)
+        if updates:
+            db.execute(update(R), updates)   # ORM bulk UPDATE by primary key
+        self.partials.clear()
+
+
+def choose_level(minutes, max_points, raw_count):
+    """
+    Pick the source for a window: None (raw rows) if the raw series already fits
+    in max_points, else the finest rollup whose bucket count fits, else the
+    coarsest rollup we have (rollup_points() then merges its buckets down to
+    max_points).
+    """
+    if raw_count <= max_points:
+        return None
+    for sec in ROLLUP_LEVELS:
+        if (minutes * 60) // sec <= max_points:
+            return sec
+    return ROLLUP_LEVELS[-1]
+
+
+def rollup_select(ship_id, tank_id, cutoff, bucket_sec):
+    R = models.ReadingRollup
+    return (select(R)
+              .where(R.ship_id == ship_id, R.tank_id == tank_id,
+                     R.bucket_sec == bucket_sec, R.bucket_start >= bucket_start(cutoff, bucket_sec))
+              .order_by(R.bucket_start.asc()))
+
+
+def rollup_points(rows, max_points=None):
+    """
+    One point per bucket; with max_points, runs of adjacent buckets are merged
+    (sums, counts, min/max and the newest last combine exactly) so at most
+    max_points points come back.
+    """
+    rows = list(rows)
+    groups = [[r] for r in rows]
+    if max_points is not None and len(rows) > max_points:
+        starts = sorted({len(rows) * i // max_points for i in range(max_points)})
+        groups = [rows[a:b] for a, b in zip(starts, starts[1:] + [len(rows)])]
+    out = []
+    for group in groups:
+        point = {"ts": group[0].bucket_start.isoformat(), "n": sum(r.samples or 0 for r in group),
+                 "min": {}, "max": {}, "last": {}}
+        for key, p in GASES:
+            n = sum(getattr(r, f"{p}_n") or 0 for r in group)
+            total = sum(getattr(r, f"{p}_sum") or 0.0 for r in group)
+            mins = [v for v in (getattr(r, f"{p}_min") for r in group) if v is not None]
+            maxs = [v for v in (getattr(r, f"{p}_max") for r in group) if v is not None]
+            lasts = [v for v in (getattr(r, f"{p}_last") for r in group) if v is not None]
+            # top-level gas value is the bucket average, so raw consumers keep working
+            point[key] = total / n if n else None
+            point["min"][key] = min(mins) if mins else None
+            point["max"][key] = max(maxs) if maxs else None
+            point["last"][key] = lasts[-1] if lasts else None
+        out.append(point)
+    return out
+
@@ -5,6 +5,8 @@ import time
 import json
 import random
 
+import payload_codec
+
 # --------- Config ---------
 MQTT_BROKER = "localhost"
 MQTT_PORT   = 1883
@@ -17,6 +19,7 @@ SENSORS = ["SN-G-001", "CO-L-23B", "S3"]
 
 PUBLISH_TOPIC = f"ship/{SHIP_ID}/sensors"
 INTERVAL_SEC  = 3
+PAYLOAD_ENCODING = "json"  # json, or a binary payload_codec encoding: f32 | f16 | i16
 
 # Starting baselines (per sensor) and step magnitudes
 O2_BASE,  O2_STEP  = 20.9, 0.20    # O2 around 20–21%, small drift
@@ -99,11 +102,16 @@ def publish_sensor_data():
             if _state[sid]["CO"] > 100:
                 _state[sid]["CO"] = CO_BASE
 
-        payload = json.dumps({"tank_id": TANK_ID, "readings": readings})
+        if PAYLOAD_ENCODING == "json":
+            payload = json.dumps({"tank_id": TANK_ID, "readings": readings})
+            shown = payload
+        else:
+            payload = payload_codec.encode(TANK_ID, readings, PAYLOAD_ENCODING)
+            shown = f"{len(payload)} bytes ({PAYLOAD_ENCODING})"
         result = client.publish(PUBLISH_TOPIC, payload, qos=1)
         status = result[0]
         if status == 0:
-            print(f"Sent {payload} -> {PUBLISH_TOPIC}")
+            print(f"Sent {shown} -> {PUBLISH_TOPIC}")
         else:
             print(f"Failed to send message to topic {PUBLISH_TOPIC}")
 
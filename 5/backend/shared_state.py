@@ -0,0 +1,226 @@
+# shared_state.py
+#
+# Live state that every API worker must agree on: the per-tank live payloads
+# behind /api/fleet/live, /api/ships/{id}/tanks/{id}/live and the SSE
+# snapshot, plus the event bus that fans ingest events ("live", "alarm") and
+# cache invalidations ("meta", "ships", ...) out to every process.
+#
+# Only the elected ingest leader (see leader.py) writes live payloads; every
+# worker reads them from here and receives every event through its handler.
+#
+#   REDIS_URL unset -> LocalState: in-process dict + direct callbacks
+#                      (single worker only)
+#   REDIS_URL set   -> RedisState: hash + sorted set in Redis, events over
+#                      pub/sub, so any number of workers/replicas share it
+
+import json
+import os
+import threading
+
+REDIS_URL = os.getenv("REDIS_URL")
+LIVE_STATE_PREFIX = os.getenv("LIVE_STATE_PREFIX", "maritime:")
+STATE_RECONNECT_MAX_SEC = float(os.getenv("STATE_RECONNECT_MAX_SEC", "30"))   # pub/sub reconnect backoff cap
+
+
+def _field(ship_id, tank_id):
+    return f"{ship_id}|{tank_id}"
+
+
+class LocalState:
+    """In-process store; events are delivered synchronously to the handler."""
+    shared = False
+
+    def __init__(self, on_event):
+        self.on_event = on_event       # callback(kind, ship_id, tank_id, data)
+        self._lock = threading.Lock()
+        self._live = {}                # (ship_id, tank_id) -> payload
+        self._seq = 0
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    # --- live payloads (written by the ingest leader) ---
+    def put_live(self, ship_id, tank_id, payload):
+        """Store payload under a new, increasing "seq" (set on the payload) and return it."""
+        with self._lock:
+            self._seq += 1
+            payload["seq"] = self._seq
+            self._live[(ship_id, tank_id)] = payload
+        return payload
+
+    def remove_live(self, ship_id, tank_id):
+        with self._lock:
+            self._seq += 1
+            self._live.pop((ship_id, tank_id), None)
+
+    def get_live(self, ship_id, tank_id):
+        with self._lock:
+            return self._live.get((ship_id, tank_id))
+
+    def fleet(self, since=0):
+        """(current seq, payloads with seq > since)."""
+        with self._lock:
+            return self._seq, [p for p in self._live.values() if p["seq"] > since]
+
+    # --- events ---
+    def publish(self, kind, ship_id=None, tank_id=None, data=None):
+        self.on_event(kind, ship_id, tank_id, data)
+
+
+class RedisState:
+    """
+    Redis-backed store shared by all workers:
+      <prefix>live      hash   "ship|tank" -> payload JSON
+      <prefix>live:seq  sorted set of "ship|tank" by last seq (for ?since=)
+      <prefix>seq       counter
+      <prefix>events    pub/sub channel
+    """
+    shared = True
+
+    def __init__(self, on_event, url=REDIS_URL, prefix=LIVE_STATE_PREFIX, client=None):
+        if client is None:
+            import redis   # only needed when REDIS_URL is set
+            client = redis.Redis.from_url(url)
+        self.r = client
+        self.on_event = on_event
+        self.k_live, self.k_order = f"{prefix}live", f"{prefix}live:seq"
+        self.k_seq, self.channel = f"{prefix}seq", f"{prefix}events"
+        self._pubsub = None
+        self._thread = None
+        self._stop = threading.Event()
+        self.reconnects = 0
+
+    def _subscribe(self):
+        self._pubsub = self.r.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(self.channel)
+
+    def start(self):
+        """Subscribe before serving, so no event published after startup is missed."""
+        self._stop.clear()
+        self._subscribe()
+        self._thread = threading.Thread(target=self._listen, name="state-events", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._pubsub is not None:
+            self._pubsub.close()
+
+    def _listen(self):
+        # a lost connection drops pub/sub messages for good: reconnect with
+        # backoff, then replay the invalidations locally, since any of them
+        # may have been missed while disconnected
+        delay = 0.5
+        while not self._stop.is_set():
+            try:
+                if self._pubsub is None:
+                    self._subscribe()
+                    self.reconnects += 1
+                    print("Shared-state subscriber reconnected")
+                    for kind in ("meta", "ships"):
+                        self.on_event(kind, None, None, None)
+                delay = 0.5
+                while not self._stop.is_set():
+                    msg = self._pubsub.get_message(timeout=1.0)
+                    if msg is None:
+                        continue
+                    try:
+                        ev = json.loads(msg["data"])
+                        self.on_event(ev["kind"], ev.get("ship_id"), ev.get("tank_id"), ev.get("data"))
+                    except Exception as e:
+                        print(f"Bad shared-state event: {e}")
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                print(f"Shared-state subscriber lost its connection ({e}); retrying in {delay:.1f}s")
+            if self._pubsub is not None:
+                try:
+                    self._pubsub.close()
+                except Exception:
+                    pass
+                self._pubsub = None
+            self._stop.wait(delay)
+            delay = min(delay * 2, STATE_RECONNECT_MAX_SEC)
+
+    # --- live payloads ---
+    def put_live(self, ship_id, tank_id, payload):
+        payload["seq"] = seq = self.r.incr(self.k_seq)
+        field = _field(ship_id, tank_id)
+        pipe = self.r.pipeline()
+        pipe.hset(self.k_live, field, json.dumps(payload))
+        pipe.zadd(self.k_order, {field: seq})
+        pipe.execute()
+        return payload
+
+    def remove_live(self, ship_id, tank_id):
+        field = _field(ship_id, tank_id)
+        pipe = self.r.pipeline()
+        pipe.incr(self.k_seq)
+        pipe.hdel(self.k_live, field)
+        pipe.zrem(self.k_order, field)
+        pipe.execute()
+
+    def get_live(self, ship_id, tank_id):
+        raw = self.r.hget(self.k_live, _field(ship_id, tank_id))
+        return json.loads(raw) if raw else None
+
+    def fleet(self, since=0):
+        pipe = self.r.pipeline()
+        pipe.get(self.k_seq)
+        pipe.zrangebyscore(self.k_order, f"({since}", "+inf")
+        seq, fields = pipe.execute()
+        if not fields:
+            return int(seq or 0), []
+        return int(seq or 0), [json.loads(p) for p in self.r.hmget(self.k_live, fields) if p]
+
+    # --- events ---
+    def publish(self, kind, ship_id=None, tank_id=None, data=None):
+        self.r.publish(self.channel, json.dumps(
+            {"kind": kind, "ship_id": ship_id, "tank_id": tank_id, "data": data}))
+
+
+class ForwardState:
+    """
+    Stand-in used inside ingest pool workers (ingest_pool.py) when the
+    leader's state is in-process: writes and events are queued to the leader,
+    which applies them to its LocalState.
+    """
+    shared = False
+
+    def __init__(self, outbox):
+        self.outbox = outbox
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def put_live(self, ship_id, tank_id, payload):
+        self.outbox.put(("put_live", ship_id, tank_id, payload))
+        return payload   # the leader assigns the seq
+
+    def remove_live(self, ship_id, tank_id):
+        self.outbox.put(("remove_live", ship_id, tank_id))
+
+    def get_live(self, ship_id, tank_id):
+        return None
+
+    def fleet(self, since=0):
+        return 0, []     # stale-entry cleanup runs in the leader
+
+    def publish(self, kind, ship_id=None, tank_id=None, data=None):
+        self.outbox.put(("publish", kind, ship_id, tank_id, data))
+
+
+def from_env(on_event):
+    if not REDIS_URL:
+        return LocalState(on_event)
+    try:
+        return RedisState(on_event)
+    except ImportError:
+        print("REDIS_URL is set but the redis package is not installed: using in-process live state")
+        return LocalState(on_event)
@@ -0,0 +1,70 @@
+# ship_live.py
+#
+# Write-behind buffer for the denormalized Ship.live_o2/live_co/live_lel/
+# live_h2s columns. Ingest records every new display aggregate here instead
+# of updating the ships row per batch; a ship's buffered values reach the
+# database at most once per SHIP_LIVE_FLUSH_SEC (with the next ingest batch
+# for that ship, or the live sweeper for ships that went quiet), and at once
+# on a status transition so the alarm row and the values it shows commit
+# together. Values taken for a transaction that then fails are restored.
+# The API reads fresh values from the live state, not these columns.
+
+import os
+import threading
+import time
+
+SHIP_LIVE_FLUSH_SEC = float(os.getenv("SHIP_LIVE_FLUSH_SEC", "5"))
+LIVE_COLUMNS = {"live_o2": "O2", "live_co": "CO", "live_lel": "LEL", "live_h2s": "H2S"}
+
+
+class ShipLiveBuffer:
+    def __init__(self, interval=SHIP_LIVE_FLUSH_SEC):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pending = {}      # ship_id -> {column: value}, newest unflushed values
+        self._flushed_at = {}   # ship_id -> time.monotonic() of its last flush
+        # stats
+        self.updates = 0
+        self.flushes = 0
+
+    def put(self, ship_id, display):
+        """Buffer a ship's latest display aggregate ({"O2": .., "CO": .., ...})."""
+        values = {col: display.get(gas) for col, gas in LIVE_COLUMNS.items()}
+        with self._lock:
+            self._pending[ship_id] = values
+            self.updates += 1
+
+    def take_due(self, ship_ids=None, force=False):
+        """{ship_id: values} whose last flush is at least `interval` old (all of them with force)."""
+        now = time.monotonic()
+        out = {}
+        with self._lock:
+            for ship_id in list(self._pending if ship_ids is None else ship_ids):
+                if ship_id not in self._pending:
+                    continue
+                if force or now - self._flushed_at.get(ship_id, float("-inf")) >= self.interval:
+                    out[ship_id] = self._pending.pop(ship_id)
+                    self._flushed_at[ship_id] = now
+            self.flushes += len(out)
+        return out
+
+    def restore(self, taken):
+        """Put back {ship_id: values} whose flush failed; newer buffered values win."""
+        with self._lock:
+            for ship_id, values in taken.items():
+                self._pending.setdefault(ship_id, values)
+                self._flushed_at.pop(ship_id, None)   # due again on the next flush
+            self.flushes -= len(taken)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def stats(self):
+        return {"interval_sec": self.interval, "pending": len(self._pending),
+                "updates": self.updates, "flushes": self.flushes}
+
+
+def apply(ship, values):
+    """Copy buffered values onto a Ship row."""
+    for col, value in values.items():
+        setattr(ship, col, value)
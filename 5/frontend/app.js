@@ -45,6 +45,7 @@ const ALARM = (() => {
 
   // state
   let polling = null;
+  let stream = null;
   let stageTimer = null;
   let countdownTimer = null;
 
@@ -171,54 +172,60 @@ const ALARM = (() => {
     }
   }
 
-  // core polling loop
+  // raise an incident for a fleet/stream live entry if it is in Danger
+  function maybeRaise(d) {
+    if (!d || !isDanger(d.aggregates?.worst, d.thresholds)) return false;
+
+    // if we already acked this ship+tank recently (e.g., last 2 minutes), skip re-prompting
+    const lastAck = parseInt(localStorage.getItem(`ack:${d.ship_id}:${d.tank_id}`) || '0', 10);
+    if (Date.now() - lastAck < 120000) return false; // 2 min cool-down after ack
+
+    active = { ship_id: d.ship_id, tank_id: d.tank_id, stage: 0, deadline: 0 };
+    wireAcknowledgeButton();
+    startStage(0);
+    return true;
+  }
+
+  // fallback polling loop: one fleet-wide snapshot request per cycle,
+  // asking only for entries that changed since the last one we saw
+  let lastSeq = 0;
   async function poll() {
     try {
       // if an alarm is active (stage 0/1 in progress), let it finish escalation unless acknowledged
       if (active && active.stage < 2) return;
 
-      // fetch ships with nested tanks
-      const res = await fetch(`${API_BASE_URL}/api/ships`);
-      const ships = await res.json();
-      if (!Array.isArray(ships)) return;
-
-      for (const s of ships) {
-        // if we already acked this ship+tank recently (e.g., last 2 minutes), skip re-prompting
-        const tanks = (s.tanks || []);
-        for (const t of tanks) {
-          const ackKey = `ack:${s.id}:${t.id}`;
-          const lastAck = parseInt(localStorage.getItem(ackKey) || '0', 10);
-          if (Date.now() - lastAck < 120000) continue; // 2 min cool-down after ack
-
-          // get live + thresholds; decide Danger
-          const [liveRes, thrRes] = await Promise.all([
-            fetch(`${API_BASE_URL}/api/ships/${encodeURIComponent(s.id)}/tanks/${t.id}/live`),
-            fetch(`${API_BASE_URL}/api/ships/${encodeURIComponent(s.id)}/tanks/${t.id}/thresholds`)
-          ]);
-          const live = await liveRes.json();
-          const thr  = await thrRes.json();
-          const worst = (live && live.aggregates && live.aggregates.worst) ? live.aggregates.worst : null;
-
-          if (isDanger(worst, thr)) {
-            // start a new incident
-            active = { ship_id: s.id, tank_id: t.id, stage: 0, deadline: 0 };
-            wireAcknowledgeButton();
-            startStage(0);
-            return; // handle one at a time
-          }
-        }
+      const res = await fetch(`${API_BASE_URL}/api/fleet/live?since=${lastSeq}`);
+      const snap = await res.json();
+      lastSeq = snap.seq ?? lastSeq;
+      for (const d of (snap.tanks || [])) {
+        if (maybeRaise(d)) return; // handle one at a time
       }
     } catch (e) {
       // ignore network errors; keep polling
     }
   }
 
+  // push path: the server streams a 'live' event (with thresholds) per tank
+  // update, so no per-tank fetches are needed
+  function onLive(ev) {
+    if (active && active.stage < 2) return;
+    try { maybeRaise(JSON.parse(ev.data)); } catch {}
+  }
+
   function start() {
     // inject modal + wire acknowledge
     ensureModal();
     wireAcknowledgeButton();
 
-    // begin polling
+    // prefer the SSE stream (EventSource reconnects on its own)
+    if (window.EventSource) {
+      stream && stream.close();
+      stream = new EventSource(`${API_BASE_URL}/api/stream/live`);
+      stream.addEventListener('live', onLive);
+      return;
+    }
+
+    // fallback for browsers without EventSource: begin polling
     clearInterval(polling);
     polling = setInterval(poll, POLL_MS);
     // also do an immediate check on load
@@ -890,42 +897,70 @@ async function initShipPage() {
   // ✅ Fetch permits and render the table
 const permitsRaw = await fetchPermitsForShip(currentShip.id);
 renderPermitSummary(normalizePermits(permitsRaw));
-// poll every 2s for fresh values + live sensors
+// live sensors + KPIs are pushed over SSE for this ship only
+  window.__shipStream && window.__shipStream.close();
+  window.__shipStream = new EventSource(`${API_BASE_URL}/api/stream/live?ship_id=${encodeURIComponent(currentShip.id)}`);
+  window.__shipStream.addEventListener('live', (ev) => {
+    let live;
+    try { live = JSON.parse(ev.data); } catch { return; }
+    if (live.tank_id !== currentTankId) return;
+    renderTankSensorsLive(live.sensors);
+    currentShip.live_o2  = live.aggregates?.display?.O2  ?? currentShip.live_o2;
+    currentShip.live_co  = live.aggregates?.display?.CO  ?? currentShip.live_co;
+    currentShip.live_lel = live.aggregates?.display?.LEL ?? currentShip.live_lel;
+    currentShip.live_h2s = live.aggregates?.display?.H2S ?? currentShip.live_h2s;
+    renderShipKPIsWithThresholds(currentShip);
+  });
+  // status changes (Danger/Warning/Clear) arrive as alarm transitions
+  window.__shipStream.addEventListener('alarm', (ev) => {
+    try { currentShip.status = JSON.parse(ev.data).status; } catch { return; }
+    renderShipKPIsWithThresholds(currentShip);
+  });
+
+  // sparklines are history, not live state: refresh them on a slow timer
   window.__shipPoll && clearInterval(window.__shipPoll);
-  window.__shipPoll = setInterval(async () => {
-    try {
-      const res = await fetch(`${API_BASE_URL}/api/ships`);
-      const ships = await res.json();
-      const updated = ships.find(s => s.id === currentShip.id);
-      if (updated) {
-        currentShip = updated;
-        // refresh live sensors for current tank and sync KPIs to DISPLAY aggregate
-        if (currentTankId != null) {
-          try {
-            const live = await fetchTankLive(currentShip.id, currentTankId);
-            renderTankSensorsLive(live.sensors);
-            currentShip.live_o2  = live.aggregates?.display?.O2  ?? currentShip.live_o2;
-            currentShip.live_co  = live.aggregates?.display?.CO  ?? currentShip.live_co;
-            currentShip.live_lel = live.aggregates?.display?.LEL ?? currentShip.live_lel;
-            currentShip.live_h2s = live.aggregates?.display?.H2S ?? currentShip.live_h2s;
-          } catch(e) { /* keep last visuals if live fails */ }
-        }
-        renderShipKPIsWithThresholds(currentShip);
-        // refresh sparks occasionally
-        if (currentTankId != null) { updateSparks(currentShip.id, currentTankId); }
-      }
-    } catch (e) {
-      console.warn('Ship poll failed', e);
-    }
-  }, 2000);
+  window.__shipPoll = setInterval(() => {
+    if (currentTankId != null) { updateSparks(currentShip.id, currentTankId); }
+  }, 15000);
+
+  // status, personnel and tanks can be edited elsewhere: re-read the ship on a
+  // slow timer (no-cache + ETag, so an unchanged list is a 304 revalidation)
+  window.__shipMetaPoll && clearInterval(window.__shipMetaPoll);
+  window.__shipMetaPoll = setInterval(refreshCurrentShip, 30000);
 
   window.addEventListener('beforeunload', () => {
+    window.__shipStream && window.__shipStream.close();
     window.__shipPoll && clearInterval(window.__shipPoll);
+    window.__shipMetaPoll && clearInterval(window.__shipMetaPoll);
   });
 
   setupShipPageEventListeners(currentShip);
 }
 
+async function refreshCurrentShip() {
+  try {
+    const res = await fetch(`${API_BASE_URL}/api/ships`);
+    if (!res.ok) return;
+    const updated = (await res.json()).find(s => s.id === currentShip.id);
+    if (!updated) return;
+    // live KPIs come from SSE and are newer than the list's overlay
+    const { live_o2, live_co, live_lel, live_h2s } = currentShip;
+    const tanksChanged = JSON.stringify(updated.tanks) !== JSON.stringify(currentShip.tanks);
+    Object.assign(currentShip, updated, { live_o2, live_co, live_lel, live_h2s });
+
+    $('#shipTitle') && ($('#shipTitle').textContent = `Ship: ${currentShip.name}`);
+    $('#totPersonnel') && ($('#totPersonnel').textContent = currentShip.personnel);
+    if (tanksChanged) {
+      renderTankNav(currentShip);
+      const activeBtn = $(`.tankbtn[data-tank-id="${currentTankId}"]`);
+      activeBtn && activeBtn.classList.add('active');
+    }
+    renderShipKPIsWithThresholds(currentShip);
+  } catch (e) {
+    console.warn('Ship refresh failed', e);
+  }
+}
+
 function renderTankNav(ship) {
   const nav = $('#tankNav');
   if (!nav) return;
@@ -1382,8 +1417,9 @@ window.onclick = function(event) {
 };
 
 /* ========== Sparklines (ship KPIs) ========== */
-async function fetchTankSeries(shipId, tankId, minutes=60){
-  const url = `${API_BASE_URL}/api/ships/${shipId}/tanks/${tankId}/readings?minutes=${minutes}`;
+// sparklines are ~160px wide: let the server reduce the series (LTTB) to fit
+async function fetchTankSeries(shipId, tankId, minutes=60, maxPoints=160){
+  const url = `${API_BASE_URL}/api/ships/${shipId}/tanks/${tankId}/readings?minutes=${minutes}&max_points=${maxPoints}&method=lttb`;
   const res = await fetch(url);
   return await res.json();
 }